@@ -69,6 +69,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -167,4 +168,86 @@ CORS_ALLOW_ALL_ORIGINS = True  # Jangan gunakan di production
 # Tambahkan setting untuk static files
 STATICFILES_DIRS = [
     BASE_DIR / 'templates/static'
-]
\ No newline at end of file
+]
+
+# Output export Parquet (python manage.py export_parquet / /api/export/parquet/)
+PARQUET_EXPORT_ROOT = BASE_DIR / 'exports'
+
+
+# Throttling ingest telemetry (lihat machines/throttling.py). record_sale tidak dibatasi.
+INGEST_THROTTLE = {
+    'MACHINE_RATE': 1.0,   # pembacaan/detik per mesin (batch dihitung per isi)
+    'MACHINE_BURST': 30,
+    'FLEET_RATE': 500.0,   # pembacaan/detik seluruh fleet per proses
+    'FLEET_BURST': 1000,
+    'MAX_BUCKETS': 10000,  # bucket per mesin yang disimpan (LRU)
+}
+
+
+# Evaluasi alert saat ingest (lihat machines/alerts.py)
+ALERT_ENGINE = {
+    'RELOAD_INTERVAL': 30,  # detik; perubahan rule dari worker lain terbaca paling lambat segini
+}
+
+# Cache machine_id -> pk untuk ingest (lihat machines/machine_cache.py)
+MACHINE_ID_CACHE = {
+    'MAX_SIZE': 10000,
+    'LOCAL_TIMEOUT': 30,   # hanya dipakai kalau SHARED_CACHE None
+    'SHARED_CACHE': 'machine_ids',  # wajib diisi kalau ada lebih dari satu worker
+    'TIMEOUT': 3600,
+}
+
+
+# Cache. machine_ids dipakai bersama semua worker di host ini (file), jadi
+# rename mesin di satu worker langsung terlihat di worker lain. Ganti ke
+# Redis/Memcached kalau backend jalan di lebih dari satu host. machine_cards
+# hanya menyimpan fragment HTML yang dicek ulang tiap render, dan hanya
+# ditulis saat halaman daftar mesin di-render.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'machine_ids': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'machine_ids',
+        'OPTIONS': {'MAX_ENTRIES': 30000},  # 2 entry per mesin
+    },
+    'machine_cards': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'machine_cards',
+        'OPTIONS': {'MAX_ENTRIES': 10000},  # 1 entry per mesin
+    },
+}
+
+# Fragment HTML kartu mesin (lihat machines/cards.py)
+MACHINE_CARD_CACHE = {
+    'CACHE': 'machine_cards',
+    'TIMEOUT': 24 * 3600,
+}
+
+
+# Channels: fan-out alert ke dashboard (ws/alerts/). Ganti ke channels_redis
+# kalau backend jalan dengan lebih dari satu proses.
+ASGI_APPLICATION = 'config.asgi.application'
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+
+
+# Static files disajikan WhiteNoise: nama ber-hash (cache 1 tahun, immutable)
+# plus varian .gz/.br yang dibuat saat collectstatic.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'machines.storage.DashboardStaticFilesStorage',
+    },
+}
+# Tailwind standalone CLI v3 untuk build_assets (bisa juga 'npx tailwindcss@3')
+TAILWIND_CLI = 'tailwindcss'
+# esbuild untuk minify JS dashboard di build_assets (bisa juga 'npx esbuild')
+ESBUILD_CLI = 'esbuild'
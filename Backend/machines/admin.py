@@ -6,18 +6,103 @@ from .models import VendingMachine, WaterQuality, SalesRecord
 
 # Tambahkan di admin.py
 from django.contrib import admin
-from .models import VendingMachine, WaterQuality, SalesRecord
+from django.forms.models import BaseInlineFormSet
+from .models import VendingMachine, WaterQuality, SalesRecord, AlertRule, Alert, RefillForecast, StatusInterval
+from .paginator import EstimatedCountPaginator
+
+class RecentReadingsFormSet(BaseInlineFormSet):
+    """Hanya satu halaman pembacaan terbaru, bukan seluruh history mesin."""
+    page_size = 20
+    page = 1
+
+    def get_queryset(self):
+        if not hasattr(self, '_page_queryset'):
+            offset = (self.page - 1) * self.page_size
+            # Ambil satu row lebih untuk tahu ada halaman berikutnya atau tidak
+            rows = list(super().get_queryset()[offset:offset + self.page_size + 1])
+            self.has_next_page = len(rows) > self.page_size
+            self._page_queryset = rows[:self.page_size]
+        return self._page_queryset
+
 
 class WaterQualityInline(admin.TabularInline):
     model = WaterQuality
-    extra = 1
+    formset = RecentReadingsFormSet
+    template = 'admin/machines/recent_readings_tabular.html'
+    fields = ['timestamp', 'tds_level', 'ph_level', 'water_level']
+    readonly_fields = fields
+    ordering = ['-timestamp']
+    extra = 0
+    can_delete = False
+    verbose_name_plural = 'Recent water quality readings'
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        try:
+            formset.page = max(1, int(request.GET.get('readings_page', 1)))
+        except ValueError:
+            formset.page = 1
+        return formset
 
 class VendingMachineAdmin(admin.ModelAdmin):
     inlines = [WaterQualityInline]
-    list_display = ['name', 'machine_id', 'status', 'location']
+    list_display = ['name', 'machine_id', 'status', 'location', 'latitude', 'longitude']
+    search_fields = ['name', 'machine_id', 'location']
 
     
 
 admin.site.register(VendingMachine, VendingMachineAdmin)
-admin.site.register(WaterQuality)
-admin.site.register(SalesRecord)
\ No newline at end of file
+
+
+class TelemetryAdmin(admin.ModelAdmin):
+    """Admin untuk tabel telemetry besar: tanpa COUNT(*) penuh, tanpa dropdown semua mesin."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ['machine']
+    raw_id_fields = ['machine']
+    date_hierarchy = 'timestamp'
+
+
+class WaterQualityAdmin(TelemetryAdmin):
+    list_display = ['machine', 'tds_level', 'ph_level', 'water_level', 'timestamp']
+
+
+class SalesRecordAdmin(TelemetryAdmin):
+    list_display = ['machine', 'volume', 'price', 'timestamp']
+
+
+class StatusIntervalAdmin(TelemetryAdmin):
+    list_display = ['machine', 'status', 'start']
+    list_filter = ['status']
+    date_hierarchy = 'start'
+
+
+admin.site.register(WaterQuality, WaterQualityAdmin)
+admin.site.register(SalesRecord, SalesRecordAdmin)
+admin.site.register(StatusInterval, StatusIntervalAdmin)
+
+
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ['name', 'machine', 'metric', 'operator', 'threshold', 'duration', 'enabled']
+    list_filter = ['metric', 'enabled']
+
+
+class AlertAdmin(admin.ModelAdmin):
+    list_display = ['rule', 'machine', 'value', 'triggered_at', 'resolved_at']
+    list_select_related = ['rule', 'machine']
+
+
+admin.site.register(AlertRule, AlertRuleAdmin)
+admin.site.register(Alert, AlertAdmin)
+
+
+class RefillForecastAdmin(admin.ModelAdmin):
+    list_display = ['machine', 'water_level', 'rate', 'source', 'empty_at', 'updated_at']
+    list_filter = ['source']
+    list_select_related = ['machine']
+
+
+admin.site.register(RefillForecast, RefillForecastAdmin)
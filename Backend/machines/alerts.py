@@ -0,0 +1,198 @@
+"""
+Evaluasi AlertRule secara incremental saat ingest.
+
+Rule di-index per (machine pk, metric) di memori; rule tanpa mesin di-index
+dengan machine pk None. Setiap pembacaan hanya mengecek rule yang cocok dan
+memperbarui state debounce per (rule, mesin), tanpa pernah membaca ulang
+history WaterQuality. Index dibangun ulang saat AlertRule berubah di proses
+ini (signals.py) dan paling lama tiap RELOAD_INTERVAL detik, supaya
+perubahan rule dari worker lain juga terbaca.
+
+Alert baru dibuat dan alert selesai ditutup setelah transaksi ingest
+di-commit (on_commit). Kalau transaksi di-rollback, state di memori tidak
+ikut berubah sehingga alert terpicu lagi di pembacaan berikutnya. Unique
+constraint untuk alert aktif per (rule, mesin) mencegah alert dobel dari
+request paralel.
+
+State debounce ada di memori proses, jadi pembacaan satu mesin sebaiknya
+masuk ke worker yang sama agar durasi dihitung utuh.
+"""
+import operator
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import Alert, AlertRule
+
+
+ALERTS_GROUP = 'alerts'
+
+DEFAULT_ALERT_ENGINE = {
+    # Detik maksimum sebelum index rule dibaca ulang dari database
+    'RELOAD_INTERVAL': 30,
+}
+
+OPERATORS = {
+    'lt': operator.lt,
+    'lte': operator.le,
+    'gt': operator.gt,
+    'gte': operator.ge,
+}
+
+
+def engine_setting(name):
+    return getattr(settings, 'ALERT_ENGINE', {}).get(name, DEFAULT_ALERT_ENGINE[name])
+
+
+class RuleState:
+    __slots__ = ('breach_since', 'alert_pk')
+
+    def __init__(self):
+        self.breach_since = None
+        self.alert_pk = None
+
+
+class AlertEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # State debounce diubah dari banyak thread request sekaligus
+        self._state_lock = threading.Lock()
+        self._index = None
+        self._loaded_at = None
+        self._states = defaultdict(RuleState)
+        self._last_seen = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def _load_index(self):
+        index = defaultdict(list)
+        for rule in AlertRule.objects.filter(enabled=True):
+            index[(rule.machine_id, rule.metric)].append(
+                (rule.pk, OPERATORS[rule.operator], rule.threshold, rule.duration)
+            )
+        # Alert yang masih aktif dipulihkan supaya tidak terpicu dua kali setelah restart
+        active = Alert.objects.filter(resolved_at__isnull=True).values_list('pk', 'rule_id', 'machine_id')
+        with self._state_lock:
+            for alert_pk, rule_pk, machine_pk in active:
+                self._states[(rule_pk, machine_pk)].alert_pk = alert_pk
+        return dict(index)
+
+    def _rules(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._index is None or now - self._loaded_at >= engine_setting('RELOAD_INTERVAL'):
+                self._index = self._load_index()
+                self._loaded_at = now
+            return self._index
+
+    def evaluate(self, machine_pk, readings):
+        """
+        readings: list (dict metric -> nilai, timestamp), urut timestamp.
+        Return list keputusan (trigger/resolve) yang akan dijalankan setelah commit.
+        """
+        index = self._rules()
+        actions = []
+        with self._state_lock:
+            # Alert yang dipicu di batch ini belum punya pk sampai commit
+            pending = set()
+            for reading, timestamp in readings:
+                # Data terlambat (lebih tua dari pembacaan terakhir) tidak mengubah state debounce
+                last_seen = self._last_seen.get(machine_pk)
+                if last_seen is not None and timestamp < last_seen:
+                    continue
+                self._last_seen[machine_pk] = timestamp
+
+                for metric, value in reading.items():
+                    rules = index.get((machine_pk, metric), []) + index.get((None, metric), [])
+                    for rule_pk, compare, threshold, duration in rules:
+                        key = (rule_pk, machine_pk)
+                        state = self._states[key]
+                        active = state.alert_pk is not None or key in pending
+                        if compare(value, threshold):
+                            if state.breach_since is None:
+                                state.breach_since = timestamp
+                            if (not active
+                                    and (timestamp - state.breach_since).total_seconds() >= duration):
+                                pending.add(key)
+                                actions.append(('triggered', rule_pk, machine_pk, metric, value, timestamp))
+                        else:
+                            state.breach_since = None
+                            if active:
+                                pending.discard(key)
+                                actions.append(('resolved', rule_pk, machine_pk, metric, value, timestamp))
+        if actions:
+            transaction.on_commit(lambda: self._apply(actions), robust=True)
+        return actions
+
+    def _apply(self, actions):
+        """Tulis alert ke database lalu perbarui state; dijalankan setelah commit."""
+        events = []
+        for kind, rule_pk, machine_pk, metric, value, timestamp in actions:
+            active = Alert.objects.filter(rule_id=rule_pk, machine_id=machine_pk, resolved_at__isnull=True)
+            if kind == 'triggered':
+                try:
+                    with transaction.atomic():
+                        alert_pk = Alert.objects.create(
+                            rule_id=rule_pk, machine_id=machine_pk,
+                            value=value, triggered_at=timestamp,
+                        ).pk
+                    events.append(_event(kind, alert_pk, rule_pk, machine_pk, metric, value, timestamp))
+                except IntegrityError:
+                    # Sudah dipicu request paralel, atau rule/mesin sudah dihapus
+                    alert_pk = active.values_list('pk', flat=True).first()
+            else:
+                alert_pk = active.values_list('pk', flat=True).first()
+                if alert_pk is not None and Alert.objects.filter(
+                        pk=alert_pk, resolved_at__isnull=True).update(resolved_at=timestamp):
+                    events.append(_event(kind, alert_pk, rule_pk, machine_pk, metric, value, timestamp))
+                alert_pk = None
+
+            with self._state_lock:
+                self._states[(rule_pk, machine_pk)].alert_pk = alert_pk
+        broadcast(events)
+
+
+def _event(kind, alert_pk, rule_pk, machine_pk, metric, value, timestamp):
+    return {
+        'event': kind,
+        'alert': alert_pk,
+        'rule': rule_pk,
+        'machine': machine_pk,
+        'metric': metric,
+        'value': value,
+        'timestamp': timestamp.isoformat(),
+    }
+
+
+def broadcast(events):
+    """Kirim event alert ke dashboard yang terhubung lewat WebSocket."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for event in events:
+        async_to_sync(channel_layer.group_send)(ALERTS_GROUP, {'type': 'alert.event', 'event': event})
+
+
+engine = AlertEngine()
+
+
+def evaluate_readings(machine_pk, qualities):
+    """Dipanggil setelah WaterQuality disimpan, dengan pembacaan urut timestamp."""
+    return engine.evaluate(machine_pk, [
+        (
+            {
+                'tds_level': quality.tds_level,
+                'ph_level': quality.ph_level,
+                'water_level': quality.water_level,
+            },
+            quality.timestamp,
+        )
+        for quality in qualities
+    ])
@@ -0,0 +1,92 @@
+"""
+Cache fragment HTML kartu mesin di machine_list.html.
+
+Fragment disimpan di machines:card:<pk> bersama tanda tangan isinya: semua
+field yang tampil di kartu (nama, lokasi, status, dan nilai pembacaan
+terbaru). Saat halaman di-render, tanda tangan dihitung ulang dari data yang
+memang sudah diambil untuk halaman itu; kartu hanya di-render ulang kalau
+ada field yang tampil berubah. Tidak ada versi yang harus di-bump saat
+ingest, jadi jalur ingest tidak pernah menulis ke cache ini, dan cache per
+proses pun tidak pernah menyajikan kartu basi.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import OuterRef, Subquery
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import WaterQuality
+
+
+CARD_TEMPLATE = 'machines/_machine_card.html'
+FRAGMENT_KEY = 'machines:card:{}'
+FRAGMENT_TIMEOUT = 24 * 3600
+
+DEFAULT_MACHINE_CARD_CACHE = {
+    'CACHE': 'default',
+    'TIMEOUT': FRAGMENT_TIMEOUT,
+}
+QUALITY_FIELDS = ('tds_level', 'ph_level', 'water_level')
+
+
+def card_cache_setting(name):
+    return getattr(settings, 'MACHINE_CARD_CACHE', {}).get(name, DEFAULT_MACHINE_CARD_CACHE[name])
+
+
+def _card_cache():
+    return caches[card_cache_setting('CACHE')]
+
+
+def card_signature(machine):
+    """Semua nilai yang tampil di kartu; kartu di-render ulang kalau ini berubah."""
+    quality = machine.latest_quality
+    return (
+        machine.name, machine.location, machine.status,
+        tuple(getattr(quality, field) for field in QUALITY_FIELDS) if quality is not None else None,
+    )
+
+
+def attach_latest_quality(machines):
+    """Isi machine.latest_quality untuk banyak mesin dengan satu query."""
+    if not machines:
+        return
+    latest_ids = (
+        WaterQuality.objects
+        .filter(machine=OuterRef('pk'))
+        .order_by('-timestamp')
+        .values('id')[:1]
+    )
+    machine_model = type(machines[0])
+    ids = dict(
+        machine_model.objects
+        .filter(pk__in=[machine.pk for machine in machines])
+        .annotate(latest_id=Subquery(latest_ids))
+        .values_list('pk', 'latest_id')
+    )
+    qualities = WaterQuality.objects.in_bulk([pk for pk in ids.values() if pk])
+    for machine in machines:
+        machine.latest_quality = qualities.get(ids.get(machine.pk))
+
+
+def render_cards(machines):
+    """HTML semua kartu untuk daftar mesin, hanya me-render kartu yang berubah."""
+    machines = list(machines)
+    attach_latest_quality(machines)
+    cache = _card_cache()
+    cached = cache.get_many([FRAGMENT_KEY.format(machine.pk) for machine in machines])
+
+    fragments = {}
+    new_entries = {}
+    for machine in machines:
+        signature = card_signature(machine)
+        entry = cached.get(FRAGMENT_KEY.format(machine.pk))
+        if entry is not None and entry[0] == signature:
+            fragments[machine.pk] = entry[1]
+            continue
+        html = render_to_string(CARD_TEMPLATE, {'machine': machine})
+        fragments[machine.pk] = html
+        new_entries[FRAGMENT_KEY.format(machine.pk)] = (signature, html)
+    if new_entries:
+        cache.set_many(new_entries, card_cache_setting('TIMEOUT'))
+
+    return mark_safe(''.join(fragments[machine.pk] for machine in machines))
@@ -0,0 +1,217 @@
+"""
+Cold storage untuk telemetry WaterQuality.
+
+Pembacaan yang sudah lama dikemas per (mesin, jam) ke WaterQualityBlock:
+
+    header  : struct '<Iq'  -> jumlah pembacaan, timestamp pertama (ms epoch)
+    body    : int32[count-1] delta-of-delta timestamp (ms)
+              int32[count]   delta nilai tds   (x10,  presisi 0.1 ppm)
+              int32[count]   delta nilai ph    (x100, presisi 0.01)
+              int32[count]   delta water level (x10,  presisi 0.1 %)
+
+Semuanya dikompres zlib. Interval sampling yang konstan membuat
+delta-of-delta hampir selalu nol sehingga sangat kecil setelah dikompres.
+
+Blok tidak menyimpan seq, jadi setelah dikemas pembacaan tidak lagi ikut
+unique constraint (machine, seq). Upload ulang untuk jam yang sudah dikemas
+dicek lewat timestamp device (presisi ms) dengan packed_timestamps().
+"""
+import heapq
+import struct
+import zlib
+from datetime import timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .models import WaterQuality, WaterQualityBlock
+
+
+HEADER = struct.Struct('<Iq')
+# Skala kuantisasi untuk tds_level, ph_level, water_level
+SCALES = np.array([10.0, 100.0, 10.0])
+BLOCK_SPAN = timedelta(hours=1)
+
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def encode_block(timestamps_ms, values):
+    """
+    timestamps_ms: int64 array (terurut), values: float array bentuk (n, 3).
+    """
+    timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+    count = len(timestamps_ms)
+    deltas = np.diff(timestamps_ms)
+    dods = np.diff(deltas, prepend=0).astype('<i4')
+
+    quantized = np.rint(np.asarray(values, dtype=np.float64) * SCALES).astype(np.int64)
+    value_deltas = np.diff(quantized, axis=0, prepend=0).astype('<i4')
+
+    payload = (
+        HEADER.pack(count, int(timestamps_ms[0]))
+        + dods.tobytes()
+        + value_deltas.T.tobytes()
+    )
+    return zlib.compress(payload, 6)
+
+
+def decode_block(data):
+    """Kebalikan encode_block -> (timestamps_ms int64[n], values float64[n, 3])."""
+    payload = zlib.decompress(bytes(data))
+    count, first_ms = HEADER.unpack_from(payload)
+    offset = HEADER.size
+
+    dods = np.frombuffer(payload, dtype='<i4', count=count - 1, offset=offset)
+    offset += dods.nbytes
+    value_deltas = np.frombuffer(payload, dtype='<i4', count=count * 3, offset=offset)
+
+    timestamps_ms = np.empty(count, dtype=np.int64)
+    timestamps_ms[0] = first_ms
+    timestamps_ms[1:] = first_ms + np.cumsum(np.cumsum(dods, dtype=np.int64))
+
+    quantized = np.cumsum(value_deltas.reshape(3, count).astype(np.int64), axis=1)
+    values = (quantized / SCALES[:, None]).T
+    return timestamps_ms, values
+
+
+def to_datetimes(timestamps_ms):
+    return [
+        value.replace(tzinfo=dt_timezone.utc)
+        for value in timestamps_ms.astype('datetime64[ms]').tolist()
+    ]
+
+
+def iter_cold_series(machine_pks, start_date, end_date):
+    """
+    Pembacaan dari blok cold storage dalam range, diurutkan (machine pk, timestamp).
+    Menghasilkan tuple (machine_pk, timestamp, tds, ph, water_level).
+    machine_pks None = semua mesin.
+    """
+    blocks = WaterQualityBlock.objects.filter(start__lte=end_date, end__gte=start_date)
+    if machine_pks is not None:
+        blocks = blocks.filter(machine_id__in=machine_pks)
+    blocks = (
+        blocks
+        .order_by('machine_id', 'start')
+        .values_list('machine_id', 'data')
+        .iterator(chunk_size=100)
+    )
+    start_ms = int(start_date.timestamp() * 1000)
+    end_ms = int(end_date.timestamp() * 1000)
+
+    for machine_pk, data in blocks:
+        timestamps_ms, values = decode_block(data)
+        mask = (timestamps_ms >= start_ms) & (timestamps_ms <= end_ms)
+        timestamps = to_datetimes(timestamps_ms[mask])
+        for timestamp, (tds, ph, water_level) in zip(timestamps, values[mask].tolist()):
+            yield machine_pk, timestamp, tds, ph, water_level
+
+
+def merge_with_cold(hot_rows, machine_pks, start_date, end_date):
+    """
+    Gabungkan rows hot (machine_pk, timestamp, ...) yang sudah terurut dengan
+    data cold storage. Karena rows yang sudah dikemas dihapus dari tabel hot,
+    tidak ada duplikat.
+    """
+    cold_rows = iter_cold_series(machine_pks, start_date, end_date)
+    return heapq.merge(cold_rows, hot_rows, key=lambda row: (row[0], row[1]))
+
+
+def load_history(machine, start_date, end_date):
+    """History satu mesin (hot + cold) sebagai list dict, urut timestamp."""
+    hot_rows = (
+        machine.water_qualities
+        .filter(timestamp__range=(start_date, end_date))
+        .order_by('timestamp')
+        .values_list('machine_id', 'timestamp', 'tds_level', 'ph_level', 'water_level', 'id')
+    )
+    rows = merge_with_cold(hot_rows, [machine.pk], start_date, end_date)
+    return [
+        {
+            'id': row[5] if len(row) > 5 else None,
+            'tds_level': row[2],
+            'ph_level': row[3],
+            'water_level': row[4],
+            'timestamp': row[1],
+        }
+        for row in rows
+    ]
+
+
+def packed_timestamps(machine_pk, timestamps, now=None):
+    """
+    Subset timestamps yang sudah ada di blok cold storage mesin. Jam berjalan
+    tidak pernah dikemas, jadi data live tidak memicu query sama sekali.
+    """
+    current_hour = floor_hour(now or timezone.now())
+    old = [timestamp for timestamp in timestamps if timestamp < current_hour]
+    if not old:
+        return set()
+
+    blocks = (
+        WaterQualityBlock.objects
+        .filter(machine_id=machine_pk, start__in={floor_hour(timestamp) for timestamp in old})
+        .values_list('data', flat=True)
+    )
+    packed_ms = set()
+    for data in blocks:
+        timestamps_ms, _ = decode_block(data)
+        packed_ms.update(timestamps_ms.tolist())
+    return {timestamp for timestamp in old if int(timestamp.timestamp() * 1000) in packed_ms}
+
+
+def pack_machine(machine_pk, cutoff):
+    """
+    Kemas semua pembacaan mesin sebelum cutoff (dibulatkan ke jam) ke blok.
+    Blok yang sudah ada untuk jam yang sama digabung (data terlambat).
+    Return jumlah pembacaan yang dikemas.
+    """
+    cutoff = floor_hour(cutoff)
+    readings = WaterQuality.objects.filter(machine_id=machine_pk, timestamp__lt=cutoff)
+
+    packed = 0
+    # Per jam: baca dulu sampai habis, baru hapus. Menghapus dari tabel yang
+    # masih dibaca cursor .iterator() tidak aman di SQLite.
+    first = readings.order_by('timestamp').values_list('timestamp', flat=True).first()
+    while first is not None:
+        hour = floor_hour(first)
+        group = list(
+            readings
+            .filter(timestamp__gte=hour, timestamp__lt=hour + BLOCK_SPAN)
+            .order_by('timestamp')
+            .values_list('id', 'timestamp', 'tds_level', 'ph_level', 'water_level')
+        )
+        timestamps_ms = np.array([int(row[1].timestamp() * 1000) for row in group], dtype=np.int64)
+        values = np.array([row[2:] for row in group], dtype=np.float64)
+
+        with transaction.atomic():
+            block = (
+                WaterQualityBlock.objects.select_for_update()
+                .filter(machine_id=machine_pk, start=hour)
+                .first()
+            )
+            if block is not None:
+                old_timestamps, old_values = decode_block(block.data)
+                timestamps_ms = np.concatenate([old_timestamps, timestamps_ms])
+                values = np.concatenate([old_values, values])
+                order = np.argsort(timestamps_ms, kind='stable')
+                timestamps_ms, values = timestamps_ms[order], values[order]
+            else:
+                block = WaterQualityBlock(machine_id=machine_pk, start=hour)
+
+            block.end = to_datetimes(timestamps_ms[-1:])[0]
+            block.count = len(timestamps_ms)
+            block.data = encode_block(timestamps_ms, values)
+            block.save()
+
+            WaterQuality.objects.filter(id__in=[row[0] for row in group]).delete()
+        packed += len(group)
+
+        first = (
+            readings.filter(timestamp__gte=hour + BLOCK_SPAN)
+            .order_by('timestamp').values_list('timestamp', flat=True).first()
+        )
+    return packed
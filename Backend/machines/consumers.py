@@ -0,0 +1,17 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .alerts import ALERTS_GROUP
+
+
+class AlertConsumer(AsyncJsonWebsocketConsumer):
+    """Dashboard subscribe ke ws/alerts/ untuk menerima alert secara real-time."""
+
+    async def connect(self):
+        await self.channel_layer.group_add(ALERTS_GROUP, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(ALERTS_GROUP, self.channel_name)
+
+    async def alert_event(self, message):
+        await self.send_json(message['event'])
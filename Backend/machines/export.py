@@ -0,0 +1,260 @@
+"""
+Export WaterQuality dan SalesRecord ke Parquet, dipartisi per bulan dan per mesin:
+
+    <PARQUET_EXPORT_ROOT>/<dataset>/month=YYYY-MM/machine_id=<id>/data.parquet
+
+Setiap partisi ditulis streaming per batch (memori tetap kecil) dan dicatat
+di _manifest.json bersama fingerprint isinya. Export berikutnya melewati
+partisi yang fingerprint-nya tidak berubah.
+
+Fingerprint = jumlah row, max id dan rentang timestamp, plus checksum berupa
+SUM(id) dan SUM tiap kolom nilai. Delete+insert (id baru) dan edit nilai di
+tempat ikut mengubahnya. Yang tidak terdeteksi hanya edit timestamp baris di
+tengah bulan tanpa perubahan lain; hapus file partisinya untuk memaksa export
+ulang.
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+
+from .coldstorage import merge_with_cold
+from .models import SalesRecord, VendingMachine, WaterQuality, WaterQualityBlock
+
+
+BATCH_SIZE = 50000
+MANIFEST_NAME = '_manifest.json'
+
+WATER_QUALITY_SCHEMA = pa.schema([
+    ('machine_id', pa.string()),
+    ('timestamp', pa.timestamp('us', tz='UTC')),
+    ('tds_level', pa.float64()),
+    ('ph_level', pa.float64()),
+    ('water_level', pa.float64()),
+])
+
+SALES_SCHEMA = pa.schema([
+    ('machine_id', pa.string()),
+    ('timestamp', pa.timestamp('us', tz='UTC')),
+    ('volume', pa.int32()),
+    ('price', pa.decimal128(10, 2)),
+])
+
+
+def export_root():
+    return getattr(settings, 'PARQUET_EXPORT_ROOT', settings.BASE_DIR / 'exports')
+
+
+def month_key(value):
+    return value.strftime('%Y-%m')
+
+
+def month_bounds(month):
+    """'2025-01' -> (datetime awal bulan, datetime awal bulan berikutnya) dalam UTC."""
+    start = datetime.strptime(month, '%Y-%m').replace(tzinfo=dt_timezone.utc)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def partition_path(dataset, machine_id, month):
+    return os.path.join(export_root(), dataset, f'month={month}', f'machine_id={machine_id}', 'data.parquet')
+
+
+# ----------------------------------------------------------------------------
+# Fingerprint per partisi (satu query grouped per sumber data)
+# ----------------------------------------------------------------------------
+
+def _water_quality_fingerprints(machine_ids=None):
+    hot = WaterQuality.objects.all()
+    cold = WaterQualityBlock.objects.all()
+    if machine_ids:
+        hot = hot.filter(machine__machine_id__in=machine_ids)
+        cold = cold.filter(machine__machine_id__in=machine_ids)
+
+    fingerprints = {}
+    for row in (hot.annotate(month=TruncMonth('timestamp'))
+                .values('machine__machine_id', 'month')
+                .annotate(rows=Count('id'), last_id=Max('id'), first=Min('timestamp'), last=Max('timestamp'),
+                          id_sum=Sum('id'), tds=Sum('tds_level'), ph=Sum('ph_level'), water=Sum('water_level'))
+                .order_by()):
+        key = (row['machine__machine_id'], month_key(row['month']))
+        fingerprints[key] = (
+            f"hot:{row['rows']}:{row['last_id']}:{row['first'].isoformat()}:{row['last'].isoformat()}"
+            f":{row['id_sum']}:{row['tds']!r}:{row['ph']!r}:{row['water']!r}"
+        )
+
+    # Isi blok tidak diedit di tempat: data terlambat digabung dan mengubah count/end
+    for row in (cold.annotate(month=TruncMonth('start'))
+                .values('machine__machine_id', 'month')
+                .annotate(rows=Sum('count'), blocks=Count('id'), id_sum=Sum('id'), last=Max('end'))
+                .order_by()):
+        key = (row['machine__machine_id'], month_key(row['month']))
+        cold_part = f"cold:{row['rows']}:{row['blocks']}:{row['id_sum']}:{row['last'].isoformat()}"
+        fingerprints[key] = fingerprints.get(key, 'hot:0') + '|' + cold_part
+    return fingerprints
+
+
+def _sales_fingerprints(machine_ids=None):
+    sales = SalesRecord.objects.all()
+    if machine_ids:
+        sales = sales.filter(machine__machine_id__in=machine_ids)
+
+    return {
+        (row['machine__machine_id'], month_key(row['month'])):
+            f"{row['rows']}:{row['last_id']}:{row['first'].isoformat()}:{row['last'].isoformat()}"
+            f":{row['id_sum']}:{row['volume']}:{row['price']}"
+        for row in (sales.annotate(month=TruncMonth('timestamp'))
+                    .values('machine__machine_id', 'month')
+                    .annotate(rows=Count('id'), last_id=Max('id'), first=Min('timestamp'), last=Max('timestamp'),
+                              id_sum=Sum('id'), volume=Sum('volume'), price=Sum('price'))
+                    .order_by())
+    }
+
+
+# ----------------------------------------------------------------------------
+# Sumber rows per partisi
+# ----------------------------------------------------------------------------
+
+def _water_quality_rows(machine, start, end):
+    hot_rows = (
+        WaterQuality.objects
+        .filter(machine=machine, timestamp__gte=start, timestamp__lt=end)
+        .order_by('timestamp')
+        .values_list('machine_id', 'timestamp', 'tds_level', 'ph_level', 'water_level')
+        .iterator(chunk_size=2000)
+    )
+    for row in merge_with_cold(hot_rows, [machine.pk], start, end):
+        # Range cold storage inklusif di kedua ujung, partisi bulan tidak
+        if row[1] < end:
+            yield (machine.machine_id, *row[1:5])
+
+
+def _sales_rows(machine, start, end):
+    rows = (
+        SalesRecord.objects
+        .filter(machine=machine, timestamp__gte=start, timestamp__lt=end)
+        .order_by('timestamp')
+        .values_list('timestamp', 'volume', 'price')
+        .iterator(chunk_size=2000)
+    )
+    for timestamp, volume, price in rows:
+        yield machine.machine_id, timestamp, volume, price
+
+
+DATASETS = {
+    'water_quality': (WATER_QUALITY_SCHEMA, _water_quality_fingerprints, _water_quality_rows),
+    'sales': (SALES_SCHEMA, _sales_fingerprints, _sales_rows),
+}
+
+
+# ----------------------------------------------------------------------------
+# Writer
+# ----------------------------------------------------------------------------
+
+def _record_batch(schema, rows):
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+
+def write_partition(dataset, machine, month):
+    """Tulis satu partisi secara streaming. Return jumlah row yang ditulis."""
+    schema, _, row_source = DATASETS[dataset]
+    start, end = month_bounds(month)
+    path = partition_path(dataset, machine.machine_id, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Tulis ke file sementara lalu rename, supaya pembaca tidak pernah
+    # melihat file setengah jadi
+    tmp_path = path + '.tmp'
+    total = 0
+    with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+        batch = []
+        for row in row_source(machine, start, end):
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                writer.write_batch(_record_batch(schema, batch))
+                total += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(_record_batch(schema, batch))
+            total += len(batch)
+    os.replace(tmp_path, path)
+    return total
+
+
+def load_manifest():
+    try:
+        with open(os.path.join(export_root(), MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest):
+    os.makedirs(export_root(), exist_ok=True)
+    path = os.path.join(export_root(), MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def manifest_key(dataset, machine_id, month):
+    return f'{dataset}/month={month}/machine_id={machine_id}'
+
+
+def _string_list(name, value):
+    """None atau list string. String tunggal ditolak supaya tidak diiterasi per karakter."""
+    if value is None:
+        return None
+    if not isinstance(value, (list, tuple)) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"{name} must be a list of strings")
+    return list(value)
+
+
+def export(datasets=None, machine_ids=None, months=None):
+    """
+    Export semua partisi yang berubah sejak export terakhir.
+    Return dict {'written': [...], 'skipped': [...]} berisi key manifest.
+    ValueError kalau salah satu filter bukan list string.
+    """
+    datasets = _string_list('dataset', datasets)
+    machine_ids = _string_list('machine_ids', machine_ids)
+    months = _string_list('month', months)
+    manifest = load_manifest()
+    result = {'written': [], 'skipped': []}
+    machines = {}
+
+    for dataset in datasets or DATASETS:
+        _, fingerprint_source, _ = DATASETS[dataset]
+        for (machine_id, month), fingerprint in sorted(fingerprint_source(machine_ids).items()):
+            if months and month not in months:
+                continue
+
+            key = manifest_key(dataset, machine_id, month)
+            entry = manifest.get(key)
+            if (entry and entry['fingerprint'] == fingerprint
+                    and os.path.exists(partition_path(dataset, machine_id, month))):
+                result['skipped'].append(key)
+                continue
+
+            if machine_id not in machines:
+                machines[machine_id] = VendingMachine.objects.get(machine_id=machine_id)
+            rows = write_partition(dataset, machines[machine_id], month)
+            manifest[key] = {
+                'fingerprint': fingerprint,
+                'rows': rows,
+                'path': os.path.relpath(partition_path(dataset, machine_id, month), export_root()),
+            }
+            result['written'].append(key)
+            # Simpan tiap partisi supaya export yang terputus bisa dilanjutkan
+            save_manifest(manifest)
+
+    return result
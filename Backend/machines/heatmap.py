@@ -0,0 +1,125 @@
+"""
+Matriks mesin x jam untuk heatmap fleet.
+
+Nilai dihitung dengan query grouped (satu untuk sales, rollup + sisa jam
+sesudah watermark untuk TDS) lalu disusun ke array float32 [mesin, jam].
+Bagian TDS yang belum di-rollup dibaca lewat rollups.iter_readings, jadi
+pembacaan yang sudah dikemas ke cold storage tetap ikut.
+Sel tanpa data bernilai NaN (null di JSON).
+"""
+import base64
+import math
+from datetime import timedelta
+from itertools import groupby
+
+import numpy as np
+from django.db.models import Sum
+from django.db.models.functions import TruncHour
+
+from .coldstorage import floor_hour
+from .models import SalesRecord, VendingMachine, WaterQualityRollup
+from .rollups import HOUR, get_watermark, iter_readings
+
+
+HOUR_SECONDS = 3600
+MAX_CELLS = 2_000_000
+METRICS = ('sales_volume', 'tds_level')
+ENCODINGS = ('columnar', 'base64')
+
+
+def _sales_volume(machine_pks, start, end):
+    return (
+        SalesRecord.objects
+        .filter(machine_id__in=machine_pks, timestamp__gte=start, timestamp__lt=end)
+        .annotate(hour=TruncHour('timestamp'))
+        .values_list('machine_id', 'hour')
+        .annotate(value=Sum('volume'))
+        .order_by()
+    )
+
+
+def _tds_level(machine_pks, start, end):
+    # Jam yang sudah di-rollup tidak perlu menyentuh tabel WaterQuality
+    watermark = get_watermark() or start
+    split = min(max(watermark, start), end)
+    rollups = WaterQualityRollup.objects.filter(
+        machine_id__in=machine_pks, bucket__gte=start, bucket__lt=split)
+    rows = [
+        (machine_pk, bucket, tds_sum / count)
+        for machine_pk, bucket, tds_sum, count in rollups.filter(dirty=False).values_list(
+            'machine_id', 'bucket', 'tds_sum', 'count')
+    ]
+
+    # Jam sesudah watermark dan jam dirty (kena data terlambat) dari data mentah
+    if split < end:
+        rows.extend(_hourly_tds(iter_readings(machine_pks, split, end)))
+    for machine_pk, bucket in rollups.filter(dirty=True).values_list('machine_id', 'bucket'):
+        rows.extend(_hourly_tds(iter_readings([machine_pk], bucket, bucket + HOUR)))
+    return rows
+
+
+def _hourly_tds(readings):
+    """Rata-rata TDS per (mesin, jam) dari pembacaan yang urut (machine pk, timestamp)."""
+    for (machine_pk, bucket), group in groupby(readings, key=lambda row: (row[0], floor_hour(row[1]))):
+        values = [row[2] for row in group]
+        yield machine_pk, bucket, sum(values) / len(values)
+
+
+SOURCES = {
+    'sales_volume': _sales_volume,
+    'tds_level': _tds_level,
+}
+
+
+def build_heatmap(metric, start, end, machine_ids=None):
+    """
+    Return (machine_ids, start_hour, matrix float32[mesin, jam]).
+    Raise ValueError kalau matriks terlalu besar.
+    """
+    start = floor_hour(start)
+    end = floor_hour(end) + timedelta(hours=1)
+    hours = int((end - start).total_seconds()) // HOUR_SECONDS
+
+    machines = VendingMachine.objects.order_by('pk')
+    if machine_ids:
+        machines = machines.filter(machine_id__in=machine_ids)
+    machines = list(machines.values_list('pk', 'machine_id'))
+    if len(machines) * hours > MAX_CELLS:
+        raise ValueError(f"Heatmap too large ({len(machines)} x {hours}), maximum {MAX_CELLS} cells")
+
+    row_index = {pk: i for i, (pk, _) in enumerate(machines)}
+    matrix = np.full((len(machines), hours), np.nan, dtype=np.float32)
+
+    rows = SOURCES[metric]([pk for pk, _ in machines], start, end)
+    if rows:
+        machine_pks, buckets, values = zip(*rows)
+        start_epoch = start.timestamp()
+        row_positions = np.fromiter((row_index[pk] for pk in machine_pks), dtype=np.int64, count=len(rows))
+        col_positions = np.fromiter(
+            ((bucket.timestamp() - start_epoch) // HOUR_SECONDS for bucket in buckets),
+            dtype=np.int64, count=len(rows),
+        )
+        matrix[row_positions, col_positions] = np.asarray(values, dtype=np.float32)
+
+    return [machine_id for _, machine_id in machines], start, matrix
+
+
+def encode_heatmap(metric, machine_ids, start, matrix, encoding='columnar'):
+    result = {
+        'metric': metric,
+        'start': start.isoformat(),
+        'step_seconds': HOUR_SECONDS,
+        'shape': list(matrix.shape),
+        'machine_ids': machine_ids,
+    }
+    if encoding == 'base64':
+        # Row-major float32 little-endian, NaN = tidak ada data
+        result['dtype'] = '<f4'
+        result['data'] = base64.b64encode(matrix.astype('<f4').tobytes()).decode('ascii')
+    else:
+        # Dibulatkan supaya JSON tidak membawa ekor presisi float32
+        result['values'] = [
+            [None if math.isnan(value) else value for value in row]
+            for row in np.round(matrix.astype(np.float64), 3).tolist()
+        ]
+    return result
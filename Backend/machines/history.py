@@ -0,0 +1,163 @@
+import json
+from datetime import timedelta
+from itertools import groupby
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .coldstorage import merge_with_cold
+from .models import VendingMachine, WaterQuality
+
+
+# Batas jumlah mesin per request batch supaya satu query tetap wajar
+MAX_BATCH_MACHINES = 200
+HISTORY_FIELDS = ('tds_level', 'ph_level', 'water_level')
+
+
+class InvalidTimeRange(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_code = 'invalid_time_range'
+
+    def __init__(self, message):
+        # Bentuk body sama dengan error lain di API: {"error": "..."}
+        super().__init__({'error': message})
+
+
+def parse_datetime_param(params, name):
+    """Satu parameter ISO 8601. Tanpa offset dianggap zona waktu TIME_ZONE."""
+    try:
+        value = timezone.datetime.fromisoformat(params[name])
+    except ValueError:
+        raise InvalidTimeRange(f"{name} must be an ISO 8601 datetime")
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_current_timezone())
+    return value
+
+
+def parse_time_range(params, default_hours=24):
+    """
+    Ambil start_date/end_date (ISO 8601) dari query params, default 24 jam
+    terakhir. Hasilnya selalu aware; input rusak atau start > end menjadi 400.
+    """
+    end_date = timezone.now()
+    start_date = end_date - timedelta(hours=default_hours)
+
+    if 'start_date' in params:
+        start_date = parse_datetime_param(params, 'start_date')
+    if 'end_date' in params:
+        end_date = parse_datetime_param(params, 'end_date')
+    if start_date > end_date:
+        raise InvalidTimeRange("start_date must not be after end_date")
+    return start_date, end_date
+
+
+def parse_machine_ids(params):
+    """Terima ?machine_ids=A,B,C maupun ?machine_ids=A&machine_ids=B."""
+    machine_ids = []
+    for value in params.getlist('machine_ids'):
+        machine_ids.extend(part.strip() for part in value.split(',') if part.strip())
+    # Hilangkan duplikat tapi tetap jaga urutan
+    return list(dict.fromkeys(machine_ids))
+
+
+def fetch_series(machine_ids, start_date, end_date):
+    """
+    Satu query untuk semua mesin (plus blok cold storage), diurutkan
+    (machine, timestamp). Menghasilkan tuple (machine_id, timestamp, tds, ph, water_level).
+    """
+    machine_map = dict(
+        VendingMachine.objects
+        .filter(machine_id__in=machine_ids)
+        .values_list('pk', 'machine_id')
+    )
+    hot_rows = (
+        WaterQuality.objects
+        .filter(machine_id__in=list(machine_map),
+                timestamp__range=(start_date, end_date))
+        .order_by('machine_id', 'timestamp')
+        .values_list('machine_id', 'timestamp', *HISTORY_FIELDS)
+        .iterator(chunk_size=2000)
+    )
+    rows = merge_with_cold(hot_rows, list(machine_map), start_date, end_date)
+    for machine_pk, *values in rows:
+        yield (machine_map[machine_pk], *values)
+
+
+def downsample(rows, bucket_seconds):
+    """
+    Rata-rata per bucket waktu untuk rows (timestamp, tds, ph, water_level)
+    yang sudah terurut. Timestamp hasil = awal bucket.
+    """
+    if not bucket_seconds:
+        yield from rows
+        return
+
+    current_bucket = None
+    sums = [0.0, 0.0, 0.0]
+    count = 0
+    for timestamp, tds, ph, water_level in rows:
+        epoch = int(timestamp.timestamp())
+        bucket = epoch - (epoch % bucket_seconds)
+        if bucket != current_bucket:
+            if count:
+                yield _bucket_row(current_bucket, timestamp.tzinfo, sums, count)
+            current_bucket = bucket
+            sums = [0.0, 0.0, 0.0]
+            count = 0
+        sums[0] += tds
+        sums[1] += ph
+        sums[2] += water_level
+        count += 1
+    if count:
+        yield _bucket_row(current_bucket, timestamp.tzinfo, sums, count)
+
+
+def _bucket_row(bucket, tzinfo, sums, count):
+    start = timezone.datetime.fromtimestamp(bucket, tz=tzinfo)
+    return (start, sums[0] / count, sums[1] / count, sums[2] / count)
+
+
+def serialize_point(row):
+    timestamp, tds, ph, water_level = row
+    return {
+        'timestamp': timestamp.isoformat(),
+        'tds_level': tds,
+        'ph_level': ph,
+        'water_level': water_level,
+    }
+
+
+def stream_batch_history(machine_ids, start_date, end_date, bucket_seconds=None):
+    """
+    Generator JSON untuk StreamingHttpResponse:
+    {"start_date": ..., "end_date": ..., "bucket": ..., "machines": {"<id>": [...], ...}}
+    Mesin tanpa data tetap muncul dengan list kosong.
+    """
+    yield '{"start_date": %s, "end_date": %s, "bucket": %s, "machines": {' % (
+        json.dumps(start_date.isoformat()),
+        json.dumps(end_date.isoformat()),
+        json.dumps(bucket_seconds),
+    )
+
+    seen = set()
+    first_machine = True
+    rows = fetch_series(machine_ids, start_date, end_date)
+    for machine_id, group in groupby(rows, key=lambda row: row[0]):
+        seen.add(machine_id)
+        yield ('' if first_machine else ', ') + json.dumps(machine_id) + ': ['
+        first_machine = False
+
+        points = downsample((row[1:] for row in group), bucket_seconds)
+        first_point = True
+        for point in points:
+            yield ('' if first_point else ', ') + json.dumps(serialize_point(point))
+            first_point = False
+        yield ']'
+
+    for machine_id in machine_ids:
+        if machine_id not in seen:
+            yield ('' if first_machine else ', ') + json.dumps(machine_id) + ': []'
+            first_machine = False
+
+    yield '}}'
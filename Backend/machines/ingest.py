@@ -0,0 +1,157 @@
+"""
+Penyimpanan data dari device (WaterQuality / SalesRecord).
+
+Device mengirim timestamp pengambilan dan nomor urut (seq) sendiri, jadi
+data yang di-buffer lalu di-upload terlambat, tidak berurutan, atau dikirim
+ulang tetap tercatat sekali di waktu yang benar. Dedup memakai unique
+constraint (machine, seq); untuk WaterQuality yang jamnya sudah dikemas ke
+cold storage, dedup memakai timestamp di blok (lihat packed_timestamps).
+"""
+from contextlib import contextmanager
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .coldstorage import floor_hour, packed_timestamps
+from .models import VendingMachine, WaterQuality, WaterQualityRollup
+from .rollups import SKETCH_METRICS, pack_hist
+
+
+MAX_BATCH_SIZE = 1000
+
+
+class MachineGone(Exception):
+    """pk dari cache sudah tidak ada di database."""
+
+
+def _machine_gone(machine_pk):
+    return not VendingMachine.objects.filter(pk=machine_pk).exists()
+
+
+@contextmanager
+def ingest_atomic(machine_pk):
+    """
+    transaction.atomic untuk satu request ingest. Foreign key di SQLite (dan
+    FK deferred di PostgreSQL) baru dicek saat commit transaksi terluar, jadi
+    IntegrityError di titik itu diterjemahkan ke MachineGone kalau mesinnya
+    memang sudah tidak ada. Error integritas lain diteruskan apa adanya.
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError:
+        if _machine_gone(machine_pk):
+            raise MachineGone(machine_pk)
+        raise
+
+
+def _packed_replays(model, machine_pk, items):
+    """Timestamp item ber-seq yang pembacaannya sudah ada di cold storage."""
+    if model is not WaterQuality:
+        return set()
+    timestamps = [item['timestamp'] for item in items
+                  if item.get('seq') is not None and item.get('timestamp') is not None]
+    return packed_timestamps(machine_pk, timestamps) if timestamps else set()
+
+
+def save_one(model, machine_pk, data):
+    """
+    Simpan satu record. Return (instance, created); kalau seq sudah pernah
+    diterima, instance yang lama dikembalikan dengan created=False. Pembacaan
+    yang sudah dikemas ke cold storage dikembalikan sebagai instance tanpa pk.
+    """
+    if _packed_replays(model, machine_pk, [data]):
+        return model(machine_id=machine_pk, **data), False
+    try:
+        with transaction.atomic():
+            return model.objects.create(machine_id=machine_pk, **data), True
+    except IntegrityError:
+        seq = data.get('seq')
+        existing = (
+            model.objects.filter(machine_id=machine_pk, seq=seq).first()
+            if seq is not None else None
+        )
+        if existing is not None:
+            return existing, False
+        if _machine_gone(machine_pk):
+            raise MachineGone(machine_pk)
+        raise
+
+
+def save_batch(model, machine_pk, items):
+    """
+    Simpan banyak record sekaligus. Return (instance baru, jumlah duplikat).
+    Record yang seq-nya sudah ada (di database atau dalam batch) dilewati.
+    """
+    seqs = [item['seq'] for item in items if item.get('seq') is not None]
+    existing = set(
+        model.objects
+        .filter(machine_id=machine_pk, seq__in=seqs)
+        .values_list('seq', flat=True)
+    ) if seqs else set()
+    packed = _packed_replays(model, machine_pk, items)
+
+    new = []
+    duplicates = 0
+    for item in items:
+        seq = item.get('seq')
+        if seq is not None:
+            if seq in existing or item.get('timestamp') in packed:
+                duplicates += 1
+                continue
+            existing.add(seq)
+        new.append(model(machine_id=machine_pk, **item))
+
+    while True:
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(new)
+            return new, duplicates
+        except IntegrityError as e:
+            error = e
+        # Upload paralel dengan seq yang sama masuk duluan; buang seq itu
+        # lalu ulangi, supaya yang dikembalikan hanya baris yang benar-benar masuk
+        seqs = [obj.seq for obj in new if obj.seq is not None]
+        taken = set(
+            model.objects
+            .filter(machine_id=machine_pk, seq__in=seqs)
+            .values_list('seq', flat=True)
+        ) if seqs else set()
+        if not taken:
+            if _machine_gone(machine_pk):
+                raise MachineGone(machine_pk)
+            raise error
+        new = [obj for obj in new if obj.seq not in taken]
+        duplicates += len(taken)
+
+
+def mark_rollups_dirty(machine_pk, timestamps, now=None):
+    """
+    Tandai rollup jam yang tersentuh data terlambat. Data di jam berjalan
+    tidak perlu ditandai karena jam itu belum pernah di-rollup.
+    """
+    current_hour = floor_hour(now or timezone.now())
+    buckets = {floor_hour(timestamp) for timestamp in timestamps if timestamp < current_hour}
+    if not buckets:
+        return buckets
+
+    # Placeholder untuk jam yang belum punya rollup; rollup yang sudah ada
+    # hanya kolom dirty-nya yang berubah
+    empty = {metric: pack_hist(np.zeros(bins, dtype=np.int64))
+             for metric, (_, _, _, bins) in SKETCH_METRICS.items()}
+    WaterQualityRollup.objects.bulk_create(
+        [
+            WaterQualityRollup(
+                machine_id=machine_pk, bucket=bucket, count=0,
+                tds_sum=0, tds_sum_sq=0, tds_min=0, tds_max=0, tds_hist=empty['tds'],
+                ph_sum=0, ph_sum_sq=0, ph_min=0, ph_max=0, ph_hist=empty['ph'],
+                dirty=True,
+            )
+            for bucket in buckets
+        ],
+        update_conflicts=True,
+        unique_fields=['machine', 'bucket'],
+        update_fields=['dirty'],
+    )
+    return buckets
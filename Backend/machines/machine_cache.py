@@ -0,0 +1,152 @@
+"""
+Cache machine_id -> pk untuk jalur ingest.
+
+Diatur lewat settings.MACHINE_ID_CACHE. Kalau SHARED_CACHE diisi, cache
+Django bersama itu yang jadi acuan: rename atau hapus di satu worker langsung
+terlihat di semua worker, jadi data tidak tercatat ke mesin yang salah. LRU
+di memori proses hanya dipakai kalau tidak ada cache bersama, dan entry-nya
+kedaluwarsa setelah LOCAL_TIMEOUT detik (cukup untuk satu proses/dev).
+
+Entry dibuang lewat signal saat mesin dibuat, di-rename atau dihapus (lihat
+signals.py), sekali lagi setelah commit supaya worker lain yang sempat
+membaca data lama tidak menyimpannya kembali. Update massal lewat
+QuerySet.update() tidak memicu signal, panggil invalidate() manual.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import VendingMachine
+
+
+DEFAULT_MACHINE_ID_CACHE = {
+    'MAX_SIZE': 10000,
+    # Umur entry LRU lokal (detik), dipakai kalau tidak ada cache bersama
+    'LOCAL_TIMEOUT': 30,
+    # Alias di settings.CACHES, None = hanya cache lokal
+    'SHARED_CACHE': None,
+    'TIMEOUT': 3600,
+}
+
+SHARED_ID_KEY = 'machines:id:{}'
+SHARED_PK_KEY = 'machines:pk:{}'
+
+
+def cache_setting(name):
+    return getattr(settings, 'MACHINE_ID_CACHE', {}).get(name, DEFAULT_MACHINE_ID_CACHE[name])
+
+
+class MachineIdCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id = OrderedDict()
+        self._by_pk = {}
+
+    def get(self, machine_id):
+        with self._lock:
+            entry = self._by_id.get(machine_id)
+            if entry is None:
+                return None
+            pk, expires = entry
+            if expires <= time.monotonic():
+                del self._by_id[machine_id]
+                self._by_pk.pop(pk, None)
+                return None
+            self._by_id.move_to_end(machine_id)
+            return pk
+
+    def set(self, machine_id, pk):
+        with self._lock:
+            self._by_id[machine_id] = (pk, time.monotonic() + cache_setting('LOCAL_TIMEOUT'))
+            self._by_id.move_to_end(machine_id)
+            self._by_pk[pk] = machine_id
+            while len(self._by_id) > cache_setting('MAX_SIZE'):
+                _, (old_pk, _) = self._by_id.popitem(last=False)
+                self._by_pk.pop(old_pk, None)
+
+    def discard(self, pk=None, machine_id=None):
+        with self._lock:
+            if pk is not None:
+                old_id = self._by_pk.pop(pk, None)
+                if old_id is not None:
+                    self._by_id.pop(old_id, None)
+            if machine_id is not None:
+                entry = self._by_id.pop(machine_id, None)
+                if entry is not None:
+                    self._by_pk.pop(entry[0], None)
+
+    def clear(self):
+        with self._lock:
+            self._by_id.clear()
+            self._by_pk.clear()
+
+
+local_cache = MachineIdCache()
+
+
+def _shared_cache():
+    alias = cache_setting('SHARED_CACHE')
+    return caches[alias] if alias else None
+
+
+def resolve_machine_pk(machine_id):
+    """pk VendingMachine untuk machine_id, atau None kalau tidak ada."""
+    shared = _shared_cache()
+    if shared is not None:
+        # Cache bersama yang jadi acuan; LRU lokal tidak tahu rename di worker lain
+        pk = shared.get(SHARED_ID_KEY.format(machine_id))
+        if pk is not None:
+            return pk
+    else:
+        pk = local_cache.get(machine_id)
+        if pk is not None:
+            return pk
+
+    pk = (
+        VendingMachine.objects
+        .filter(machine_id=machine_id)
+        .values_list('pk', flat=True)
+        .first()
+    )
+    if pk is None:
+        return None
+
+    if shared is not None:
+        timeout = cache_setting('TIMEOUT')
+        shared.set_many({
+            SHARED_ID_KEY.format(machine_id): pk,
+            SHARED_PK_KEY.format(pk): machine_id,
+        }, timeout)
+    else:
+        local_cache.set(machine_id, pk)
+    return pk
+
+
+def invalidate(pk=None, machine_id=None):
+    """
+    Buang mapping untuk pk dan/atau machine_id dari cache lokal dan bersama,
+    sekarang dan sekali lagi setelah transaksi yang sedang berjalan di-commit.
+    """
+    _invalidate(pk, machine_id)
+    transaction.on_commit(lambda: _invalidate(pk, machine_id))
+
+
+def _invalidate(pk, machine_id):
+    local_cache.discard(pk=pk, machine_id=machine_id)
+
+    shared = _shared_cache()
+    if shared is None:
+        return
+    keys = []
+    if machine_id is not None:
+        keys.append(SHARED_ID_KEY.format(machine_id))
+    if pk is not None:
+        old_id = shared.get(SHARED_PK_KEY.format(pk))
+        keys.append(SHARED_PK_KEY.format(pk))
+        if old_id is not None:
+            keys.append(SHARED_ID_KEY.format(old_id))
+    shared.delete_many(keys)
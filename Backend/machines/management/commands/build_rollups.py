@@ -0,0 +1,14 @@
+from django.utils import timezone
+
+from machines.management.periodic import PeriodicCommand
+from machines.rollups import build_rollups, get_watermark
+
+
+class Command(PeriodicCommand):
+    help = "Bangun rollup per jam WaterQuality (momen + histogram) untuk endpoint statistics"
+
+    def run_once(self, **options):
+        rebuilt = build_rollups(timezone.now())
+        self.stdout.write(self.style.SUCCESS(
+            f"Rollups up to {get_watermark()}, {len(rebuilt)} dirty hours rebuilt"
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from machines.export import DATASETS, export, export_root
+
+
+class Command(BaseCommand):
+    help = "Export WaterQuality dan SalesRecord ke Parquet (partisi per bulan dan per mesin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', action='append', choices=list(DATASETS),
+                            help="Dataset yang di-export (default semua)")
+        parser.add_argument('--machine-id', action='append', dest='machine_ids',
+                            help="Batasi ke machine_id tertentu (bisa diulang)")
+        parser.add_argument('--month', action='append', dest='months', metavar='YYYY-MM',
+                            help="Batasi ke bulan tertentu (bisa diulang)")
+
+    def handle(self, *args, **options):
+        result = export(
+            datasets=options['dataset'],
+            machine_ids=options['machine_ids'],
+            months=options['months'],
+        )
+        for key in result['written']:
+            self.stdout.write(f"written  {key}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(result['written'])} partitions written, "
+            f"{len(result['skipped'])} unchanged, output in {export_root()}"
+        ))
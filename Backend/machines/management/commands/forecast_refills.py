@@ -0,0 +1,17 @@
+import time
+
+from django.utils import timezone
+
+from machines.forecast import forecast_refills
+from machines.management.periodic import PeriodicCommand
+
+
+class Command(PeriodicCommand):
+    help = "Perkirakan kapan tangki tiap mesin kosong dari water_level dan penjualan terbaru"
+
+    def run_once(self, **options):
+        started = time.monotonic()
+        count = forecast_refills(timezone.now())
+        self.stdout.write(self.style.SUCCESS(
+            f"Forecast updated for {count} machines in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from machines.coldstorage import pack_machine
+from machines.management.periodic import PeriodicCommand
+from machines.models import WaterQuality
+
+
+class Command(PeriodicCommand):
+    help = "Kemas pembacaan WaterQuality lama ke blok cold storage (WaterQualityBlock)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=7,
+                            help="Hanya kemas pembacaan yang lebih tua dari N hari")
+
+    def run_once(self, older_than_days, **options):
+        cutoff = timezone.now() - timedelta(days=older_than_days)
+        machine_pks = (
+            WaterQuality.objects
+            .filter(timestamp__lt=cutoff)
+            .values_list('machine_id', flat=True)
+            .order_by()
+            .distinct()
+        )
+
+        total = 0
+        for machine_pk in list(machine_pks):
+            total += pack_machine(machine_pk, cutoff)
+        self.stdout.write(self.style.SUCCESS(f"Packed {total} readings older than {cutoff:%Y-%m-%d %H:%M}"))
@@ -0,0 +1,31 @@
+import abc
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+class PeriodicCommand(BaseCommand, metaclass=abc.ABCMeta):
+    """
+    Command yang bisa jalan sekali (cron/systemd timer) atau terus sebagai
+    background worker dengan --loop N. Subclass wajib mengisi run_once(**options).
+    """
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument('--loop', type=int, default=0, metavar='SECONDS',
+                            help="Jalan terus sebagai background worker, ulangi tiap N detik")
+        return parser
+
+    def handle(self, *args, **options):
+        while True:
+            self.run_once(**options)
+            if not options['loop']:
+                break
+            # Koneksi database worker yang tidur lama bisa sudah diputus server
+            close_old_connections()
+            time.sleep(options['loop'])
+
+    @abc.abstractmethod
+    def run_once(self, **options):
+        """Satu putaran kerja; options berisi argumen command termasuk 'loop'."""
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaterQualityBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(help_text='Awal jam yang dicakup blok')),
+                ('end', models.DateTimeField(help_text='Timestamp pembacaan terakhir di blok')),
+                ('count', models.PositiveIntegerField(help_text='Jumlah pembacaan di blok')),
+                ('data', models.BinaryField()),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quality_blocks', to='machines.vendingmachine')),
+            ],
+            options={
+                'ordering': ['machine', 'start'],
+                'unique_together': {('machine', 'start')},
+            },
+        ),
+    ]
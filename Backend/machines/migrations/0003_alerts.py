@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0002_waterqualityblock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('metric', models.CharField(choices=[('tds_level', 'TDS Level'), ('ph_level', 'pH Level'), ('water_level', 'Water Level')], max_length=20)),
+                ('operator', models.CharField(choices=[('lt', '<'), ('lte', '<='), ('gt', '>'), ('gte', '>=')], max_length=3)),
+                ('threshold', models.FloatField()),
+                ('duration', models.PositiveIntegerField(default=0, help_text='Kondisi harus bertahan selama N detik')),
+                ('enabled', models.BooleanField(default=True)),
+                ('machine', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='machines.vendingmachine')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Alert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.FloatField(help_text='Nilai metric saat alert terpicu')),
+                ('triggered_at', models.DateTimeField()),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='machines.vendingmachine')),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='machines.alertrule')),
+            ],
+            options={
+                'ordering': ['-triggered_at'],
+                'indexes': [models.Index(fields=['machine', 'resolved_at'], name='machines_al_machine_60fd3f_idx')],
+            },
+        ),
+    ]
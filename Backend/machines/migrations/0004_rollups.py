@@ -0,0 +1,46 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0003_alerts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WaterQualityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Awal jam')),
+                ('count', models.PositiveIntegerField()),
+                ('tds_sum', models.FloatField()),
+                ('tds_sum_sq', models.FloatField()),
+                ('tds_min', models.FloatField()),
+                ('tds_max', models.FloatField()),
+                ('tds_hist', models.BinaryField()),
+                ('ph_sum', models.FloatField()),
+                ('ph_sum_sq', models.FloatField()),
+                ('ph_min', models.FloatField()),
+                ('ph_max', models.FloatField()),
+                ('ph_hist', models.BinaryField()),
+                ('dirty', models.BooleanField(default=False, help_text='Ada data baru untuk jam ini, perlu dihitung ulang')),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quality_rollups', to='machines.vendingmachine')),
+            ],
+            options={
+                'ordering': ['machine', 'bucket'],
+                'unique_together': {('machine', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0004_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salesrecord',
+            index=models.Index(fields=['machine', 'timestamp'], name='machines_sa_machine_a1b3db_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesrecord',
+            index=models.Index(fields=['timestamp'], name='machines_sa_timesta_08a046_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='waterquality',
+            index=models.Index(fields=['machine', 'timestamp'], name='machines_wa_machine_7fe7c9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='waterquality',
+            index=models.Index(fields=['timestamp'], name='machines_wa_timesta_b41a0c_idx'),
+        ),
+    ]
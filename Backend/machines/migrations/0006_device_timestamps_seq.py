@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0005_telemetry_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesrecord',
+            name='seq',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Nomor urut dari device, untuk dedup upload ulang', null=True),
+        ),
+        migrations.AddField(
+            model_name='waterquality',
+            name='seq',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Nomor urut dari device, untuk dedup upload ulang', null=True),
+        ),
+        migrations.AlterField(
+            model_name='salesrecord',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='waterquality',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddConstraint(
+            model_name='salesrecord',
+            constraint=models.UniqueConstraint(fields=('machine', 'seq'), name='unique_salesrecord_machine_seq'),
+        ),
+        migrations.AddConstraint(
+            model_name='waterquality',
+            constraint=models.UniqueConstraint(fields=('machine', 'seq'), name='unique_waterquality_machine_seq'),
+        ),
+    ]
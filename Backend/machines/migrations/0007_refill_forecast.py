@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0006_device_timestamps_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefillForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('water_level', models.FloatField(help_text='Water level terakhir dalam persen')),
+                ('measured_at', models.DateTimeField(help_text='Waktu pembacaan water level terakhir')),
+                ('rate', models.FloatField(help_text='Konsumsi dalam persen per jam')),
+                ('source', models.CharField(choices=[('water_level', 'Water level'), ('sales', 'Sales')], max_length=20)),
+                ('samples', models.PositiveIntegerField(help_text='Jumlah pembacaan yang dipakai untuk fit')),
+                ('empty_at', models.DateTimeField(blank=True, help_text='Perkiraan tangki kosong; kosong kalau tidak ada konsumsi', null=True)),
+                ('updated_at', models.DateTimeField()),
+                ('machine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='refill_forecast', to='machines.vendingmachine')),
+            ],
+            options={
+                'ordering': ['empty_at'],
+                'indexes': [models.Index(fields=['empty_at'], name='machines_re_empty_a_d76083_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0007_refill_forecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vendingmachine',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vendingmachine',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='vendingmachine',
+            index=models.Index(fields=['latitude', 'longitude'], name='machines_ve_latitud_933d12_idx'),
+        ),
+    ]
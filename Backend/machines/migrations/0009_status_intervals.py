@@ -0,0 +1,40 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_current_status(apps, schema_editor):
+    # Riwayat sebelum migration tidak diketahui; status sekarang berlaku mulai saat ini
+    VendingMachine = apps.get_model('machines', 'VendingMachine')
+    StatusInterval = apps.get_model('machines', 'StatusInterval')
+    now = django.utils.timezone.now()
+    StatusInterval.objects.bulk_create(
+        StatusInterval(machine_id=pk, status=status, start=now)
+        for pk, status in VendingMachine.objects.values_list('pk', 'status').iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0008_machine_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('online', 'Online'), ('offline', 'Offline'), ('maintenance', 'Maintenance'), ('error', 'Error')], max_length=20)),
+                ('start', models.DateTimeField(default=django.utils.timezone.now)),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_intervals', to='machines.vendingmachine')),
+            ],
+            options={
+                'ordering': ['machine', 'start'],
+                'indexes': [models.Index(fields=['machine', 'start'], name='machines_st_machine_83ec3d_idx')],
+            },
+        ),
+        migrations.RunPython(seed_current_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-19 18:37
+
+from django.db import migrations, models
+
+
+def resolve_duplicate_alerts(apps, schema_editor):
+    # Alert aktif dobel dari versi sebelumnya: yang lebih lama dianggap selesai
+    # saat alert berikutnya terpicu
+    Alert = apps.get_model('machines', 'Alert')
+    previous = None
+    for alert in Alert.objects.filter(resolved_at__isnull=True).order_by('rule_id', 'machine_id', '-triggered_at'):
+        key = (alert.rule_id, alert.machine_id)
+        if previous is not None and previous[0] == key:
+            alert.resolved_at = previous[1]
+            alert.save(update_fields=['resolved_at'])
+        previous = (key, alert.triggered_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machines', '0009_status_intervals'),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_duplicate_alerts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='alert',
+            constraint=models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('rule', 'machine'), name='unique_active_alert_rule_machine'),
+        ),
+    ]
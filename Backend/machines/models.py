@@ -17,10 +17,18 @@ class VendingMachine(models.Model):
     machine_id = models.CharField(max_length=50, unique=True)
     name = models.CharField(max_length=100)
     location = models.CharField(max_length=200)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=MACHINE_STATUS, default='offline')
     last_maintenance = models.DateTimeField(null=True, blank=True)
     installation_date = models.DateTimeField(auto_now_add=True)
-    
+
+    class Meta:
+        indexes = [
+            # Query bounding box (mesin di sekitar depot)
+            models.Index(fields=['latitude', 'longitude']),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.machine_id})"
 
@@ -29,10 +37,20 @@ class WaterQuality(models.Model):
     tds_level = models.FloatField(help_text="Total Dissolved Solids in ppm")
     ph_level = models.FloatField(help_text="pH level of water")
     water_level = models.FloatField(help_text="Water level in percentage")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Waktu pengambilan dari device; kalau tidak dikirim pakai waktu server
+    timestamp = models.DateTimeField(default=timezone.now)
+    seq = models.PositiveBigIntegerField(null=True, blank=True,
+                                         help_text="Nomor urut dari device, untuk dedup upload ulang")
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['machine', 'timestamp']),
+            models.Index(fields=['timestamp']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['machine', 'seq'], name='unique_waterquality_machine_seq'),
+        ]
 
     @property
     def latest_quality(self):
@@ -47,7 +65,171 @@ class SalesRecord(models.Model):
     machine = models.ForeignKey(VendingMachine, on_delete=models.CASCADE, related_name='sales')
     volume = models.IntegerField(help_text="Volume in ml")
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
+    seq = models.PositiveBigIntegerField(null=True, blank=True,
+                                         help_text="Nomor urut dari device, untuk dedup upload ulang")
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['machine', 'timestamp']),
+            models.Index(fields=['timestamp']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['machine', 'seq'], name='unique_salesrecord_machine_seq'),
+        ]
+
+class WaterQualityBlock(models.Model):
+    """
+    Cold storage: semua pembacaan satu mesin dalam satu jam dikemas jadi
+    satu blok terkompresi (lihat machines/coldstorage.py untuk formatnya).
+    """
+    machine = models.ForeignKey(VendingMachine, on_delete=models.CASCADE, related_name='quality_blocks')
+    start = models.DateTimeField(help_text="Awal jam yang dicakup blok")
+    end = models.DateTimeField(help_text="Timestamp pembacaan terakhir di blok")
+    count = models.PositiveIntegerField(help_text="Jumlah pembacaan di blok")
+    data = models.BinaryField()
 
     class Meta:
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['machine', 'start']
+        unique_together = [('machine', 'start')]
+
+    def __str__(self):
+        return f"{self.machine_id} @ {self.start:%Y-%m-%d %H:00} ({self.count} readings)"
+
+
+class AlertRule(models.Model):
+    """
+    Contoh: ph_level < 6.5 selama 300 detik, atau water_level < 10.
+    machine kosong = berlaku untuk semua mesin.
+    """
+    METRICS = [
+        ('tds_level', 'TDS Level'),
+        ('ph_level', 'pH Level'),
+        ('water_level', 'Water Level'),
+    ]
+    OPERATORS = [
+        ('lt', '<'),
+        ('lte', '<='),
+        ('gt', '>'),
+        ('gte', '>='),
+    ]
+
+    name = models.CharField(max_length=100)
+    machine = models.ForeignKey(VendingMachine, on_delete=models.CASCADE, related_name='alert_rules',
+                                null=True, blank=True)
+    metric = models.CharField(max_length=20, choices=METRICS)
+    operator = models.CharField(max_length=3, choices=OPERATORS)
+    threshold = models.FloatField()
+    duration = models.PositiveIntegerField(default=0, help_text="Kondisi harus bertahan selama N detik")
+    enabled = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.metric} {self.get_operator_display()} {self.threshold}"
+
+
+class Alert(models.Model):
+    rule = models.ForeignKey(AlertRule, on_delete=models.CASCADE, related_name='alerts')
+    machine = models.ForeignKey(VendingMachine, on_delete=models.CASCADE, related_name='alerts')
+    value = models.FloatField(help_text="Nilai metric saat alert terpicu")
+    triggered_at = models.DateTimeField()
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-triggered_at']
+        indexes = [
+            models.Index(fields=['machine', 'resolved_at']),
+        ]
+        constraints = [
+            # Paling banyak satu alert aktif per (rule, mesin), lihat alerts.py
+            models.UniqueConstraint(fields=['rule', 'machine'], condition=models.Q(resolved_at__isnull=True),
+                                    name='unique_active_alert_rule_machine'),
+        ]
+
+    def __str__(self):
+        return f"{self.rule.name} @ {self.machine}"
+
+
+class WaterQualityRollup(models.Model):
+    """
+    Ringkasan per (mesin, jam) yang bisa digabung: count, sum, sum kuadrat,
+    min, max, dan histogram (sketch untuk percentile) TDS dan pH.
+    Dibangun oleh `python manage.py build_rollups` (lihat machines/rollups.py).
+    """
+    machine = models.ForeignKey(VendingMachine, on_delete=models.CASCADE, related_name='quality_rollups')
+    bucket = models.DateTimeField(help_text="Awal jam")
+    count = models.PositiveIntegerField()
+    tds_sum = models.FloatField()
+    tds_sum_sq = models.FloatField()
+    tds_min = models.FloatField()
+    tds_max = models.FloatField()
+    tds_hist = models.BinaryField()
+    ph_sum = models.FloatField()
+    ph_sum_sq = models.FloatField()
+    ph_min = models.FloatField()
+    ph_max = models.FloatField()
+    ph_hist = models.BinaryField()
+    dirty = models.BooleanField(default=False, help_text="Ada data baru untuk jam ini, perlu dihitung ulang")
+
+    class Meta:
+        ordering = ['machine', 'bucket']
+        unique_together = [('machine', 'bucket')]
+
+
+class RollupWatermark(models.Model):
+    """Semua jam sebelum `value` sudah punya rollup (kecuali yang ditandai dirty)."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class RefillForecast(models.Model):
+    """
+    Perkiraan kapan tangki mesin kosong, dihitung ulang oleh
+    `python manage.py forecast_refills` (lihat machines/forecast.py).
+    """
+    SOURCES = [
+        ('water_level', 'Water level'),
+        ('sales', 'Sales'),
+    ]
+
+    machine = models.OneToOneField(VendingMachine, on_delete=models.CASCADE, related_name='refill_forecast')
+    water_level = models.FloatField(help_text="Water level terakhir dalam persen")
+    measured_at = models.DateTimeField(help_text="Waktu pembacaan water level terakhir")
+    rate = models.FloatField(help_text="Konsumsi dalam persen per jam")
+    source = models.CharField(max_length=20, choices=SOURCES)
+    samples = models.PositiveIntegerField(help_text="Jumlah pembacaan yang dipakai untuk fit")
+    empty_at = models.DateTimeField(null=True, blank=True,
+                                    help_text="Perkiraan tangki kosong; kosong kalau tidak ada konsumsi")
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['empty_at']
+        indexes = [
+            models.Index(fields=['empty_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.machine_id}: empty at {self.empty_at}"
+
+
+class StatusInterval(models.Model):
+    """
+    Riwayat status mesin, append-only: setiap baris adalah awal interval
+    status baru dan berlaku sampai baris berikutnya untuk mesin yang sama.
+    Ditulis otomatis saat VendingMachine.status berubah (signals.py).
+    """
+    machine = models.ForeignKey(VendingMachine, on_delete=models.CASCADE, related_name='status_intervals')
+    status = models.CharField(max_length=20, choices=VendingMachine.MACHINE_STATUS)
+    start = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['machine', 'start']
+        indexes = [
+            models.Index(fields=['machine', 'start']),
+        ]
+
+    def __str__(self):
+        return f"{self.machine_id}: {self.status} since {self.start}"
@@ -0,0 +1,51 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimate_table_rows(model, using='default'):
+    """
+    Perkiraan jumlah row dari statistik database (tanpa COUNT(*)).
+    Return None kalau database tidak menyediakan statistik.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = %s", [table])
+        elif connection.vendor == 'sqlite':
+            # Hanya tersedia sesudah ANALYZE
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # Angka pertama kolom stat = jumlah row tabel (baik untuk index maupun tabel)
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Untuk queryset tanpa filter di tabel besar, pakai perkiraan dari statistik
+    database alih-alih COUNT(*) penuh. Queryset yang difilter tetap dihitung
+    exact.
+    """
+    # Di bawah ini COUNT(*) masih murah dan hasil exact lebih berguna
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and not queryset.query.where:
+            estimate = estimate_table_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.estimate_threshold:
+                return estimate
+        return super().count
@@ -0,0 +1,295 @@
+"""
+Rollup per jam dan statistik window untuk WaterQuality.
+
+Setiap WaterQualityRollup menyimpan momen yang bisa digabung (count, sum,
+sum kuadrat, min, max) sebagai kolom biasa, jadi penggabungan banyak jam
+cukup dengan satu query SUM/MIN/MAX. Percentile memakai histogram ber-bin
+tetap (sketch) yang juga bisa dijumlahkan; akurasinya selebar satu bin.
+
+Statistik window [start, end]:
+    - jam penuh sebelum watermark dan tidak dirty  -> dari rollup
+    - potongan jam di tepi window, jam sesudah watermark, jam dirty -> dari data mentah
+"""
+import math
+import zlib
+from datetime import timedelta
+from itertools import groupby
+
+import numpy as np
+from django.db.models import Count, Max, Min, Sum
+
+from .coldstorage import floor_hour, merge_with_cold
+from .models import RollupWatermark, WaterQuality, WaterQualityBlock, WaterQualityRollup
+
+
+HOUR = timedelta(hours=1)
+WATERMARK_NAME = 'water_quality'
+
+# (nama kolom, batas bawah, batas atas, jumlah bin)
+SKETCH_METRICS = {
+    'tds': ('tds_level', 0.0, 2000.0, 1000),   # bin 2 ppm
+    'ph': ('ph_level', 0.0, 14.0, 700),        # bin 0.02
+}
+PERCENTILES = (50, 95)
+
+
+def ceil_hour(value):
+    floored = floor_hour(value)
+    return floored if floored == value else floored + HOUR
+
+
+class Sketch:
+    """Momen + histogram satu metric; bisa digabung dengan merge()."""
+
+    def __init__(self, metric, count=0, total=0.0, total_sq=0.0,
+                 minimum=math.inf, maximum=-math.inf, hist=None):
+        _, low, high, bins = SKETCH_METRICS[metric]
+        self.metric = metric
+        self.count = count
+        self.total = total
+        self.total_sq = total_sq
+        self.minimum = minimum
+        self.maximum = maximum
+        self.hist = hist if hist is not None else np.zeros(bins, dtype=np.int64)
+
+    @classmethod
+    def from_values(cls, metric, values):
+        _, low, high, bins = SKETCH_METRICS[metric]
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return cls(metric)
+        hist = np.bincount(_bin_index(values, low, high, bins), minlength=bins).astype(np.int64)
+        return cls(
+            metric, len(values), float(values.sum()), float(np.square(values).sum()),
+            float(values.min()), float(values.max()), hist,
+        )
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.hist += other.hist
+        return self
+
+    def percentile(self, q):
+        _, low, high, bins = SKETCH_METRICS[self.metric]
+        cumulative = np.cumsum(self.hist)
+        rank = q / 100 * (self.count - 1)
+        index = int(np.searchsorted(cumulative, rank, side='right'))
+        index = min(index, bins - 1)
+        width = (high - low) / bins
+        below = cumulative[index - 1] if index else 0
+        fraction = (rank - below + 0.5) / self.hist[index] if self.hist[index] else 0.5
+        value = low + (index + min(max(fraction, 0.0), 1.0)) * width
+        # Bin pertama/terakhir juga menampung nilai di luar range
+        return min(max(value, self.minimum), self.maximum)
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        mean = self.total / self.count
+        variance = max(self.total_sq / self.count - mean * mean, 0.0)
+        result = {
+            'count': self.count,
+            'min': self.minimum,
+            'max': self.maximum,
+            'mean': mean,
+            'stddev': math.sqrt(variance),
+        }
+        for q in PERCENTILES:
+            result[f'p{q}'] = float(self.percentile(q))
+        return result
+
+
+def _bin_index(values, low, high, bins):
+    index = np.floor((values - low) / (high - low) * bins).astype(np.int64)
+    return np.clip(index, 0, bins - 1)
+
+
+def pack_hist(hist):
+    return zlib.compress(hist.astype('<u4').tobytes())
+
+
+def unpack_hist(data):
+    return np.frombuffer(zlib.decompress(bytes(data)), dtype='<u4').astype(np.int64)
+
+
+def iter_readings(machine_pks, start, end):
+    """Pembacaan hot + cold dalam [start, end), urut (machine pk, timestamp)."""
+    hot = WaterQuality.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    if machine_pks is not None:
+        hot = hot.filter(machine_id__in=machine_pks)
+    hot_rows = (
+        hot.order_by('machine_id', 'timestamp')
+        .values_list('machine_id', 'timestamp', 'tds_level', 'ph_level')
+        .iterator(chunk_size=2000)
+    )
+    for row in merge_with_cold(hot_rows, machine_pks, start, end):
+        if row[1] < end:
+            yield row
+
+
+# ----------------------------------------------------------------------------
+# Builder
+# ----------------------------------------------------------------------------
+
+def get_watermark():
+    return (
+        RollupWatermark.objects
+        .filter(name=WATERMARK_NAME)
+        .values_list('value', flat=True)
+        .first()
+    )
+
+
+def _rollup_from_rows(machine_pk, bucket, rows):
+    tds = Sketch.from_values('tds', [row[2] for row in rows])
+    ph = Sketch.from_values('ph', [row[3] for row in rows])
+    return WaterQualityRollup(
+        machine_id=machine_pk, bucket=bucket, count=len(rows),
+        tds_sum=tds.total, tds_sum_sq=tds.total_sq, tds_min=tds.minimum,
+        tds_max=tds.maximum, tds_hist=pack_hist(tds.hist),
+        ph_sum=ph.total, ph_sum_sq=ph.total_sq, ph_min=ph.minimum,
+        ph_max=ph.maximum, ph_hist=pack_hist(ph.hist),
+        dirty=False,
+    )
+
+
+def build_range(start, end, machine_pks=None):
+    """(Re)build rollup untuk semua jam di [start, end). Return jumlah rollup."""
+    total = 0
+    rollups = []
+    rows = iter_readings(machine_pks, start, end)
+    for (machine_pk, bucket), group in groupby(rows, key=lambda row: (row[0], floor_hour(row[1]))):
+        rollups.append(_rollup_from_rows(machine_pk, bucket, list(group)))
+        if len(rollups) >= 500:
+            _save_rollups(rollups)
+            total += len(rollups)
+            rollups = []
+    _save_rollups(rollups)
+    return total + len(rollups)
+
+
+def _save_rollups(rollups):
+    if not rollups:
+        return
+    WaterQualityRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=['machine', 'bucket'],
+        update_fields=[
+            'count', 'tds_sum', 'tds_sum_sq', 'tds_min', 'tds_max', 'tds_hist',
+            'ph_sum', 'ph_sum_sq', 'ph_min', 'ph_max', 'ph_hist', 'dirty',
+        ],
+    )
+
+
+def build_rollups(now, chunk=timedelta(days=1)):
+    """
+    Bangun rollup untuk semua jam lengkap yang belum diproses, lalu hitung
+    ulang jam yang ditandai dirty. Watermark maju per chunk supaya proses
+    yang terputus bisa dilanjutkan.
+    """
+    until = floor_hour(now)
+    start = get_watermark()
+    if start is None:
+        firsts = [
+            WaterQuality.objects.aggregate(first=Min('timestamp'))['first'],
+            WaterQualityBlock.objects.aggregate(first=Min('start'))['first'],
+        ]
+        firsts = [first for first in firsts if first is not None]
+        start = floor_hour(min(firsts)) if firsts else until
+
+    while start < until:
+        end = min(start + chunk, until)
+        build_range(start, end)
+        RollupWatermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': end})
+        start = end
+
+    dirty = list(WaterQualityRollup.objects.filter(dirty=True).values_list('machine_id', 'bucket'))
+    for machine_pk, bucket in dirty:
+        build_range(bucket, bucket + HOUR, [machine_pk])
+        # Jam yang ternyata kosong (tidak ada rollup baru) dibuang
+        WaterQualityRollup.objects.filter(machine_id=machine_pk, bucket=bucket, dirty=True).delete()
+    return dirty
+
+
+# ----------------------------------------------------------------------------
+# Statistik window
+# ----------------------------------------------------------------------------
+
+def _split_window(start, end, watermark):
+    """
+    Bagi window jadi range jam penuh [full_start, full_end) yang bisa dari
+    rollup, plus range tepi yang harus dari data mentah.
+    """
+    full_start = ceil_hour(start)
+    full_end = max(full_start, min(floor_hour(end), watermark or full_start))
+    raw_ranges = []
+    if start < min(full_start, end):
+        raw_ranges.append((start, min(full_start, end)))
+    if full_end < end:
+        raw_ranges.append((max(full_end, start), end))
+    return full_start, full_end, raw_ranges
+
+
+def compute_statistics(machine_pks, start, end):
+    """
+    Statistik TDS dan pH per mesin untuk window [start, end].
+    Return {machine_pk: {'tds_level': {...}, 'ph_level': {...}}}.
+    """
+    # end inklusif seperti quality_history
+    end = end + timedelta(microseconds=1)
+    full_start, full_end, raw_ranges = _split_window(start, end, get_watermark())
+
+    sketches = {pk: {metric: Sketch(metric) for metric in SKETCH_METRICS} for pk in machine_pks}
+
+    rollups = WaterQualityRollup.objects.filter(
+        machine_id__in=machine_pks, bucket__gte=full_start, bucket__lt=full_end)
+
+    # Momen digabung di database
+    for row in (rollups.filter(dirty=False)
+                .values('machine_id')
+                .annotate(count=Sum('count'), rollups=Count('id'),
+                          tds_sum=Sum('tds_sum'), tds_sum_sq=Sum('tds_sum_sq'),
+                          tds_min=Min('tds_min'), tds_max=Max('tds_max'),
+                          ph_sum=Sum('ph_sum'), ph_sum_sq=Sum('ph_sum_sq'),
+                          ph_min=Min('ph_min'), ph_max=Max('ph_max'))
+                .order_by()):
+        for metric in SKETCH_METRICS:
+            sketch = sketches[row['machine_id']][metric]
+            sketch.count += row['count']
+            sketch.total += row[f'{metric}_sum']
+            sketch.total_sq += row[f'{metric}_sum_sq']
+            sketch.minimum = min(sketch.minimum, row[f'{metric}_min'])
+            sketch.maximum = max(sketch.maximum, row[f'{metric}_max'])
+
+    # Histogram digabung dengan numpy
+    for machine_pk, tds_hist, ph_hist in (rollups.filter(dirty=False)
+                                          .values_list('machine_id', 'tds_hist', 'ph_hist')
+                                          .iterator(chunk_size=1000)):
+        sketches[machine_pk]['tds'].hist += unpack_hist(tds_hist)
+        sketches[machine_pk]['ph'].hist += unpack_hist(ph_hist)
+
+    # Tepi window, jam sesudah watermark, dan jam dirty dihitung dari data mentah
+    for range_start, range_end in raw_ranges:
+        _add_raw(sketches, machine_pks, range_start, range_end)
+    for machine_pk, bucket in rollups.filter(dirty=True).values_list('machine_id', 'bucket'):
+        _add_raw(sketches, [machine_pk], bucket, bucket + HOUR)
+
+    return {
+        machine_pk: {
+            SKETCH_METRICS[metric][0]: sketch.summary()
+            for metric, sketch in metric_sketches.items()
+        }
+        for machine_pk, metric_sketches in sketches.items()
+    }
+
+
+def _add_raw(sketches, machine_pks, start, end):
+    for machine_pk, rows in groupby(iter_readings(machine_pks, start, end), key=lambda row: row[0]):
+        rows = list(rows)
+        sketches[machine_pk]['tds'].merge(Sketch.from_values('tds', [row[2] for row in rows]))
+        sketches[machine_pk]['ph'].merge(Sketch.from_values('ph', [row[3] for row in rows]))
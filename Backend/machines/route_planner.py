@@ -0,0 +1,244 @@
+"""
+Perencanaan rute refill / maintenance untuk kru lapangan.
+
+Mesin yang jatuh tempo (perkiraan tangki kosong dalam window, atau status
+error/maintenance) dikumpulkan, lalu urutan kunjungan dihitung dengan:
+
+    1. nearest neighbour dari depot; tetangga terdekat dicari lewat
+       SpatialGrid (grid sel ukuran tetap) jadi tidak perlu memindai semua
+       titik yang belum dikunjungi,
+    2. perbaikan 2-opt di atas matriks jarak NumPy.
+
+Koordinat diproyeksikan equirectangular ke km di sekitar titik tengah,
+cukup akurat untuk skala kota. Rute dengan stop lebih dari max_stops
+dipotong berurutan lalu tiap potongan dioptimasi ulang dari depot.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import VendingMachine
+
+
+EARTH_RADIUS_KM = 6371.0
+DUE_STATUSES = ('error', 'maintenance')
+DEFAULT_WINDOW = timedelta(hours=24)
+MAX_STOPS = 50
+MAX_PLAN_STOPS = 1000
+
+
+def project(latitudes, longitudes, reference_latitude):
+    """Lat/lon (derajat) -> koordinat x, y dalam km."""
+    scale = math.cos(math.radians(reference_latitude))
+    return np.column_stack([
+        np.radians(longitudes) * EARTH_RADIUS_KM * scale,
+        np.radians(latitudes) * EARTH_RADIUS_KM,
+    ])
+
+
+def distance_matrix(points):
+    diff = points[:, None, :] - points[None, :, :]
+    return np.sqrt(np.square(diff).sum(axis=-1))
+
+
+class SpatialGrid:
+    """Index titik (km) per sel grid untuk pencarian tetangga terdekat."""
+
+    def __init__(self, points, indexes):
+        self.points = points
+        extent = np.ptp(points[indexes], axis=0) if len(indexes) else np.zeros(2)
+        # Rata-rata sekitar satu titik per sel
+        self.cell_size = max(math.sqrt(max(extent[0] * extent[1], 1e-6) / max(len(indexes), 1)), 0.05)
+        self.cells = defaultdict(set)
+        for index in indexes:
+            self.cells[self._cell(points[index])].add(index)
+        self.size = len(indexes)
+
+    def _cell(self, point):
+        return int(point[0] // self.cell_size), int(point[1] // self.cell_size)
+
+    def remove(self, index):
+        cell = self._cell(self.points[index])
+        self.cells[cell].discard(index)
+        if not self.cells[cell]:
+            del self.cells[cell]
+        self.size -= 1
+
+    def _ring(self, cx, cy, ring):
+        if ring == 0:
+            yield cx, cy
+            return
+        for x in range(cx - ring, cx + ring + 1):
+            yield x, cy - ring
+            yield x, cy + ring
+        for y in range(cy - ring + 1, cy + ring):
+            yield cx - ring, y
+            yield cx + ring, y
+
+    def nearest(self, point):
+        if not self.size:
+            return None
+        cx, cy = self._cell(point)
+        max_ring = max(max(abs(x - cx), abs(y - cy)) for x, y in self.cells)
+        best, best_distance = None, math.inf
+        for ring in range(max_ring + 1):
+            for cell in self._ring(cx, cy, ring):
+                for index in self.cells.get(cell, ()):
+                    distance = math.dist(point, self.points[index])
+                    if distance < best_distance:
+                        best, best_distance = index, distance
+            # Titik di ring berikutnya paling dekat berjarak ring * cell_size
+            if best is not None and best_distance <= ring * self.cell_size:
+                break
+        return best
+
+
+def nearest_neighbour(points, start, stops):
+    grid = SpatialGrid(points, stops)
+    order = [start]
+    current = start
+    while grid.size:
+        current = grid.nearest(points[current])
+        grid.remove(current)
+        order.append(current)
+    return np.array(order, dtype=np.int64)
+
+
+def two_opt(order, distances, max_passes=50):
+    """
+    Perbaiki path terbuka (titik awal tetap) dengan membalik segmen
+    order[i..j] selama jaraknya berkurang.
+    """
+    order = order.copy()
+    n = len(order)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            a, b = order[i - 1], order[i]
+            c = order[i + 1:]
+            after = np.r_[order[i + 2:], order[0]]
+            has_next = np.arange(i + 1, n) < n - 1
+            removed = distances[a, b] + np.where(has_next, distances[c, after], 0.0)
+            added = distances[a, c] + np.where(has_next, distances[b, after], 0.0)
+            gain = removed - added
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                j = i + 1 + best
+                order[i:j + 1] = order[i:j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def path_length(order, distances):
+    return float(distances[order[:-1], order[1:]].sum())
+
+
+def due_machines(within, now=None, machine_ids=None, depot=None, radius_km=None):
+    """Mesin dengan koordinat yang perlu dikunjungi, paling mendesak dulu."""
+    now = now or timezone.now()
+    machines = (
+        VendingMachine.objects
+        .filter(latitude__isnull=False, longitude__isnull=False)
+        .filter(Q(refill_forecast__empty_at__lte=now + within) | Q(status__in=DUE_STATUSES))
+    )
+    if machine_ids:
+        machines = machines.filter(machine_id__in=machine_ids)
+    if depot is not None and radius_km is not None:
+        # Bounding box dulu supaya index (latitude, longitude) terpakai
+        lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+        lon_delta = lat_delta / max(math.cos(math.radians(depot[0])), 1e-6)
+        machines = machines.filter(
+            latitude__range=(depot[0] - lat_delta, depot[0] + lat_delta),
+            longitude__range=(depot[1] - lon_delta, depot[1] + lon_delta),
+        )
+    machines = list(
+        machines
+        .order_by(F('refill_forecast__empty_at').asc(nulls_last=True), 'pk')
+        .values('machine_id', 'name', 'location', 'latitude', 'longitude', 'status',
+                'refill_forecast__empty_at')
+    )
+    if depot is not None and radius_km is not None:
+        points = project([m['latitude'] for m in machines], [m['longitude'] for m in machines], depot[0])
+        origin = project([depot[0]], [depot[1]], depot[0])[0]
+        inside = np.hypot(*(points - origin).T) <= radius_km if machines else []
+        machines = [machine for machine, keep in zip(machines, inside) if keep]
+    return machines
+
+
+def _plan(points, start, stops):
+    order = nearest_neighbour(points, start, stops)
+    distances = distance_matrix(points[order])
+    improved = two_opt(np.arange(len(order)), distances)
+    return order[improved], path_length(improved, distances)
+
+
+def plan_routes(machines, depot=None, max_stops=MAX_STOPS, within=None, now=None):
+    """
+    Bagi mesin ke rute-rute berisi paling banyak max_stops stop.
+    Tanpa depot, rute pertama dimulai dari mesin paling mendesak.
+    """
+    if not machines:
+        return []
+    now = now or timezone.now()
+    latitudes = [machine['latitude'] for machine in machines]
+    longitudes = [machine['longitude'] for machine in machines]
+    if depot is not None:
+        latitudes.insert(0, depot[0])
+        longitudes.insert(0, depot[1])
+    points = project(latitudes, longitudes, float(np.mean(latitudes)))
+    offset = 1 if depot is not None else 0
+
+    def start_and_rest(indexes):
+        return (0, indexes) if depot is not None else (indexes[0], indexes[1:])
+
+    # Satu tur untuk semua stop, lalu dipotong per kru
+    order, _ = _plan(points, *start_and_rest(list(range(offset, len(points)))))
+    order = [index for index in order.tolist() if index >= offset]
+
+    routes = []
+    for i in range(0, len(order), max_stops):
+        route, distance = _plan(points, *start_and_rest(order[i:i + max_stops]))
+        routes.append({
+            'distance_km': round(distance, 3),
+            'stops': [_stop(machines[index - offset], now, within) for index in route.tolist() if index >= offset],
+        })
+    return routes
+
+
+def _stop(machine, now, within):
+    empty_at = machine['refill_forecast__empty_at']
+    reasons = []
+    if empty_at is not None and (within is None or empty_at <= now + within):
+        reasons.append('refill')
+    if machine['status'] in DUE_STATUSES:
+        reasons.append(machine['status'])
+    return {
+        'machine_id': machine['machine_id'],
+        'name': machine['name'],
+        'location': machine['location'],
+        'latitude': machine['latitude'],
+        'longitude': machine['longitude'],
+        'status': machine['status'],
+        'empty_at': empty_at,
+        'reasons': reasons,
+    }
+
+
+def parse_depot(value):
+    """'lat,lon' -> (lat, lon). Raise ValueError kalau formatnya salah."""
+    if not value:
+        return None
+    try:
+        latitude, longitude = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError("depot must be 'latitude,longitude'")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("depot is out of range")
+    return latitude, longitude
+
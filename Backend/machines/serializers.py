@@ -1,15 +1,29 @@
+from datetime import timedelta
+
+from django.utils import timezone
 from rest_framework import serializers
-from .models import VendingMachine, WaterQuality, SalesRecord
+from .models import VendingMachine, WaterQuality, SalesRecord, AlertRule, Alert, RefillForecast
+
+# Toleransi jam device yang sedikit lebih cepat dari server
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+class DeviceTimestampMixin:
+    def validate_timestamp(self, value):
+        if value > timezone.now() + MAX_CLOCK_SKEW:
+            raise serializers.ValidationError("Timestamp is in the future")
+        return value
 
-class WaterQualitySerializer(serializers.ModelSerializer):
+
+class WaterQualitySerializer(DeviceTimestampMixin, serializers.ModelSerializer):
     class Meta:
         model = WaterQuality
-        fields = ['id', 'tds_level', 'ph_level', 'water_level', 'timestamp']
+        fields = ['id', 'tds_level', 'ph_level', 'water_level', 'timestamp', 'seq']
 
-class SalesRecordSerializer(serializers.ModelSerializer):
+class SalesRecordSerializer(DeviceTimestampMixin, serializers.ModelSerializer):
     class Meta:
         model = SalesRecord
-        fields = ['id', 'volume', 'price', 'timestamp']
+        fields = ['id', 'volume', 'price', 'timestamp', 'seq']
 
 class VendingMachineSerializer(serializers.ModelSerializer):
     latest_quality = serializers.SerializerMethodField()
@@ -17,7 +31,7 @@ class VendingMachineSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = VendingMachine
-        fields = ['id', 'machine_id', 'name', 'location', 'status', 
+        fields = ['id', 'machine_id', 'name', 'location', 'latitude', 'longitude', 'status',
                  'last_maintenance', 'installation_date', 'latest_quality',
                  'total_sales_today']
 
@@ -33,4 +47,29 @@ class VendingMachineSerializer(serializers.ModelSerializer):
         today = timezone.now().date()
         return obj.sales.filter(
             timestamp__date=today
-        ).aggregate(Sum('volume'))['volume__sum'] or 0
\ No newline at end of file
+        ).aggregate(Sum('volume'))['volume__sum'] or 0
+
+class AlertRuleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AlertRule
+        fields = ['id', 'name', 'machine', 'metric', 'operator', 'threshold',
+                  'duration', 'enabled']
+
+class AlertSerializer(serializers.ModelSerializer):
+    machine_id = serializers.CharField(source='machine.machine_id', read_only=True)
+    rule_name = serializers.CharField(source='rule.name', read_only=True)
+
+    class Meta:
+        model = Alert
+        fields = ['id', 'rule', 'rule_name', 'machine', 'machine_id', 'value',
+                  'triggered_at', 'resolved_at']
+
+class RefillForecastSerializer(serializers.ModelSerializer):
+    machine_id = serializers.CharField(source='machine.machine_id', read_only=True)
+    name = serializers.CharField(source='machine.name', read_only=True)
+    location = serializers.CharField(source='machine.location', read_only=True)
+
+    class Meta:
+        model = RefillForecast
+        fields = ['machine_id', 'name', 'location', 'water_level', 'measured_at',
+                  'rate', 'source', 'empty_at', 'updated_at']
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .alerts import engine as alert_engine
+from .machine_cache import invalidate
+from .models import AlertRule, StatusInterval, VendingMachine
+
+
+@receiver(post_save, sender=VendingMachine)
+def invalidate_machine_cache_on_save(sender, instance, **kwargs):
+    # Berlaku untuk create maupun rename: mapping lama lewat pk dan machine_id
+    # sebelumnya, yang baru lewat machine_id sekarang
+    invalidate(pk=instance.pk, machine_id=instance.machine_id)
+    previous_id = getattr(instance, '_previous_machine_id', None)
+    if previous_id not in (None, instance.machine_id):
+        invalidate(machine_id=previous_id)
+
+
+@receiver(pre_save, sender=VendingMachine)
+def remember_previous_status(sender, instance, raw=False, **kwargs):
+    instance._previous_status = instance._previous_machine_id = None
+    if instance.pk is not None and not raw:
+        instance._previous_status, instance._previous_machine_id = (
+            VendingMachine.objects.filter(pk=instance.pk).values_list('status', 'machine_id').first()
+            or (None, None)
+        )
+
+
+@receiver(post_save, sender=VendingMachine)
+def record_status_transition(sender, instance, created, raw=False, **kwargs):
+    # Catatan: queryset.update(status=...) tidak lewat signal ini
+    if raw:
+        return
+    if created or instance.status != getattr(instance, '_previous_status', instance.status):
+        StatusInterval.objects.create(machine=instance, status=instance.status)
+
+
+@receiver(post_delete, sender=VendingMachine)
+def invalidate_machine_cache_on_delete(sender, instance, **kwargs):
+    invalidate(pk=instance.pk, machine_id=instance.machine_id)
+
+
+@receiver(post_save, sender=AlertRule)
+@receiver(post_delete, sender=AlertRule)
+def rebuild_alert_index(sender, **kwargs):
+    alert_engine.invalidate()
@@ -0,0 +1,14 @@
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class DashboardStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """
+    Nama file ber-hash + varian gzip/brotli. Referensi di dalam file JS tidak
+    ditulis ulang: library vendor di js/lib/ memuat sourceMappingURL ke file
+    .map yang tidak ikut didistribusikan.
+    """
+    patterns = tuple(
+        (pattern, substitutions)
+        for pattern, substitutions in CompressedManifestStaticFilesStorage.patterns
+        if pattern != '*.js'
+    )
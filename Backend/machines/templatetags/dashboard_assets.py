@@ -0,0 +1,68 @@
+import os
+
+from django import template
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestFilesMixin, staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+register = template.Library()
+
+COMPILED_CSS = 'css/dashboard.css'
+RUNTIME_JS = 'css/tailwind.js'
+# Hasil minify build_assets; source aslinya tetap dipakai kalau belum di-build
+MINIFIED_JS = {'js/api.js': 'js/api.min.js'}
+
+
+def _manifest_mtime(storage):
+    try:
+        return os.path.getmtime(storage.manifest_storage.path(storage.manifest_name))
+    except (OSError, NotImplementedError):
+        return None
+
+
+def asset_available(path):
+    """
+    Dicek per request, tidak di-memo: proses yang start sebelum build_assets
+    harus ikut pindah ke asset hasil build tanpa restart.
+
+    Dengan manifest storage, asset hanya dipakai kalau ada di manifest (kalau
+    tidak, static() error). Manifest di-load storage sekali saat start, jadi
+    dibaca ulang kalau file-nya berubah — hanya selama asset belum ada di
+    manifest, supaya halaman yang sudah benar tidak pindah ke nama ber-hash
+    baru yang belum dikenal WhiteNoise tanpa autorefresh.
+    """
+    if isinstance(staticfiles_storage, ManifestFilesMixin):
+        if path not in staticfiles_storage.hashed_files:
+            mtime = _manifest_mtime(staticfiles_storage)
+            if mtime is not None and mtime != getattr(staticfiles_storage, '_manifest_mtime', None):
+                staticfiles_storage.hashed_files, staticfiles_storage.manifest_hash = staticfiles_storage.load_manifest()
+                staticfiles_storage._manifest_mtime = mtime
+        return path in staticfiles_storage.hashed_files
+    # Sesudah collectstatic file ada di STATIC_ROOT, saat development cukup di STATICFILES_DIRS
+    try:
+        if staticfiles_storage.exists(path):
+            return True
+    except Exception:
+        pass
+    return finders.find(path) is not None
+
+
+@register.simple_tag
+def dashboard_css():
+    """
+    <link> ke CSS hasil build_assets (nama ber-hash lewat staticfiles storage).
+    Kalau belum pernah di-build, fallback ke Tailwind runtime di browser.
+    """
+    if asset_available(COMPILED_CSS):
+        return format_html('<link rel="stylesheet" href="{}">', static(COMPILED_CSS))
+    return format_html('<script src="{}"></script>', static(RUNTIME_JS))
+
+
+@register.simple_tag
+def dashboard_js(path):
+    """<script> ke versi minify hasil build_assets kalau ada, kalau belum ke source aslinya."""
+    minified = MINIFIED_JS.get(path)
+    if minified and asset_available(minified):
+        path = minified
+    return format_html('<script src="{}"></script>', static(path))
@@ -1,3 +1,682 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.http import QueryDict
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.template.loader import render_to_string
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import export as parquet_export
+from .alerts import AlertEngine
+from .cards import render_cards
+from .coldstorage import pack_machine
+from .forecast import forecast_refills, running_dry
+from .heatmap import build_heatmap
+from .history import InvalidTimeRange, parse_time_range
+from .ingest import MachineGone, ingest_atomic, mark_rollups_dirty, save_batch
+from .machine_cache import local_cache, resolve_machine_pk
+from .management.periodic import PeriodicCommand
+from .models import Alert, AlertRule, RefillForecast, StatusInterval, VendingMachine, WaterQuality, WaterQualityBlock
+from .rollups import Sketch, build_rollups, compute_statistics
+from .throttling import _machine_buckets, ingest_metrics, reset_throttle_state
+from .uptime import compute_uptime
+
+
+UTC = dt_timezone.utc
+
+# Cache file di settings dipakai bersama antar proses; test memakai locmem
+TEST_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'test-{alias}'}
+    for alias in ('default', 'machine_ids', 'machine_cards')
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MachinesTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+        local_cache.clear()
+        reset_throttle_state()
+
+
+def make_machine(machine_id='VM001', **kwargs):
+    return VendingMachine.objects.create(machine_id=machine_id, name=machine_id, location='Test', **kwargs)
+
+
+class ParseTimeRangeTests(MachinesTestCase):
+    def test_naive_values_become_aware(self):
+        start, end = parse_time_range(QueryDict('start_date=2026-09-01T00:00:00&end_date=2026-09-02T00:00:00'))
+        self.assertEqual(start, datetime(2026, 9, 1, tzinfo=UTC))
+        self.assertEqual(end, datetime(2026, 9, 2, tzinfo=UTC))
+
+    def test_offset_is_kept(self):
+        start, _ = parse_time_range(QueryDict('start_date=2026-09-01T07:00:00%2B07:00'))
+        self.assertEqual(start, datetime(2026, 9, 1, tzinfo=UTC))
+
+    def test_default_is_last_24_hours(self):
+        start, end = parse_time_range(QueryDict())
+        self.assertEqual(end - start, timedelta(hours=24))
+        self.assertTrue(timezone.is_aware(start))
+
+    def test_invalid_input_rejected(self):
+        for query in ('start_date=yesterday', 'end_date=2026-13-01',
+                      'start_date=2026-09-02T00:00:00&end_date=2026-09-01T00:00:00'):
+            with self.subTest(query=query), self.assertRaises(InvalidTimeRange):
+                parse_time_range(QueryDict(query))
+
+
+class TimeRangeEndpointTests(MachinesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.machine = make_machine()
+        WaterQuality.objects.create(machine=self.machine, tds_level=100, ph_level=7, water_level=50,
+                                    timestamp=datetime(2026, 9, 1, 12, tzinfo=UTC))
+
+    def test_naive_dates_accepted(self):
+        query = '?start_date=2026-09-01T00:00:00&end_date=2026-09-02T00:00:00'
+        for url in ('/api/machines/VM001/quality-history/',
+                    '/api/machines/VM001/statistics/',
+                    '/api/machines/batch-statistics/?machine_ids=VM001&' + query[1:],
+                    '/api/machines/heatmap/?metric=tds_level&' + query[1:],
+                    '/api/machines/uptime/',
+                    '/api/machines/VM001/uptime/'):
+            if '?' not in url:
+                url += query
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_bad_range_is_400(self):
+        response = self.client.get('/api/machines/VM001/statistics/?start_date=nope')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'start_date must be an ISO 8601 datetime'})
+
+        response = self.client.get('/api/machines/uptime/'
+                                   '?start_date=2026-09-02T00:00:00&end_date=2026-09-01T00:00:00')
+        self.assertEqual(response.status_code, 400)
+
+
+class StatisticsTests(MachinesTestCase):
+    """Gabungan rollup + data mentah harus sama dengan hitung ulang dari data mentah saja."""
+
+    def setUp(self):
+        super().setUp()
+        self.machine = make_machine()
+        self.base = datetime(2026, 9, 1, 8, tzinfo=UTC)
+        # 8 jam, satu pembacaan tiap 5 menit dengan nilai yang bervariasi
+        self.add_readings(self.base, 8 * 12)
+
+    def add_readings(self, start, count, offset=0):
+        WaterQuality.objects.bulk_create([
+            WaterQuality(machine=self.machine, timestamp=start + timedelta(minutes=5 * i),
+                         tds_level=100 + (i * 37 + offset) % 400, ph_level=6 + ((i * 13 + offset) % 30) / 10,
+                         water_level=50)
+            for i in range(count)
+        ])
+
+    def raw_statistics(self, start, end):
+        rows = WaterQuality.objects.filter(machine=self.machine, timestamp__range=(start, end))
+        return {
+            'tds_level': Sketch.from_values('tds', [row.tds_level for row in rows]).summary(),
+            'ph_level': Sketch.from_values('ph', [row.ph_level for row in rows]).summary(),
+        }
+
+    def assertStatisticsEqual(self, actual, expected):
+        for metric, summary in expected.items():
+            self.assertEqual(actual[metric].keys(), summary.keys())
+            for name, value in summary.items():
+                with self.subTest(metric=metric, stat=name):
+                    self.assertAlmostEqual(actual[metric][name], value, places=6)
+
+    def test_rollup_and_raw_match_raw_only(self):
+        # Watermark di 13:00, jam sesudahnya belum punya rollup
+        build_rollups(datetime(2026, 9, 1, 13, tzinfo=UTC))
+        # Data terlambat membuat jam 10:00 dirty
+        late = datetime(2026, 9, 1, 10, 2, tzinfo=UTC)
+        self.add_readings(late, 6, offset=5)
+        mark_rollups_dirty(self.machine.pk, [late], now=datetime(2026, 9, 1, 16, tzinfo=UTC))
+
+        # Tepi window memotong jam 08:00 dan jam 15:00
+        start = datetime(2026, 9, 1, 8, 20, tzinfo=UTC)
+        end = datetime(2026, 9, 1, 15, 40, tzinfo=UTC)
+        stats = compute_statistics([self.machine.pk], start, end)[self.machine.pk]
+        self.assertStatisticsEqual(stats, self.raw_statistics(start, end))
+        self.assertGreater(stats['tds_level']['count'], 0)
+
+    def test_window_inside_one_hour(self):
+        build_rollups(datetime(2026, 9, 1, 16, tzinfo=UTC))
+        start = datetime(2026, 9, 1, 9, 10, tzinfo=UTC)
+        end = datetime(2026, 9, 1, 9, 50, tzinfo=UTC)
+        stats = compute_statistics([self.machine.pk], start, end)[self.machine.pk]
+        self.assertStatisticsEqual(stats, self.raw_statistics(start, end))
+
+    def test_statistics_endpoint_with_naive_dates(self):
+        build_rollups(datetime(2026, 9, 1, 13, tzinfo=UTC))
+        response = APIClient().get('/api/machines/VM001/statistics/'
+                                   '?start_date=2026-09-01T08:20:00&end_date=2026-09-01T15:40:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['tds_level']['count'], 89)
+
+
+class HeatmapTests(MachinesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.machine = make_machine()
+        self.start = datetime(2026, 9, 1, 0, tzinfo=UTC)
+        # Jam ke-h: 4 pembacaan dengan rata-rata TDS 100 + 10h
+        WaterQuality.objects.bulk_create([
+            WaterQuality(machine=self.machine, timestamp=self.start + timedelta(hours=hour, minutes=15 * i),
+                         tds_level=100 + 10 * hour + (i - 1.5), ph_level=7, water_level=50)
+            for hour in range(6) for i in range(4)
+        ])
+        self.expected = [100 + 10 * hour for hour in range(6)]
+
+    def tds_row(self):
+        _, start, matrix = build_heatmap('tds_level', self.start, self.start + timedelta(hours=5, minutes=59))
+        self.assertEqual(start, self.start)
+        return matrix[0].tolist()
+
+    def test_packed_hours_without_watermark(self):
+        pack_machine(self.machine.pk, self.start + timedelta(hours=3))
+        self.assertEqual(WaterQualityBlock.objects.count(), 3)
+        self.assertEqual(self.tds_row(), self.expected)
+
+    def test_packed_hours_after_watermark_and_dirty_hours(self):
+        build_rollups(self.start + timedelta(hours=2))
+        pack_machine(self.machine.pk, self.start + timedelta(hours=4))
+        # Jam 1 sudah di-rollup lalu kena data terlambat
+        late = self.start + timedelta(hours=1, minutes=50)
+        WaterQuality.objects.create(machine=self.machine, timestamp=late, tds_level=210,
+                                    ph_level=7, water_level=50)
+        mark_rollups_dirty(self.machine.pk, [late], now=self.start + timedelta(hours=8))
+        expected = list(self.expected)
+        expected[1] = (110 * 4 + 210) / 5
+        self.assertEqual(self.tds_row(), expected)
+
+    def test_endpoint_with_naive_dates(self):
+        build_rollups(self.start + timedelta(hours=2))
+        response = APIClient().get('/api/machines/heatmap/?metric=tds_level'
+                                   '&start_date=2026-09-01T00:00:00&end_date=2026-09-01T05:00:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['values'], [self.expected])
+
+
+class UptimeTests(MachinesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.machine = make_machine()
+        # Interval dari signal saat mesin dibuat jatuh di luar window test
+        StatusInterval.objects.all().delete()
+        self.day = datetime(2026, 9, 1, tzinfo=UTC)
+
+    def at(self, hours):
+        return self.day + timedelta(hours=hours)
+
+    def add_intervals(self, machine, *intervals):
+        StatusInterval.objects.bulk_create([
+            StatusInterval(machine=machine, status=status, start=self.at(hours))
+            for hours, status in intervals
+        ])
+
+    def test_intervals_clipped_to_window(self):
+        self.add_intervals(self.machine, (8, 'online'), (11, 'error'), (11.5, 'online'),
+                           (13, 'maintenance'), (15, 'offline'))
+        counter = compute_uptime([self.machine.pk], self.at(10), self.at(14), now=self.at(20))[self.machine.pk]
+        self.assertEqual(dict(counter.seconds), {'online': 9000.0, 'error': 1800.0, 'maintenance': 3600.0})
+        summary = counter.summary()
+        self.assertEqual(summary['observed_seconds'], 4 * 3600)
+        self.assertEqual(summary['downtime_incidents'], 1)
+        self.assertEqual(summary['uptime'], 62.5)
+        self.assertEqual(summary['sla'], round(9000 / 10800 * 100, 4))
+
+    def test_open_interval_ends_at_now(self):
+        self.add_intervals(self.machine, (8, 'offline'))
+        counter = compute_uptime([self.machine.pk], self.at(10), self.at(14), now=self.at(12))[self.machine.pk]
+        self.assertEqual(dict(counter.seconds), {'offline': 7200.0})
+        self.assertEqual(counter.incidents, 1)
+
+    def test_history_starting_inside_window(self):
+        other = make_machine('VM002')
+        StatusInterval.objects.filter(machine=other).delete()
+        self.add_intervals(other, (11, 'online'), (16, 'error'))
+        counters = compute_uptime(None, self.at(10), self.at(14), now=self.at(20))
+        self.assertEqual(dict(counters[other.pk].seconds), {'online': 3 * 3600.0})
+        self.assertNotIn(self.machine.pk, counters)
+
+    def test_endpoint_with_naive_dates(self):
+        self.add_intervals(self.machine, (8, 'online'), (11, 'error'), (12, 'online'))
+        response = APIClient().get('/api/machines/VM001/uptime/'
+                                   '?start_date=2026-09-01T10:00:00&end_date=2026-09-01T14:00:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['seconds_by_status'], {'online': 3 * 3600.0, 'error': 3600.0})
+
+
+class MachineIdCacheTests(MachinesTestCase):
+    def test_rename_in_other_worker_is_not_misattributed(self):
+        old = make_machine('VM001')
+        self.assertEqual(resolve_machine_pk('VM001'), old.pk)
+        old.machine_id = 'VM001-OLD'
+        old.save()
+        new = make_machine('VM001')
+        # LRU worker lain masih memegang mapping lama
+        local_cache.set('VM001', old.pk)
+        self.assertEqual(resolve_machine_pk('VM001'), new.pk)
+        self.assertEqual(resolve_machine_pk('VM001-OLD'), old.pk)
+
+    def test_delete_is_seen_through_shared_cache(self):
+        machine = make_machine('VM001')
+        self.assertEqual(resolve_machine_pk('VM001'), machine.pk)
+        machine.delete()
+        local_cache.set('VM001', machine.pk)
+        self.assertIsNone(resolve_machine_pk('VM001'))
+
+    def test_invalidated_again_after_commit(self):
+        machine = make_machine('VM001')
+        with self.captureOnCommitCallbacks(execute=True):
+            machine.machine_id = 'VM002'
+            machine.save()
+            # Worker lain membaca data yang belum di-commit lalu menyimpannya lagi
+            caches['machine_ids'].set('machines:id:VM001', machine.pk)
+        self.assertIsNone(resolve_machine_pk('VM001'))
+
+    @override_settings(MACHINE_ID_CACHE={'SHARED_CACHE': None, 'LOCAL_TIMEOUT': 0})
+    def test_local_entries_expire_without_shared_cache(self):
+        machine = make_machine('VM001')
+        local_cache.set('VM001', 12345)
+        self.assertEqual(resolve_machine_pk('VM001'), machine.pk)
+
+
+class AlertEngineTests(MachinesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.machine = make_machine()
+        self.rule = AlertRule.objects.create(name='pH rendah', metric='ph_level', operator='lt', threshold=6.5)
+        self.engine = AlertEngine()
+        self.t0 = datetime(2026, 9, 1, 8, tzinfo=UTC)
+
+    def evaluate(self, engine, *ph_values, minute=0):
+        return engine.evaluate(self.machine.pk, [
+            ({'ph_level': ph}, self.t0 + timedelta(minutes=minute + i)) for i, ph in enumerate(ph_values)
+        ])
+
+    def active_alerts(self):
+        return Alert.objects.filter(resolved_at__isnull=True)
+
+    def test_trigger_and_resolve_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluate(self.engine, 6.0, 6.1)
+            # Belum commit: belum ada alert di database
+            self.assertEqual(Alert.objects.count(), 0)
+        self.assertEqual(self.active_alerts().count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluate(self.engine, 7.0, minute=5)
+        self.assertEqual(self.active_alerts().count(), 0)
+        self.assertEqual(Alert.objects.get().resolved_at, self.t0 + timedelta(minutes=5))
+
+    def test_trigger_and_resolve_in_one_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluate(self.engine, 6.0, 7.0)
+        alert = Alert.objects.get()
+        self.assertEqual(alert.resolved_at, self.t0 + timedelta(minutes=1))
+
+    def test_rolled_back_trigger_fires_again(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.evaluate(self.engine, 6.0)
+                    raise IngestRolledBack()
+            except IngestRolledBack:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(Alert.objects.count(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluate(self.engine, 6.0, minute=1)
+        self.assertEqual(self.active_alerts().count(), 1)
+
+    def test_parallel_workers_create_one_alert(self):
+        other = AlertEngine()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluate(self.engine, 6.0)
+            self.evaluate(other, 6.0)
+        self.assertEqual(self.active_alerts().count(), 1)
+
+        # Worker lain menganggap alert yang sama aktif dan bisa menutupnya
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluate(other, 7.0, minute=3)
+        self.assertEqual(self.active_alerts().count(), 0)
+
+    @override_settings(ALERT_ENGINE={'RELOAD_INTERVAL': 0})
+    def test_rule_changes_from_other_workers_are_reloaded(self):
+        self.evaluate(self.engine, 7.0)
+        # Update massal tidak memicu signal, seperti perubahan di worker lain
+        AlertRule.objects.filter(pk=self.rule.pk).update(threshold=7.5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evaluate(self.engine, 7.0, minute=1)
+        self.assertEqual(self.active_alerts().count(), 1)
+
+
+class IngestRolledBack(Exception):
+    """Pengganti error apa pun yang membuat transaksi ingest di-rollback."""
+
+
+def reading(seq=None, **kwargs):
+    data = {'tds_level': 100, 'ph_level': 7, 'water_level': 50,
+            'timestamp': '2026-09-01T08:00:00Z', **kwargs}
+    if seq is not None:
+        data['seq'] = seq
+    return data
+
+
+class BatchIngestTests(MachinesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.machine = make_machine()
+        self.url = '/api/machines/VM001/record_quality/'
+
+    def post(self, data, url=None):
+        return self.client.post(url or self.url, data, format='json')
+
+    def test_duplicates_counted_not_accepted(self):
+        response = self.post([reading(seq) for seq in range(5)])
+        self.assertEqual(response.json(), {'accepted': 5, 'duplicates': 0})
+        # Upload ulang sebagian plus seq dobel di dalam batch
+        response = self.post([reading(seq) for seq in (3, 4, 5, 5, 6)])
+        self.assertEqual(response.json(), {'accepted': 2, 'duplicates': 3})
+        self.assertEqual(WaterQuality.objects.count(), 7)
+
+    def test_parallel_upload_conflict_counted_as_duplicate(self):
+        items = [{'tds_level': 1, 'ph_level': 7, 'water_level': 5, 'seq': seq} for seq in range(4)]
+
+        def parallel_insert(model, machine_pk, items):
+            # Upload paralel memasukkan seq 1 dan 2 sesudah cek seq awal, sebelum insert
+            for seq in (1, 2):
+                WaterQuality.objects.create(machine_id=machine_pk, tds_level=1, ph_level=7, water_level=5, seq=seq)
+            return set()
+
+        with mock.patch('machines.ingest._packed_replays', parallel_insert):
+            created, duplicates = save_batch(WaterQuality, self.machine.pk, items)
+        self.assertEqual([obj.seq for obj in created], [0, 3])
+        self.assertEqual(duplicates, 2)
+        self.assertTrue(all(obj.pk for obj in created))
+        self.assertEqual(WaterQuality.objects.count(), 4)
+
+    def test_packed_replay_is_duplicate(self):
+        self.post([reading(seq, timestamp=f'2026-09-01T08:{seq:02d}:00Z') for seq in range(10)])
+        pack_machine(self.machine.pk, datetime(2026, 9, 1, 10, tzinfo=UTC))
+        self.assertEqual(WaterQuality.objects.count(), 0)
+        response = self.post([reading(seq, timestamp=f'2026-09-01T08:{seq:02d}:00Z') for seq in (4, 5, 10)])
+        self.assertEqual(response.json(), {'accepted': 1, 'duplicates': 2})
+
+    def test_deleted_machine_in_other_worker_is_404(self):
+        gone = make_machine('VM009')
+        # Worker ini masih memegang pk lama di cache bersama
+        caches['machine_ids'].set('machines:id:VM009', gone.pk)
+        VendingMachine.objects.filter(pk=gone.pk).delete()
+        for data in ([reading(1), reading(2)], reading(3)):
+            with self.subTest(data=data):
+                response = self.post(data, url='/api/machines/VM009/record_quality/')
+                self.assertEqual(response.status_code, 404)
+        self.assertEqual(WaterQuality.objects.count(), 0)
+
+    def test_other_integrity_errors_are_not_machine_gone(self):
+        with self.assertRaises(MachineGone):
+            with ingest_atomic(12345):
+                raise IntegrityError('FOREIGN KEY constraint failed')
+        with self.assertRaises(IntegrityError):
+            with ingest_atomic(self.machine.pk):
+                raise IntegrityError('UNIQUE constraint failed')
+
+
+@override_settings(INGEST_THROTTLE={'MACHINE_RATE': 1.0, 'MACHINE_BURST': 30,
+                                    'FLEET_RATE': 500.0, 'FLEET_BURST': 1000, 'MAX_BUCKETS': 2})
+class TelemetryThrottleTests(MachinesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        make_machine('VM001')
+
+    def post(self, data, machine_id='VM001'):
+        return self.client.post(f'/api/machines/{machine_id}/record_quality/', data, format='json')
+
+    def test_batch_is_charged_per_record(self):
+        response = self.post([reading(seq) for seq in range(100)])
+        self.assertEqual(response.status_code, 200)
+        # Bucket berutang 70 token: request berikutnya ditolak sampai terbayar
+        response = self.post(reading(100))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 70)
+        self.assertEqual(ingest_metrics.snapshot()['telemetry'],
+                         {'admitted': 1, 'throttled': 1, 'shed': 0})
+
+    def test_single_readings_limited_to_burst(self):
+        statuses = [self.post(reading(seq)).status_code for seq in range(31)]
+        self.assertEqual(statuses.count(200), 30)
+        self.assertEqual(statuses[-1], 429)
+
+    def test_unknown_machines_get_no_bucket(self):
+        for i in range(5):
+            self.assertEqual(self.post(reading(i), machine_id=f'junk{i}').status_code, 404)
+        self.assertEqual(len(_machine_buckets), 0)
+
+    @override_settings(INGEST_THROTTLE={'FLEET_RATE': 0.001, 'FLEET_BURST': 2})
+    def test_sales_admitted_while_fleet_sheds_telemetry(self):
+        statuses = [self.post(reading(seq)).status_code for seq in range(3)]
+        self.assertEqual(statuses, [200, 200, 503])
+        response = self.client.post('/api/machines/VM001/record_sale/',
+                                    {'volume': 500, 'price': '2000.00', 'seq': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ingest_metrics.snapshot(),
+                         {'telemetry': {'admitted': 2, 'throttled': 0, 'shed': 1}, 'sales': {'admitted': 1}})
+
+    def test_buckets_bounded(self):
+        for machine_id in ('VM002', 'VM003', 'VM004'):
+            make_machine(machine_id)
+            self.post(reading(1), machine_id=machine_id)
+        self.assertEqual(len(_machine_buckets), 2)
+
+
+class MachineCardTests(MachinesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.machine = make_machine(status='online')
+
+    def render(self):
+        with mock.patch('machines.cards.render_to_string', wraps=render_to_string) as render:
+            html = render_cards(VendingMachine.objects.order_by('pk'))
+        return html, render.call_count
+
+    def test_ingest_does_not_touch_card_cache(self):
+        with mock.patch.object(caches['machine_cards'], 'set') as cache_set, \
+                mock.patch.object(caches['machine_cards'], 'set_many') as cache_set_many:
+            with self.captureOnCommitCallbacks(execute=True):
+                APIClient().post('/api/machines/VM001/record_quality/', reading(1), format='json')
+        cache_set.assert_not_called()
+        cache_set_many.assert_not_called()
+
+    def test_rerendered_only_when_visible_fields_change(self):
+        self.assertEqual(self.render()[1], 1)
+        self.assertEqual(self.render()[1], 0)
+
+        WaterQuality.objects.create(machine=self.machine, tds_level=123, ph_level=7, water_level=50)
+        html, renders = self.render()
+        self.assertEqual(renders, 1)
+        self.assertIn('123', html)
+
+        # Pembacaan baru dengan nilai yang sama tidak mengubah kartu
+        WaterQuality.objects.create(machine=self.machine, tds_level=123, ph_level=7, water_level=50)
+        self.assertEqual(self.render()[1], 0)
+
+        # Rename lewat queryset (tanpa signal, seperti dari worker lain) tetap terlihat
+        VendingMachine.objects.filter(pk=self.machine.pk).update(name='Lobby')
+        html, renders = self.render()
+        self.assertEqual(renders, 1)
+        self.assertIn('Lobby', html)
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_machine_list_page(self):
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.machine.name)
+
+
+class DashboardAssetTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        settings_override = override_settings(STATIC_ROOT=self.root.name, STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'},
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_manifest(self, paths, mtime):
+        path = os.path.join(self.root.name, 'staticfiles.json')
+        with open(path, 'w') as f:
+            json.dump({'version': '1.1', 'paths': paths, 'hash': ''}, f)
+        os.utime(path, (mtime, mtime))
+
+    def render(self):
+        return Template("{% load dashboard_assets %}{% dashboard_css %}{% dashboard_js 'js/api.js' %}").render(Context())
+
+    def test_switches_to_built_assets_without_restart(self):
+        self.write_manifest({'css/tailwind.js': 'css/tailwind.1.js', 'js/api.js': 'js/api.1.js'}, 1000)
+        html = self.render()
+        self.assertIn('css/tailwind.1.js', html)
+        self.assertIn('js/api.1.js', html)
+
+        # build_assets + collectstatic sesudah proses start
+        self.write_manifest({
+            'css/tailwind.js': 'css/tailwind.1.js', 'js/api.js': 'js/api.1.js',
+            'css/dashboard.css': 'css/dashboard.2.css', 'js/api.min.js': 'js/api.min.3.js',
+        }, 2000)
+        html = self.render()
+        self.assertIn('<link rel="stylesheet" href="/static/css/dashboard.2.css">', html)
+        self.assertIn('js/api.min.3.js', html)
+        self.assertNotIn('tailwind', html)
+
+
+class RefillForecastTests(MachinesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = datetime(2026, 9, 1, 12, tzinfo=UTC)
+
+    def add_levels(self, machine, end, levels):
+        WaterQuality.objects.bulk_create([
+            WaterQuality(machine=machine, timestamp=end - timedelta(hours=len(levels) - 1 - i),
+                         tds_level=100, ph_level=7, water_level=level)
+            for i, level in enumerate(levels)
+        ])
+
+    def test_machine_that_stops_reporting_loses_forecast(self):
+        reporting, silent = make_machine('VM001'), make_machine('VM002')
+        self.add_levels(reporting, self.now, [50, 45, 40, 35])
+        self.add_levels(silent, self.now, [20, 15, 10, 5])
+        self.assertEqual(forecast_refills(self.now), 2)
+        self.assertEqual(set(running_dry(timedelta(hours=24), now=self.now).values_list('machine_id', flat=True)),
+                         {reporting.pk, silent.pk})
+
+        # Sehari kemudian hanya VM001 yang masih melapor
+        later = self.now + timedelta(days=1)
+        self.add_levels(reporting, later, [50, 45, 40, 35])
+        self.assertEqual(forecast_refills(later), 1)
+        self.assertEqual(list(RefillForecast.objects.values_list('machine_id', flat=True)), [reporting.pk])
+
+        self.assertEqual(forecast_refills(later + timedelta(days=1)), 0)
+        self.assertFalse(RefillForecast.objects.exists())
+
+
+class ParquetExportTests(MachinesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        settings_override = override_settings(PARQUET_EXPORT_ROOT=self.root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.machine = make_machine('VM001')
+        self.url = '/api/export/parquet/water_quality/VM001/2026-09/'
+        start = datetime(2026, 9, 1, tzinfo=UTC)
+        WaterQuality.objects.bulk_create([
+            WaterQuality(machine=self.machine, timestamp=start + timedelta(hours=i),
+                         tds_level=100 + i, ph_level=7, water_level=50)
+            for i in range(5)
+        ])
+
+    def export(self):
+        return parquet_export.export(datasets=['water_quality'])
+
+    def test_get_serves_only_exported_partitions(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(os.listdir(self.root.name), [])
+
+        self.assertEqual(self.export()['written'], ['water_quality/month=2026-09/machine_id=VM001'])
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_in_place_edit_and_delete_insert_trigger_rewrite(self):
+        self.export()
+        self.assertEqual(self.export()['written'], [])
+
+        WaterQuality.objects.filter(tds_level=102).update(tds_level=250)
+        self.assertEqual(len(self.export()['written']), 1)
+
+        # Delete+insert di timestamp yang sama: count dan rentang timestamp tetap
+        reading = WaterQuality.objects.get(tds_level=101)
+        reading.delete()
+        WaterQuality.objects.create(machine=self.machine, timestamp=reading.timestamp,
+                                    tds_level=101, ph_level=7, water_level=50)
+        self.assertEqual(len(self.export()['written']), 1)
+
+
+class StopLoop(Exception):
+    pass
+
+
+class CountingCommand(PeriodicCommand):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.runs = []
+
+    def run_once(self, **options):
+        self.runs.append(options['loop'])
+
+
+class PeriodicCommandTests(SimpleTestCase):
+    def test_run_once_is_required(self):
+        with self.assertRaises(TypeError):
+            type('Command', (PeriodicCommand,), {})()
+
+    def test_without_loop_runs_once(self):
+        command = CountingCommand()
+        with mock.patch('machines.management.periodic.time.sleep') as sleep:
+            call_command(command)
+        self.assertEqual(command.runs, [0])
+        sleep.assert_not_called()
+
+    def test_loop_sleeps_interval_between_runs(self):
+        command = CountingCommand()
+        with mock.patch('machines.management.periodic.time.sleep', side_effect=[None, None, StopLoop]) as sleep, \
+                mock.patch('machines.management.periodic.close_old_connections') as close:
+            with self.assertRaises(StopLoop):
+                call_command(command, '--loop', '30')
+        self.assertEqual(command.runs, [30, 30, 30])
+        self.assertEqual(sleep.call_args_list, [mock.call(30)] * 3)
+        self.assertEqual(close.call_count, 3)
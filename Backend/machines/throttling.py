@@ -0,0 +1,180 @@
+"""
+Throttling ingest dengan dua jalur prioritas:
+
+- sales     : record_sale selalu diterima (hanya dihitung untuk metrics)
+- telemetry : record_quality dibatasi token bucket per mesin (429) dan token
+              bucket seluruh fleet (503) supaya backlog yang di-replay
+              bersamaan setelah jaringan putus tidak membuat backend macet.
+              Satu token = satu pembacaan, jadi batch dibayar sesuai isinya.
+              Batch boleh membuat bucket berutang; request berikutnya
+              ditolak sampai utangnya terbayar, sehingga rata-ratanya tetap
+              MACHINE_RATE pembacaan/detik.
+
+State bucket dan counter ada di memori proses (per worker). Bucket per mesin
+dikunci dengan pk hasil resolve_machine_pk, bukan machine_id mentah dari URL,
+dan dibatasi MAX_BUCKETS (LRU) supaya id sembarang tidak menumpuk di memori.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+from .machine_cache import resolve_machine_pk
+
+
+DEFAULT_INGEST_THROTTLE = {
+    # Pembacaan/detik. Sensor kirim tiap ~2 detik, beri ruang 2x plus burst untuk replay kecil
+    'MACHINE_RATE': 1.0,
+    'MACHINE_BURST': 30,
+    # Kapasitas telemetry seluruh fleet per proses (pembacaan/detik)
+    'FLEET_RATE': 500.0,
+    'FLEET_BURST': 1000,
+    # Jumlah bucket per mesin yang disimpan, yang paling lama tidak dipakai dibuang
+    'MAX_BUCKETS': 10000,
+}
+
+
+def throttle_setting(name):
+    return getattr(settings, 'INGEST_THROTTLE', {}).get(name, DEFAULT_INGEST_THROTTLE[name])
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now, count=1):
+        """
+        Ambil count token. Diterima selama masih ada minimal satu token (sisanya
+        jadi utang). Return 0 kalau diterima, selain itu detik sampai token tersedia.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= count
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self, count=1):
+        self.tokens = min(self.capacity, self.tokens + count)
+
+
+class IngestMetrics:
+    LANES = {
+        'telemetry': ('admitted', 'throttled', 'shed'),
+        'sales': ('admitted',),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = {lane: dict.fromkeys(names, 0) for lane, names in self.LANES.items()}
+
+    def incr(self, lane, name):
+        with self._lock:
+            self._counts[lane][name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {lane: dict(counts) for lane, counts in self._counts.items()}
+
+
+ingest_metrics = IngestMetrics()
+
+_lock = threading.Lock()
+_machine_buckets = OrderedDict()
+_fleet_bucket = None
+
+
+class ServiceOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Telemetry ingest is overloaded, retry later.'
+    default_code = 'overloaded'
+
+    def __init__(self, wait):
+        super().__init__()
+        # exception_handler DRF memakai atribut ini untuk header Retry-After
+        self.wait = max(1, math.ceil(wait))
+
+
+class TelemetryIngestThrottle(BaseThrottle):
+    """Jalur telemetry: 429 kalau mesin melebihi rate-nya, 503 kalau fleet overload."""
+
+    def __init__(self):
+        self._wait = None
+
+    def allow_request(self, request, view):
+        global _fleet_bucket
+
+        machine_id = view.kwargs.get('machine_id')
+        if machine_id is not None:
+            # Mesin yang tidak ada tidak dapat bucket; view-nya membalas 404,
+            # tapi request-nya tetap dihitung di bucket fleet
+            key = resolve_machine_pk(machine_id)
+        else:
+            key = self.get_ident(request)
+        # Batch (list) dibayar per pembacaan
+        records = max(1, len(request.data)) if isinstance(request.data, list) else 1
+        now = time.monotonic()
+        with _lock:
+            bucket = None
+            if key is not None:
+                bucket = _machine_buckets.get(key)
+                if bucket is None:
+                    bucket = _machine_buckets[key] = TokenBucket(
+                        throttle_setting('MACHINE_RATE'), throttle_setting('MACHINE_BURST'))
+                    while len(_machine_buckets) > throttle_setting('MAX_BUCKETS'):
+                        _machine_buckets.popitem(last=False)
+                else:
+                    _machine_buckets.move_to_end(key)
+            if _fleet_bucket is None:
+                _fleet_bucket = TokenBucket(
+                    throttle_setting('FLEET_RATE'), throttle_setting('FLEET_BURST'))
+
+            wait = bucket.take(now, records) if bucket is not None else 0
+            if wait:
+                self._wait = wait
+                ingest_metrics.incr('telemetry', 'throttled')
+                return False
+
+            fleet_wait = _fleet_bucket.take(now, records)
+            if fleet_wait:
+                # Token mesin dikembalikan, yang penuh adalah fleet-nya
+                if bucket is not None:
+                    bucket.refund(records)
+                ingest_metrics.incr('telemetry', 'shed')
+                raise ServiceOverloaded(fleet_wait)
+
+        ingest_metrics.incr('telemetry', 'admitted')
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class SalesLaneThrottle(BaseThrottle):
+    """Jalur sales selalu diterima, hanya dihitung."""
+
+    def allow_request(self, request, view):
+        ingest_metrics.incr('sales', 'admitted')
+        return True
+
+
+def reset_throttle_state():
+    global _fleet_bucket
+    with _lock:
+        _machine_buckets.clear()
+        _fleet_bucket = None
+    ingest_metrics.reset()
@@ -0,0 +1,122 @@
+"""
+Uptime / SLA dari riwayat StatusInterval.
+
+Satu query mengambil, untuk semua mesin sekaligus, transisi di dalam range
+plus transisi terakhir sebelum range (status saat range dimulai), urut
+(mesin, start). Lalu satu pass: interval [start, start berikutnya) dipotong
+ke range, interval berurutan dengan status sama digabung, dan durasi per
+status dijumlahkan.
+
+    uptime = online / waktu yang statusnya diketahui
+    sla    = online / (waktu diketahui - maintenance)
+
+Maintenance dianggap terjadwal, jadi tidak dihitung sebagai downtime SLA.
+"""
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .export import month_bounds
+from .history import InvalidTimeRange, parse_time_range
+from .models import StatusInterval, VendingMachine
+
+
+UP_STATUS = 'online'
+PLANNED_STATUS = 'maintenance'
+
+
+def _transitions(machine_pks, start, end):
+    before_start = (
+        StatusInterval.objects
+        .filter(machine_id=OuterRef('pk'), start__lt=start)
+        .order_by('-start', '-pk')
+        .values('pk')[:1]
+    )
+    machines = VendingMachine.objects.all()
+    in_range = Q(start__gte=start, start__lt=end)
+    if machine_pks is not None:
+        machines = machines.filter(pk__in=machine_pks)
+        in_range &= Q(machine_id__in=machine_pks)
+    boundary = machines.annotate(interval=Subquery(before_start)).values('interval')
+    return (
+        StatusInterval.objects
+        .filter(in_range | Q(pk__in=boundary))
+        .order_by('machine_id', 'start', 'pk')
+        .values_list('machine_id', 'status', 'start')
+        .iterator(chunk_size=5000)
+    )
+
+
+class UptimeCounter:
+    """Durasi per status dan jumlah insiden downtime (interval non-online hasil merge)."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.incidents = 0
+        self._last_status = None
+
+    def add(self, status, start, end):
+        if end <= start:
+            return
+        self.seconds[status] += (end - start).total_seconds()
+        # Interval berurutan dengan status sama digabung jadi satu
+        if status != self._last_status and status not in (UP_STATUS, PLANNED_STATUS):
+            self.incidents += 1
+        self._last_status = status
+
+    def merge(self, other):
+        for status, seconds in other.seconds.items():
+            self.seconds[status] += seconds
+        self.incidents += other.incidents
+        return self
+
+    def summary(self):
+        observed = sum(self.seconds.values())
+        online = self.seconds.get(UP_STATUS, 0.0)
+        countable = observed - self.seconds.get(PLANNED_STATUS, 0.0)
+        return {
+            'observed_seconds': observed,
+            'seconds_by_status': dict(self.seconds),
+            'downtime_incidents': self.incidents,
+            'uptime': round(online / observed * 100, 4) if observed else None,
+            'sla': round(online / countable * 100, 4) if countable else None,
+        }
+
+
+def compute_uptime(machine_pks, start, end, now=None):
+    """
+    machine_pks None = semua mesin. Return {machine_pk: UptimeCounter};
+    mesin tanpa riwayat di range tidak ada di hasil.
+    """
+    # Interval yang masih berjalan berakhir di "sekarang", bukan di ujung range
+    until = min(end, now or timezone.now())
+    counters = {}
+    for machine_pk, rows in groupby(_transitions(machine_pks, start, end), key=itemgetter(0)):
+        counter = counters[machine_pk] = UptimeCounter()
+        status = interval_start = None
+        for _, next_status, next_start in rows:
+            if status is not None:
+                counter.add(status, max(interval_start, start), min(next_start, until))
+            status, interval_start = next_status, next_start
+        counter.add(status, max(interval_start, start), until)
+    return counters
+
+
+def fleet_uptime(counters):
+    fleet = UptimeCounter()
+    for counter in counters.values():
+        fleet.merge(counter)
+    return fleet
+
+
+def parse_uptime_range(params):
+    """?month=YYYY-MM (untuk SLA bulanan) atau start_date/end_date seperti endpoint lain."""
+    if 'month' in params:
+        try:
+            return month_bounds(params['month'])
+        except ValueError:
+            raise InvalidTimeRange("month must be YYYY-MM")
+    return parse_time_range(params)
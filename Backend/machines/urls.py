@@ -4,6 +4,8 @@ from . import views
 
 router = DefaultRouter()
 router.register(r'machines', views.VendingMachineViewSet)
+router.register(r'alert-rules', views.AlertRuleViewSet)
+router.register(r'alerts', views.AlertViewSet)
 
 # urlpatterns = [
 #     path('', include(router.urls)),
@@ -24,5 +26,32 @@ urlpatterns = [
    path('api/machines/<str:machine_id>/quality-history/', 
          views.VendingMachineViewSet.as_view({'get': 'quality_history'}),
          name='machine-quality-history'),
+    path('api/machines/batch-quality-history/',
+         views.VendingMachineViewSet.as_view({'get': 'batch_quality_history'}),
+         name='machine-batch-quality-history'),
+    path('api/machines/heatmap/',
+         views.VendingMachineViewSet.as_view({'get': 'heatmap'}),
+         name='machine-heatmap'),
+    path('api/machines/uptime/',
+         views.VendingMachineViewSet.as_view({'get': 'fleet_uptime'}),
+         name='machine-fleet-uptime'),
+    path('api/machines/<str:machine_id>/uptime/',
+         views.VendingMachineViewSet.as_view({'get': 'uptime'}),
+         name='machine-uptime'),
+    path('api/machines/running-dry/',
+         views.VendingMachineViewSet.as_view({'get': 'running_dry'}),
+         name='machine-running-dry'),
+    path('api/machines/batch-statistics/',
+         views.VendingMachineViewSet.as_view({'get': 'batch_statistics'}),
+         name='machine-batch-statistics'),
+    path('api/machines/<str:machine_id>/statistics/',
+         views.VendingMachineViewSet.as_view({'get': 'statistics'}),
+         name='machine-statistics'),
+    path('api/routes/plan/', views.RoutePlanView.as_view(), name='route-plan'),
+    path('api/metrics/ingest/', views.IngestMetricsView.as_view(), name='ingest-metrics'),
+    path('api/export/parquet/', views.ParquetExportView.as_view(), name='parquet-export'),
+    path('api/export/parquet/<str:dataset>/<str:machine_id>/<str:month>/',
+         views.ParquetPartitionView.as_view(),
+         name='parquet-partition'),
          
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -9,7 +9,44 @@ from .models import VendingMachine, WaterQuality, SalesRecord
 from .serializers import (
     VendingMachineSerializer, 
     WaterQualitySerializer,
-    SalesRecordSerializer
+    SalesRecordSerializer,
+    AlertRuleSerializer,
+    AlertSerializer,
+    RefillForecastSerializer,
+)
+from .alerts import evaluate_readings
+from .cards import render_cards
+from .models import AlertRule, Alert
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from rest_framework.views import APIView
+from . import export as parquet_export
+from .ingest import (MAX_BATCH_SIZE, MachineGone, ingest_atomic, mark_rollups_dirty, save_batch,
+                     save_one)
+from .machine_cache import invalidate, resolve_machine_pk
+from .throttling import SalesLaneThrottle, TelemetryIngestThrottle, ingest_metrics
+from .coldstorage import load_history
+from .rollups import compute_statistics
+from .forecast import running_dry
+from .uptime import UptimeCounter, compute_uptime, fleet_uptime, parse_uptime_range
+from .route_planner import (
+    DEFAULT_WINDOW as ROUTE_WINDOW,
+    MAX_PLAN_STOPS,
+    MAX_STOPS,
+    due_machines,
+    parse_depot,
+    plan_routes,
+)
+from .heatmap import (
+    ENCODINGS as HEATMAP_ENCODINGS,
+    METRICS as HEATMAP_METRICS,
+    build_heatmap,
+    encode_heatmap,
+)
+from .history import (
+    MAX_BATCH_MACHINES,
+    parse_machine_ids,
+    parse_time_range,
+    stream_batch_history,
 )
 
 
@@ -27,58 +64,65 @@ class VendingMachineViewSet(viewsets.ModelViewSet):
     filterset_fields = ['status', 'location']
     lookup_field = 'machine_id'
 
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['post'], throttle_classes=[TelemetryIngestThrottle])
     def record_quality(self, request,  machine_id=None):
-        try:
-            machine = VendingMachine.objects.get(machine_id=machine_id)
-            serializer = WaterQualitySerializer(data=request.data)
-            
-            if serializer.is_valid():
-                serializer.save(machine=machine)
-                return Response(serializer.data)
-            return Response(serializer.errors, status=400)
-            
-        except VendingMachine.DoesNotExist:
+        """
+        Satu pembacaan (object) atau batch (list). timestamp dan seq dari device
+        opsional; seq yang sudah pernah diterima diabaikan.
+        """
+        return self._ingest(request, machine_id, WaterQuality, WaterQualitySerializer,
+                            on_saved=self._after_quality_saved)
+
+    @action(detail=True, methods=['post'], throttle_classes=[SalesLaneThrottle])
+    def record_sale(self, request, machine_id=None):
+        return self._ingest(request, machine_id, SalesRecord, SalesRecordSerializer)
+
+    def _after_quality_saved(self, machine_pk, qualities):
+        # Alert dievaluasi urut waktu pengambilan, bukan urut kedatangan
+        evaluate_readings(machine_pk, sorted(qualities, key=lambda quality: quality.timestamp))
+        mark_rollups_dirty(machine_pk, [quality.timestamp for quality in qualities])
+
+    def _ingest(self, request, machine_id, model, serializer_class, on_saved=None):
+        # pk diambil dari cache, tanpa query VendingMachine per request
+        machine_pk = resolve_machine_pk(machine_id)
+        if machine_pk is None:
             return Response({"error": "Machine not found"}, status=404)
 
-    # @action(detail=True, methods=['post'])
-    # def record_quality(self, request, pk=None):
-    #     machine = self.get_object()
-    #     serializer = WaterQualitySerializer(data=request.data)
-        
-    #     if serializer.is_valid():
-    #         serializer.save(machine=machine)
-    #         return Response(serializer.data)
-    #     return Response(serializer.errors, status=400)
+        many = isinstance(request.data, list)
+        if many and len(request.data) > MAX_BATCH_SIZE:
+            return Response({"error": f"Maximum {MAX_BATCH_SIZE} records per batch"}, status=400)
+        serializer = serializer_class(data=request.data, many=many)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
 
-    @action(detail=True, methods=['post'])
-    def record_sale(self, request, pk=None):
-        machine = self.get_object()
-        serializer = SalesRecordSerializer(data=request.data)
-        
-        if serializer.is_valid():
-            serializer.save(machine=machine)
-            return Response(serializer.data)
-        return Response(serializer.errors, status=400)
+        try:
+            with ingest_atomic(machine_pk):
+                if many:
+                    created, duplicates = save_batch(model, machine_pk, serializer.validated_data)
+                else:
+                    instance, is_new = save_one(model, machine_pk, serializer.validated_data)
+                    created = [instance] if is_new else []
+                if created and on_saved is not None:
+                    on_saved(machine_pk, created)
+        except MachineGone:
+            # pk di cache sudah basi (mesin dihapus di proses lain)
+            invalidate(pk=machine_pk, machine_id=machine_id)
+            return Response({"error": "Machine not found"}, status=404)
+
+        if many:
+            return Response({"accepted": len(created), "duplicates": duplicates})
+        return Response(serializer_class(instance).data)
 
     @action(detail=True, methods=['get'])
     def quality_history(self, request, machine_id=None):
         try:
             machine = VendingMachine.objects.get(machine_id=machine_id)
             
-            # Default ambil 24 jam terakhir
-            end_date = timezone.now()
-            start_date = end_date - timedelta(hours=24)
-            
-            # Bisa filter by range
-            if 'start_date' in request.query_params:
-                start_date = timezone.datetime.fromisoformat(request.query_params['start_date'])
-            if 'end_date' in request.query_params:
-                end_date = timezone.datetime.fromisoformat(request.query_params['end_date'])
+            # Default ambil 24 jam terakhir, bisa filter by range
+            start_date, end_date = parse_time_range(request.query_params)
             
-            qualities = machine.water_qualities.filter(
-                timestamp__range=(start_date, end_date)
-            ).order_by('timestamp')
+            # Data lama yang sudah dikemas ke cold storage ikut di-decode
+            qualities = load_history(machine, start_date, end_date)
             
             serializer = WaterQualitySerializer(qualities, many=True)
             return Response(serializer.data)
@@ -86,6 +130,265 @@ class VendingMachineViewSet(viewsets.ModelViewSet):
         except VendingMachine.DoesNotExist:
             return Response({"error": "Machine not found"}, status=404)
 
+    @action(detail=True, methods=['get'])
+    def statistics(self, request, machine_id=None):
+        """min/max/mean/stddev/p50/p95 TDS dan pH untuk window ?start_date=&end_date="""
+        machine_pk = resolve_machine_pk(machine_id)
+        if machine_pk is None:
+            return Response({"error": "Machine not found"}, status=404)
+        start_date, end_date = parse_time_range(request.query_params)
+
+        stats = compute_statistics([machine_pk], start_date, end_date)[machine_pk]
+        return Response({
+            'machine_id': machine_id,
+            'start_date': start_date,
+            'end_date': end_date,
+            **stats,
+        })
+
+    @action(detail=False, methods=['get'], url_path='batch-statistics')
+    def batch_statistics(self, request):
+        """Statistik beberapa mesin sekaligus: ?machine_ids=A,B,C&start_date=&end_date="""
+        machine_ids = parse_machine_ids(request.query_params)
+        if not machine_ids:
+            return Response({"error": "machine_ids is required"}, status=400)
+        if len(machine_ids) > MAX_BATCH_MACHINES:
+            return Response(
+                {"error": f"Maximum {MAX_BATCH_MACHINES} machines per request"},
+                status=400
+            )
+        start_date, end_date = parse_time_range(request.query_params)
+
+        machines = dict(
+            VendingMachine.objects
+            .filter(machine_id__in=machine_ids)
+            .values_list('pk', 'machine_id')
+        )
+        stats = compute_statistics(list(machines), start_date, end_date)
+        return Response({
+            'start_date': start_date,
+            'end_date': end_date,
+            'machines': {machines[pk]: machine_stats for pk, machine_stats in stats.items()},
+        })
+
+    @action(detail=False, methods=['get'])
+    def heatmap(self, request):
+        """
+        Matriks mesin x jam: ?metric=sales_volume|tds_level&start_date=&end_date=
+        &encoding=columnar|base64&machine_ids=A,B (default semua mesin)
+        """
+        metric = request.query_params.get('metric', 'sales_volume')
+        encoding = request.query_params.get('encoding', 'columnar')
+        if metric not in HEATMAP_METRICS:
+            return Response({"error": f"metric must be one of {list(HEATMAP_METRICS)}"}, status=400)
+        if encoding not in HEATMAP_ENCODINGS:
+            return Response({"error": f"encoding must be one of {list(HEATMAP_ENCODINGS)}"}, status=400)
+
+        try:
+            start_date, end_date = parse_time_range(request.query_params)
+            machine_ids, start, matrix = build_heatmap(
+                metric, start_date, end_date, parse_machine_ids(request.query_params))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(encode_heatmap(metric, machine_ids, start, matrix, encoding))
+
+    @action(detail=True, methods=['get'])
+    def uptime(self, request, machine_id=None):
+        """Uptime dan SLA satu mesin: ?month=YYYY-MM atau ?start_date=&end_date="""
+        machine_pk = resolve_machine_pk(machine_id)
+        if machine_pk is None:
+            return Response({"error": "Machine not found"}, status=404)
+        start_date, end_date = parse_uptime_range(request.query_params)
+
+        counter = compute_uptime([machine_pk], start_date, end_date).get(machine_pk, UptimeCounter())
+        return Response({
+            'machine_id': machine_id,
+            'start_date': start_date,
+            'end_date': end_date,
+            **counter.summary(),
+        })
+
+    @action(detail=False, methods=['get'], url_path='uptime')
+    def fleet_uptime(self, request):
+        """
+        SLA seluruh fleet (atau ?machine_ids=A,B) dalam satu query:
+        ?month=YYYY-MM atau ?start_date=&end_date=
+        """
+        start_date, end_date = parse_uptime_range(request.query_params)
+
+        machines = VendingMachine.objects.all()
+        machine_ids = parse_machine_ids(request.query_params)
+        if machine_ids:
+            machines = machines.filter(machine_id__in=machine_ids)
+        machines = dict(machines.values_list('pk', 'machine_id'))
+
+        counters = compute_uptime(list(machines) if machine_ids else None, start_date, end_date)
+        return Response({
+            'start_date': start_date,
+            'end_date': end_date,
+            'fleet': fleet_uptime(counters).summary(),
+            'machines': {
+                machine_id: counters.get(pk, UptimeCounter()).summary()
+                for pk, machine_id in machines.items()
+            },
+        })
+
+    @action(detail=False, methods=['get'], url_path='running-dry')
+    def running_dry(self, request):
+        """Mesin yang diperkirakan kosong dalam ?hours=N jam ke depan (default 24)."""
+        try:
+            hours = float(request.query_params.get('hours', 24))
+        except ValueError:
+            return Response({"error": "hours must be a number"}, status=400)
+        if hours < 0:
+            return Response({"error": "hours must be positive"}, status=400)
+
+        forecasts = running_dry(timedelta(hours=hours))
+        return Response(RefillForecastSerializer(forecasts, many=True).data)
+
+    @action(detail=False, methods=['get'], url_path='batch-quality-history')
+    def batch_quality_history(self, request):
+        """
+        History beberapa mesin sekaligus dalam satu query.
+        ?machine_ids=A,B,C&start_date=...&end_date=...&bucket=<detik>
+        """
+        machine_ids = parse_machine_ids(request.query_params)
+        if not machine_ids:
+            return Response({"error": "machine_ids is required"}, status=400)
+        if len(machine_ids) > MAX_BATCH_MACHINES:
+            return Response(
+                {"error": f"Maximum {MAX_BATCH_MACHINES} machines per request"},
+                status=400
+            )
+
+        try:
+            start_date, end_date = parse_time_range(request.query_params)
+            bucket = int(request.query_params.get('bucket', 0)) or None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if bucket is not None and bucket < 0:
+            return Response({"error": "bucket must be positive"}, status=400)
+
+        return StreamingHttpResponse(
+            stream_batch_history(machine_ids, start_date, end_date, bucket),
+            content_type='application/json'
+        )
+
+class AlertRuleViewSet(viewsets.ModelViewSet):
+    queryset = AlertRule.objects.all()
+    serializer_class = AlertRuleSerializer
+    filterset_fields = ['machine', 'metric', 'enabled']
+
+
+class AlertViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Alert.objects.select_related('rule', 'machine')
+    serializer_class = AlertSerializer
+    filterset_fields = ['machine', 'rule']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # ?active=1 -> hanya alert yang belum resolved
+        if self.request.query_params.get('active') in ('1', 'true'):
+            queryset = queryset.filter(resolved_at__isnull=True)
+        return queryset
+
+
+class IngestMetricsView(APIView):
+    """Counter admitted/throttled/shed per jalur ingest (per proses worker)."""
+
+    def get(self, request):
+        return Response(ingest_metrics.snapshot())
+
+
+class RoutePlanView(APIView):
+    """
+    Rute kunjungan kru untuk mesin yang jatuh tempo.
+    ?depot=lat,lon&hours=24&max_stops=50&radius_km=&machine_ids=A,B
+    """
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            depot = parse_depot(params.get('depot'))
+            within = timedelta(hours=float(params['hours'])) if 'hours' in params else ROUTE_WINDOW
+            max_stops = int(params.get('max_stops', MAX_STOPS))
+            radius_km = float(params['radius_km']) if 'radius_km' in params else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if max_stops < 1:
+            return Response({"error": "max_stops must be positive"}, status=400)
+        if radius_km is not None and depot is None:
+            return Response({"error": "radius_km requires depot"}, status=400)
+
+        now = timezone.now()
+        machines = due_machines(within, now, parse_machine_ids(params), depot, radius_km)
+        if len(machines) > MAX_PLAN_STOPS:
+            return Response(
+                {"error": f"{len(machines)} machines due, maximum {MAX_PLAN_STOPS} per plan"},
+                status=400
+            )
+        return Response({
+            'generated_at': now,
+            'depot': {'latitude': depot[0], 'longitude': depot[1]} if depot else None,
+            'routes': plan_routes(machines, depot, max_stops, within, now),
+        })
+
+
+class ParquetExportView(APIView):
+    """
+    GET  -> daftar partisi Parquet yang sudah di-export (isi _manifest.json)
+    POST -> export partisi yang berubah; body/query opsional: dataset, machine_ids, month
+    """
+
+    def get(self, request):
+        return Response(parquet_export.load_manifest())
+
+    def post(self, request):
+        datasets = request.data.get('dataset') or request.query_params.getlist('dataset') or None
+        if isinstance(datasets, str):
+            datasets = [datasets]
+        if datasets and not (isinstance(datasets, list) and all(isinstance(d, str) for d in datasets)):
+            return Response({"error": "dataset must be a string or a list of strings"}, status=400)
+        if datasets and any(dataset not in parquet_export.DATASETS for dataset in datasets):
+            return Response({"error": f"dataset must be one of {list(parquet_export.DATASETS)}"}, status=400)
+
+        months = request.data.get('month') or request.query_params.getlist('month') or None
+        if isinstance(months, str):
+            months = [months]
+
+        try:
+            result = parquet_export.export(
+                datasets=datasets,
+                machine_ids=parse_machine_ids(request.query_params) or request.data.get('machine_ids'),
+                months=months,
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(result)
+
+
+class ParquetPartitionView(APIView):
+    """
+    Download satu partisi yang sudah di-export. GET tidak menulis apa pun:
+    partisi yang belum ada (atau perlu diperbarui) dibuat lewat POST
+    /api/export/parquet/ atau command export_parquet.
+    """
+
+    def get(self, request, dataset, machine_id, month):
+        if dataset not in parquet_export.DATASETS:
+            raise Http404("Unknown dataset")
+
+        path = parquet_export.partition_path(dataset, machine_id, month)
+        try:
+            return FileResponse(
+                open(path, 'rb'),
+                as_attachment=True,
+                filename=f'{dataset}_{machine_id}_{month}.parquet',
+                content_type='application/vnd.apache.parquet',
+            )
+        except FileNotFoundError:
+            raise Http404("Partition not exported yet")
+
 # class MachineListView(ListView):
 #     model = VendingMachine
 #     template_name = 'machines/machine_list.html'
@@ -134,10 +437,8 @@ class MachineListView(ListView):
         context['status'] = self.request.GET.get('status', '')
         context['total_machines'] = VendingMachine.objects.count()
         context['online_machines'] = VendingMachine.objects.filter(status='online').count()
-        for machine in context['machines']:
-            # Ambil water quality terbaru untuk setiap machine
-            latest_quality = machine.water_qualities.first()  # Karena sudah di-order by -timestamp
-            machine.latest_quality = latest_quality
+        # Kartu yang tidak berubah sejak render terakhir diambil dari cache
+        context['machine_cards'] = render_cards(context['machines'])
         return context
 
 class MachineDetailView(DetailView):
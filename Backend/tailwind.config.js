@@ -0,0 +1,18 @@
+/** Tailwind v3 config untuk `python manage.py build_assets`. */
+module.exports = {
+  content: [
+    './templates/**/*.html',
+    './machines/**/*.py',
+  ],
+  // Class yang dirakit di template ({% if %}green{% else %}red{% endif %}-500)
+  // tidak terlihat oleh scanner, jadi didaftarkan manual
+  safelist: [
+    {
+      pattern: /^(bg|text)-(green|red|yellow)-(100|500|600|800)$/,
+    },
+  ],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+}
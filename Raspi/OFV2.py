@@ -1,8 +1,9 @@
 import sys
 import cv2
+import hashlib
+import numpy as np
 import time
 import logging
-import io
 import threading
 import os
 import requests
@@ -14,7 +15,7 @@ from dataclasses import dataclass
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QLabel, 
                            QVBoxLayout, QHBoxLayout, QPushButton, QGridLayout,
                            QFrame, QSizePolicy, QMessageBox)
-from PyQt5.QtCore import Qt, QTimer, QSize, QThread, pyqtSignal, QMutex, QMutexLocker,QObject
+from PyQt5.QtCore import Qt, QTimer, QSize, QThread, pyqtSignal, QMutex, QMutexLocker,QObject, QEvent
 from PyQt5.QtGui import QImage, QPixmap, QFont, QPalette, QColor
 
 
@@ -45,6 +46,14 @@ except ImportError:
     logger.warning("RPi.GPIO not available - running in simulation mode")
     HARDWARE_AVAILABLE = False
 
+try:
+    from websockets.exceptions import WebSocketException
+    from websockets.sync.client import connect as websocket_connect
+    WEBSOCKET_AVAILABLE = True
+except ImportError:
+    logger.warning("websockets not available - sensor data will be polled over HTTP")
+    WEBSOCKET_AVAILABLE = False
+
 
 # Water volume configurations
 @dataclass
@@ -70,12 +79,21 @@ class HardwareConfig:
     ir_sensor_pin: int = 23  # <-- Tambahan ini
     esp32_ip: str = "192.168.137.37"
     esp32_port: int = 80
+    esp32_ws_port: int = 81  # WebSocket telemetry (firmware V1)
     pulse_per_liter: int = 450  # Calibration factor for flow sensor
+    stop_latency: float = 0.1  # Initial guess (s) from relay-off command to flow stop; learned per fill
 
 import json
+import random
+import sqlite3
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache
 import time, requests
-from typing import Optional, Dict, Any
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
 logger = logging.getLogger(__name__)
@@ -87,6 +105,9 @@ class APIConfig:
     timeout: int
     retry_attempts: int
     retry_delay: int
+    outbox_path: str = 'outbox.db'
+    sync_batch_size: int = 100
+    sync_max_backoff: int = 60
 
 @dataclass
 class AppConfig:
@@ -94,6 +115,12 @@ class AppConfig:
     log_file: str
     log_level: str
     update_interval: int
+    video_cache_dir: str = 'video_cache'
+    video_cache_max_mb: int = 256  # video lebih besar dari ini di-cache sebagai MJPEG, bukan frame mentah
+    idle_timeout: int = 60  # detik tanpa sentuhan / deteksi IR sebelum mode idle
+    idle_video_fps: float = 0  # 0 = video berhenti (frame terakhir tetap tampil) saat idle
+    idle_sensor_interval: int = 30
+    idle_sync_interval: int = 300
 
 class ConfigManager:
     _instance = None
@@ -126,7 +153,11 @@ class ConfigManager:
                 machine_id=config['api']['machine_id'],
                 timeout=config['api']['timeout'],
                 retry_attempts=config['api']['retry_attempts'],
-                retry_delay=config['api']['retry_delay']
+                retry_delay=config['api']['retry_delay'],
+                # Key baru opsional supaya config.json lama tetap terbaca
+                outbox_path=config['api'].get('outbox_path', 'outbox.db'),
+                sync_batch_size=config['api'].get('sync_batch_size', 100),
+                sync_max_backoff=config['api'].get('sync_max_backoff', 60)
             )
             
             self.hardware_config = HardwareConfig(
@@ -134,7 +165,9 @@ class ConfigManager:
                 motor_pin=config['hardware']['motor_pin'],
                 esp32_ip=config['hardware']['esp32_ip'],
                 esp32_port=config['hardware']['esp32_port'],
+                esp32_ws_port=config['hardware'].get('esp32_ws_port', 81),
                 pulse_per_liter=config['hardware']['pulse_per_liter'],
+                stop_latency=config['hardware'].get('stop_latency', 0.1),
                 ir_sensor_pin=config['hardware']['ir_sensor_pin']
             )
             
@@ -142,7 +175,13 @@ class ConfigManager:
                 video_path=config['app']['video_path'],
                 log_file=config['app']['log_file'],
                 log_level=config['app']['log_level'],
-                update_interval=config['app']['update_interval']
+                update_interval=config['app']['update_interval'],
+                video_cache_dir=config['app'].get('video_cache_dir', 'video_cache'),
+                video_cache_max_mb=config['app'].get('video_cache_max_mb', 256),
+                idle_timeout=config['app'].get('idle_timeout', 60),
+                idle_video_fps=config['app'].get('idle_video_fps', 0),
+                idle_sensor_interval=config['app'].get('idle_sensor_interval', 30),
+                idle_sync_interval=config['app'].get('idle_sync_interval', 300)
             )
             
             logger.info("Configuration loaded successfully")
@@ -159,19 +198,30 @@ class ConfigManager:
                 'machine_id': 'VM001',
                 'timeout': 5,
                 'retry_attempts': 3,
-                'retry_delay': 1
+                'retry_delay': 1,
+                'outbox_path': 'outbox.db',
+                'sync_batch_size': 100,
+                'sync_max_backoff': 60
             },
             'hardware': {
                 'flow_sensor_pin': 20,
                 'motor_pin': 21,
                 'esp32_ip': '192.168.137.82',
-                'esp32_port': 80
+                'esp32_port': 80,
+                'esp32_ws_port': 81,
+                'stop_latency': 0.1
             },
             'app': {
                 'video_path': 'yqq.mkv',
                 'log_file': 'vending_machine.log',
                 'log_level': 'INFO',
-                'update_interval': 2
+                'update_interval': 2,
+                'video_cache_dir': 'video_cache',
+                'video_cache_max_mb': 256,
+                'idle_timeout': 60,
+                'idle_video_fps': 0,
+                'idle_sensor_interval': 30,
+                'idle_sync_interval': 300
             }
         }
         
@@ -192,20 +242,31 @@ class ConfigManager:
                 'machine_id': self.api_config.machine_id,
                 'timeout': self.api_config.timeout,
                 'retry_attempts': self.api_config.retry_attempts,
-                'retry_delay': self.api_config.retry_delay
+                'retry_delay': self.api_config.retry_delay,
+                'outbox_path': self.api_config.outbox_path,
+                'sync_batch_size': self.api_config.sync_batch_size,
+                'sync_max_backoff': self.api_config.sync_max_backoff
             },
             'hardware': {
                 'flow_sensor_pin': self.hardware_config.flow_sensor_pin,
                 'motor_pin': self.hardware_config.motor_pin,
                 'esp32_ip': self.hardware_config.esp32_ip,
                 'ir_sensor_pin': self.hardware_config.ir_sensor_pin,
-                'esp32_port': self.hardware_config.esp32_port
+                'esp32_port': self.hardware_config.esp32_port,
+                'esp32_ws_port': self.hardware_config.esp32_ws_port,
+                'stop_latency': self.hardware_config.stop_latency
             },
             'app': {
                 'video_path': self.app_config.video_path,
                 'log_file': self.app_config.log_file,
                 'log_level': self.app_config.log_level,
-                'update_interval': self.app_config.update_interval
+                'update_interval': self.app_config.update_interval,
+                'video_cache_dir': self.app_config.video_cache_dir,
+                'video_cache_max_mb': self.app_config.video_cache_max_mb,
+                'idle_timeout': self.app_config.idle_timeout,
+                'idle_video_fps': self.app_config.idle_video_fps,
+                'idle_sensor_interval': self.app_config.idle_sensor_interval,
+                'idle_sync_interval': self.app_config.idle_sync_interval
             }
         }
         
@@ -218,13 +279,249 @@ class ConfigManager:
             raise
 
 
+class OfflineOutbox:
+    """
+    Local SQLite (WAL) queue for data that must reach the backend.
+
+    record_sale / record_quality only insert a row here (well under a
+    millisecond); OutboxSyncWorker drains the queue in the background.
+    Each row gets a device seq (seq_base + id) and the enqueue time as
+    timestamp, so re-sent batches are deduplicated by the backend and
+    late uploads land at the time the data was recorded.
+    """
+    _instance = None
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            failed INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (failed, id);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, db_path: str = 'outbox.db'):
+        if not hasattr(self, 'initialized'):
+            self.db_path = db_path
+            self._lock = threading.Lock()
+            self._has_data = threading.Event()
+            # Satu koneksi autocommit dipakai bersama, dijaga self._lock
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # NORMAL: commit tetap aman kalau aplikasi crash, tanpa fsync per insert
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(self.SCHEMA)
+            self._seq_base = self._load_seq_base()
+            if self.pending_count():
+                self._has_data.set()
+            self.initialized = True
+
+    def _load_seq_base(self) -> int:
+        """
+        Per-database seq offset. If outbox.db is recreated the new base
+        (current time in ms x 1000) is larger than any earlier seq, so it
+        never collides with data the backend already accepted.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'seq_base'").fetchone()
+            if row:
+                return row[0]
+            seq_base = int(time.time() * 1000) * 1000
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('seq_base', ?)", (seq_base,))
+            return seq_base
+
+    def enqueue(self, kind: str, payload: Dict[str, Any]) -> int:
+        """Store one record and return its local id"""
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT INTO outbox (kind, payload, created_at) VALUES (?, ?, ?)',
+                (kind, json.dumps(payload), time.time())
+            )
+            self._has_data.set()
+        return cursor.lastrowid
+
+    def peek_batch(self, limit: int) -> Tuple[Optional[str], List[Tuple[int, Dict[str, Any]]]]:
+        """
+        Oldest unsent records of a single kind, so ordering per endpoint is
+        kept. Returns (kind, [(id, payload)]).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT kind FROM outbox WHERE failed = 0 ORDER BY id LIMIT 1'
+            ).fetchone()
+            if row is None:
+                self._has_data.clear()
+                return None, []
+            kind = row[0]
+            rows = self._conn.execute(
+                'SELECT id, payload, created_at FROM outbox '
+                'WHERE failed = 0 AND kind = ? ORDER BY id LIMIT ?',
+                (kind, limit)
+            ).fetchall()
+
+        records = []
+        for record_id, payload, created_at in rows:
+            data = json.loads(payload)
+            data.setdefault('timestamp', datetime.fromtimestamp(created_at, timezone.utc).isoformat())
+            data['seq'] = self._seq_base + record_id
+            records.append((record_id, data))
+        return kind, records
+
+    def ack(self, ids: List[int]):
+        """Delete records acknowledged by the backend"""
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                self._conn.execute(
+                    f"DELETE FROM outbox WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                )
+
+    def mark_failed(self, record_id: int, error: str):
+        """Keep a record rejected by the backend (HTTP 400) without retrying it"""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE outbox SET failed = 1, last_error = ? WHERE id = ?', (error, record_id)
+            )
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM outbox WHERE failed = 0').fetchone()[0]
+
+    def wait(self, timeout: float) -> bool:
+        """Block until data is queued or timeout expires"""
+        return self._has_data.wait(timeout)
+
+
+class OutboxSyncWorker(threading.Thread):
+    """Drain OfflineOutbox to the backend in batches, oldest first, with backoff."""
+
+    ENDPOINTS = {
+        'sale': 'record_sale',
+        'quality': 'record_quality',
+    }
+    IDLE_POLL = 30  # detik; enqueue membangunkan worker lebih cepat
+
+    def __init__(self, outbox: OfflineOutbox):
+        super().__init__(name='outbox-sync', daemon=True)
+        self.config = ConfigManager()
+        self.outbox = outbox
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        })
+        self._stop_event = threading.Event()
+        self._active = threading.Event()
+        self._active.set()
+        self._failures = 0
+
+    def set_idle(self, idle: bool):
+        """While the machine is idle, new records are held and uploaded together"""
+        if idle:
+            self._active.clear()
+        else:
+            self._active.set()
+
+    def run(self):
+        logger.info(f"Outbox sync started, {self.outbox.pending_count()} records pending")
+        held = False
+        while not self._stop_event.is_set():
+            if not self.outbox.wait(self.IDLE_POLL):
+                continue
+            if not held and not self._active.is_set():
+                # Mesin idle: tunggu data terkumpul lalu kirim sekaligus (atau lebih cepat kalau ada pelanggan)
+                self._active.wait(self.config.app_config.idle_sync_interval)
+                held = True
+                continue
+            kind, records = self.outbox.peek_batch(self.config.api_config.sync_batch_size)
+            if not records:
+                held = False
+                continue
+            try:
+                self._deliver(kind, records)
+                self._failures = 0
+            except RequestException as e:
+                self._failures += 1
+                delay = self._backoff_delay()
+                logger.warning(f"Outbox sync failed ({e}), {len(records)} {kind} records kept, retry in {delay:.1f}s")
+                self._stop_event.wait(delay)
+            except Exception as e:
+                logger.error(f"Unexpected error in outbox sync: {e}")
+                self._stop_event.wait(self.config.api_config.sync_max_backoff)
+
+    def _backoff_delay(self) -> float:
+        api = self.config.api_config
+        # retry_delay 0 di config tidak boleh membuat worker berputar tanpa jeda
+        base = max(api.retry_delay, 1)
+        delay = min(base * (2 ** (self._failures - 1)), api.sync_max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _post(self, kind: str, body):
+        api = self.config.api_config
+        url = f"{api.base_url}/api/machines/{api.machine_id}/{self.ENDPOINTS[kind]}/"
+        return self.session.post(url, json=body, timeout=api.timeout)
+
+    def _deliver(self, kind: str, records: List[Tuple[int, Dict[str, Any]]]):
+        response = self._post(kind, [payload for _, payload in records])
+        if response.status_code == 400:
+            # Ada record yang ditolak; kirim satu per satu supaya yang valid tetap masuk
+            for record_id, payload in records:
+                single = self._post(kind, payload)
+                if single.status_code == 400:
+                    logger.error(f"Outbox record {record_id} rejected by backend: {single.text[:200]}")
+                    self.outbox.mark_failed(record_id, single.text[:500])
+                    continue
+                single.raise_for_status()
+                self.outbox.ack([record_id])
+            return
+
+        # 404/429/5xx -> raise, batch tetap di outbox dan dicoba lagi
+        response.raise_for_status()
+        self.outbox.ack([record_id for record_id, _ in records])
+        logger.debug(f"Outbox synced {len(records)} {kind} records")
+
+    def cleanup(self):
+        """Stop the worker; unsent data stays in outbox.db"""
+        self._stop_event.set()
+        self._active.set()
+        self.outbox._has_data.set()
+        self.join(timeout=5)
+
+
 class APIClient:
     """Handle all API communications with backend"""
+
+    _sync_worker = None
+    _sync_lock = threading.Lock()
     
     def __init__(self):
         self.config = ConfigManager()
         self.session = requests.Session()
         self._setup_session()
+        self.outbox = OfflineOutbox(self.config.api_config.outbox_path)
+        self.start_sync_worker()
+
+    @classmethod
+    def start_sync_worker(cls) -> OutboxSyncWorker:
+        """Start the shared outbox sync worker once per process"""
+        with cls._sync_lock:
+            if cls._sync_worker is None:
+                outbox = OfflineOutbox(ConfigManager().api_config.outbox_path)
+                cls._sync_worker = OutboxSyncWorker(outbox)
+                cls._sync_worker.start()
+            return cls._sync_worker
     
     def _setup_session(self):
         """Configure requests session"""
@@ -268,43 +565,387 @@ class APIClient:
     
     def record_quality(self, quality_data: Dict[str, float]) -> bool:
         """
-        Record water quality data
+        Queue water quality data for upload (never blocks on the network)
         
         Args:
             quality_data: Dictionary containing tds_level, ph_level, and water_level
         
         Returns:
-            bool: True if successful, False otherwise
+            bool: True if stored in the local outbox, False otherwise
         """
-        endpoint = f"machines/{self.config.api_config.machine_id}/record_quality/"
-        
         try:
-            result = self._make_request('POST', endpoint, quality_data)
-            return result is not None
+            self.outbox.enqueue('quality', quality_data)
+            return True
         except Exception as e:
-            logger.error(f"Error recording quality data: {e}")
+            logger.error(f"Error queueing quality data: {e}")
             return False
     
     def record_sale(self, sale_data: Dict[str, Any]) -> bool:
         """
-        Record sales data
+        Queue sales data for upload (never blocks on the network)
         
         Args:
             sale_data: Dictionary containing volume and price
         
         Returns:
-            bool: True if successful, False otherwise
+            bool: True if stored in the local outbox, False otherwise
         """
-        endpoint = f"machines/{self.config.api_config.machine_id}/record_sale/"
-        
         try:
-            result = self._make_request('POST', endpoint, sale_data)
-            return result is not None
+            self.outbox.enqueue('sale', sale_data)
+            return True
         except Exception as e:
-            logger.error(f"Error recording sale data: {e}")
+            logger.error(f"Error queueing sale data: {e}")
             return False
 
 
+class ESP32Unavailable(RequestException):
+    """Circuit breaker is open; the ESP32 is not contacted at all"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker: after THRESHOLD failures in a row calls
+    are refused until the cooldown (doubling up to MAX_COOLDOWN) passes,
+    then one trial call decides whether it closes again.
+    """
+
+    THRESHOLD = 3
+    COOLDOWN = 1.0
+    MAX_COOLDOWN = 30.0
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0.0
+        self._cooldown = self.COOLDOWN
+        self._trial_running = False
+
+    def allow(self):
+        """Raise ESP32Unavailable while open"""
+        with self._lock:
+            if self._failures < self.THRESHOLD:
+                return
+            if time.monotonic() < self._open_until or self._trial_running:
+                raise ESP32Unavailable(f"ESP32 {self.name} circuit open, retry in "
+                                       f"{max(self._open_until - time.monotonic(), 0):.1f}s")
+            # Half-open: satu request percobaan saja
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self._failures >= self.THRESHOLD:
+                logger.info(f"ESP32 {self.name} reachable again, circuit closed")
+            self._failures = 0
+            self._cooldown = self.COOLDOWN
+            self._trial_running = False
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._failures < self.THRESHOLD:
+                return
+            if self._failures == self.THRESHOLD:
+                logger.error(f"ESP32 {self.name} unreachable ({error}), circuit open")
+            else:
+                self._cooldown = min(self._cooldown * 2, self.MAX_COOLDOWN)
+            self._open_until = time.monotonic() + self._cooldown * random.uniform(0.8, 1.2)
+
+
+class ESP32Client:
+    """
+    Shared HTTP client for the ESP32 (sensor /data and pump /toggleRelay).
+
+    One keep-alive connection pool, timeouts sized to the firmware loop,
+    retry with exponential backoff + jitter, and separate circuit breakers
+    for sensor reads and relay commands, so a flaky sensor poll never
+    blocks the pump. Switching the pump off bypasses the breaker entirely.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    # (connect, read) dalam detik. Firmware melayani satu request per iterasi loop()
+    # (~200 ms: readPHVoltage 10x delay(10) + delay(100)), jadi request bisa menunggu 1-2 iterasi
+    TIMEOUTS = {
+        '/data': (0.5, 0.6),
+        '/toggleRelay': (0.5, 1.0),
+    }
+    # Toggle yang timeout mungkin masih antri di ESP32; tunggu sampai pasti dilayani atau hilang
+    TOGGLE_SETTLE = 1.0
+    RETRIES = 2
+    RETRY_BASE_DELAY = 0.05
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+            return cls._instance
+
+    def __init__(self):
+        if hasattr(self, 'initialized'):
+            return
+        self.config = ConfigManager()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.sensor_breaker = CircuitBreaker('sensor')
+        self.relay_breaker = CircuitBreaker('relay')
+        self.initialized = True
+
+    @property
+    def base_url(self) -> str:
+        hardware = self.config.hardware_config
+        return f"http://{hardware.esp32_ip}:{hardware.esp32_port}"
+
+    def _get(self, endpoint: str, breaker: CircuitBreaker, retries: int = RETRIES,
+             guarded: bool = True) -> requests.Response:
+        """
+        GET with retry; raises RequestException (ESP32Unavailable while the
+        breaker is open). guarded=False still records the outcome but never
+        refuses the call.
+        """
+        for attempt in range(retries + 1):
+            if guarded:
+                breaker.allow()
+            try:
+                response = self.session.get(self.base_url + endpoint, timeout=self.TIMEOUTS[endpoint])
+                response.raise_for_status()
+            except RequestException as e:
+                breaker.record_failure(e)
+                if attempt == retries:
+                    raise
+                time.sleep(self.RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.0))
+                continue
+            breaker.record_success()
+            return response
+
+    def _read_data(self, breaker: CircuitBreaker, guarded: bool = True) -> Optional[Dict[str, Any]]:
+        try:
+            return self._get('/data', breaker, guarded=guarded).json()
+        except ESP32Unavailable:
+            return None
+        except RequestException as e:
+            logger.warning(f"ESP32 connection error: {e}")
+            return None
+        except ValueError as e:
+            logger.error(f"Invalid sensor data from ESP32: {e}")
+            return None
+
+    def get_data(self) -> Optional[Dict[str, Any]]:
+        """Latest sensor readings, or None if the ESP32 did not answer"""
+        return self._read_data(self.sensor_breaker)
+
+    def relay_state(self, guarded: bool = True) -> Optional[bool]:
+        data = self._read_data(self.relay_breaker, guarded=guarded)
+        if not data or 'relay' not in data:
+            return None
+        return data['relay'] == 'ON'
+
+    def set_relay(self, state: bool) -> bool:
+        """
+        Switch the pump relay on/off idempotently.
+
+        /toggleRelay only flips the relay, so it is never retried blindly:
+        the current state is read first and re-checked after each toggle
+        has been served. A toggle that timed out may still be queued on
+        the ESP32, so the state is only re-read after TOGGLE_SETTLE.
+        Switching off ignores the breaker: stopping the pump is always
+        attempted.
+        """
+        guarded = state
+        for _ in range(self.RETRIES + 1):
+            current = self.relay_state(guarded=guarded)
+            if current is None:
+                if guarded:
+                    return False
+                continue
+            if current == state:
+                return True
+            try:
+                self._get('/toggleRelay', self.relay_breaker, retries=0, guarded=guarded)
+            except ESP32Unavailable:
+                return False
+            except RequestException as e:
+                logger.warning(f"Relay toggle failed: {e}")
+                time.sleep(self.TOGGLE_SETTLE)
+        return self.relay_state(guarded=guarded) == state
+
+
+class IOExecutor(QObject):
+    """
+    Shared executors for blocking network I/O.
+
+    Work is submitted with optional on_done / on_error callbacks; the
+    callbacks run on the Qt GUI thread (delivered through a queued signal),
+    so widgets can be updated directly and neither the GUI thread nor the
+    GPIO callback thread ever waits on HTTP. ESP32 relay commands use their
+    own single-thread executor so a pump stop is never queued behind a slow
+    backend or Midtrans call.
+    """
+    _instance = None
+    _result_ready = pyqtSignal(object, object, object)  # future, on_done, on_error
+
+    @classmethod
+    def instance(cls) -> 'IOExecutor':
+        # Dibuat pertama kali di GUI thread (WaterSustainabilityApp.__init__)
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        super().__init__()
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='io')
+        self._control = ThreadPoolExecutor(max_workers=1, thread_name_prefix='esp32-control')
+        self._result_ready.connect(self._deliver)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, control: bool = False) -> Future:
+        """Run fn(*args) in the background; callbacks are invoked on the GUI thread"""
+        pool = self._control if control else self._pool
+        future = pool.submit(fn, *args)
+        if on_done is not None or on_error is not None:
+            future.add_done_callback(lambda done: self._result_ready.emit(done, on_done, on_error))
+        return future
+
+    def _deliver(self, future: Future, on_done, on_error):
+        error = future.exception()
+        try:
+            if error is not None:
+                if on_error is not None:
+                    on_error(error)
+                else:
+                    logger.error(f"Background I/O failed: {error}")
+            elif on_done is not None:
+                on_done(future.result())
+        except Exception as e:
+            logger.error(f"Error in I/O callback: {e}")
+
+    def cleanup(self):
+        """Stop accepting work; pending relay commands still finish"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._control.shutdown(wait=True)
+
+
+class UIStallMonitor(QObject):
+    """
+    Measures GUI event-loop stalls: a timer that should fire every
+    interval_ms; any lateness is time the GUI thread was blocked.
+    The worst stall per report window is logged.
+    """
+
+    def __init__(self, interval_ms: int = 50, report_every: int = 60, parent=None):
+        super().__init__(parent)
+        self.interval = interval_ms / 1000
+        self.report_every = report_every
+        self.worst_stall = 0.0
+        self._window_worst = 0.0
+        self._last_tick = self._window_start = time.monotonic()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._tick)
+        self.timer.start(interval_ms)
+
+    def _tick(self):
+        now = time.monotonic()
+        stall = max(0.0, now - self._last_tick - self.interval)
+        self._last_tick = now
+        self._window_worst = max(self._window_worst, stall)
+        self.worst_stall = max(self.worst_stall, stall)
+
+        if now - self._window_start >= self.report_every:
+            message = (f"UI stall: worst {self._window_worst * 1000:.0f} ms in last "
+                       f"{self.report_every}s, {self.worst_stall * 1000:.0f} ms since start")
+            # Hanya stall yang terasa ditulis ke log di SD card
+            if self._window_worst >= 0.1:
+                logger.warning(message)
+            else:
+                logger.debug(message)
+            self._window_worst = 0.0
+            self._window_start = now
+
+    def cleanup(self):
+        self.timer.stop()
+        logger.info(f"UI stall: worst {self.worst_stall * 1000:.0f} ms during session")
+
+
+class ActivityGovernor(QObject):
+    """
+    Decides whether a customer is at the machine.
+
+    Any touch, click or key press anywhere in the application, and the IR
+    sensor seeing someone, count as activity. After idle_timeout seconds
+    without activity (and with nobody in front of the IR sensor and no
+    payment or fill in progress) idle_changed(True) is emitted so video,
+    sensor polling and uploads can slow down; the first activity emits
+    idle_changed(False) straight away, from the event that caused it.
+    """
+    idle_changed = pyqtSignal(bool)
+    _presence_edge = pyqtSignal()
+
+    ACTIVITY_EVENTS = frozenset((QEvent.MouseButtonPress, QEvent.TouchBegin, QEvent.KeyPress))
+
+    def __init__(self, idle_timeout: float, parent=None):
+        super().__init__(parent)
+        self.idle = False
+        self._present = False
+        self._holds = set()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(int(idle_timeout * 1000))
+        self._timer.timeout.connect(self._enter_idle)
+        # Dari thread callback GPIO; diteruskan ke GUI thread lewat queued signal
+        self._presence_edge.connect(self.wake)
+        QApplication.instance().installEventFilter(self)
+        self._timer.start()
+
+    def eventFilter(self, obj, event):
+        if event.type() in self.ACTIVITY_EVENTS:
+            self.wake()
+        return False
+
+    def wake(self):
+        """Register activity: leave idle mode immediately and restart the idle countdown"""
+        self._timer.start()
+        if self.idle:
+            self.idle = False
+            logger.info("Activity detected, leaving idle mode")
+            self.idle_changed.emit(False)
+
+    def notify_presence(self):
+        """Thread-safe wake-up, for the IR sensor's GPIO edge callback"""
+        self._presence_edge.emit()
+
+    def set_presence(self, present: bool):
+        """Current IR sensor state; the machine never goes idle while someone is detected"""
+        if present == self._present:
+            return
+        self._present = present
+        if present:
+            self.wake()
+        else:
+            self._timer.start()
+
+    def hold(self, reason: str):
+        """Keep the machine active (e.g. while waiting for payment) until release(reason)"""
+        self._holds.add(reason)
+        self.wake()
+
+    def release(self, reason: str):
+        self._holds.discard(reason)
+        self._timer.start()
+
+    def _enter_idle(self):
+        if self.idle or self._present or self._holds:
+            return
+        self.idle = True
+        logger.info(f"No activity for {self._timer.interval() // 1000}s, entering idle mode")
+        self.idle_changed.emit(True)
+
+    def cleanup(self):
+        self._timer.stop()
+        QApplication.instance().removeEventFilter(self)
+
+
 from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, 
                            QPushButton, QProgressBar, QWidget, QFrame)
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QUrl, QSize
@@ -500,6 +1141,105 @@ class PaymentManager:
                 is_production=False
             )
 
+QR_FINDER_LIKE = np.array([
+    [1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0],
+    [0, 0, 0, 0, 1, 0, 1, 1, 1, 0, 1],
+], dtype=bool)
+
+
+def qr_penalties(candidates: np.ndarray) -> np.ndarray:
+    """
+    ISO 18004 mask penalty of each matrix in a (k, n, n) stack (True =
+    dark), scored the same way as qrcode.util.lost_point but vectorized
+    with NumPy over all candidates at once.
+    """
+    n = candidates.shape[-1]
+    penalty = np.zeros(len(candidates), dtype=np.int64)
+    for lines in (candidates, candidates.swapaxes(1, 2)):
+        # Aturan 1: deret L >= 5 modul sewarna bernilai L - 2 = (jumlah jendela 5 sewarna) + 2 per deret
+        same = lines[..., 1:] == lines[..., :-1]
+        five = same[..., :-3] & same[..., 1:-2] & same[..., 2:-1] & same[..., 3:]
+        run_starts = five.copy()
+        run_starts[..., 1:] &= ~same[..., :n - 5]
+        penalty += five.sum(axis=(1, 2)) + 2 * run_starts.sum(axis=(1, 2))
+        # Aturan 3: pola mirip finder 1:1:3:1:1 dengan 4 modul terang di satu sisi
+        for pattern in QR_FINDER_LIKE:
+            match = np.ones(lines[..., :n - 10].shape, dtype=bool)
+            for offset, dark in enumerate(pattern):
+                window = lines[..., offset:offset + n - 10]
+                match &= window if dark else ~window
+            penalty += 40 * match.sum(axis=(1, 2))
+    # Aturan 2: blok 2x2 sewarna
+    corner = candidates[:, :-1, :-1]
+    blocks = ((corner == candidates[:, 1:, :-1]) & (corner == candidates[:, :-1, 1:])
+              & (corner == candidates[:, 1:, 1:]))
+    penalty += 3 * blocks.sum(axis=(1, 2))
+    # Aturan 4: tiap 5% penyimpangan modul gelap dari 50%
+    percent = candidates.sum(axis=(1, 2)) / (n ** 2)
+    penalty += (np.abs(percent * 100 - 50) / 5).astype(np.int64) * 10
+    return penalty
+
+
+@lru_cache(maxsize=8)
+def qr_mask_grids(size: int) -> np.ndarray:
+    """qrcode's 8 mask patterns as a (8, size, size) array, True where a data module is inverted"""
+    return np.array([[[mask(row, col) for col in range(size)] for row in range(size)]
+                     for mask in map(qrcode.util.mask_func, range(8))], dtype=bool)
+
+
+class FastMaskQRCode(qrcode.QRCode):
+    """
+    qrcode.QRCode with faster mask selection. The matrix is built once; the
+    other 7 candidates only differ in the (masked) data modules, so they are
+    derived with NumPy, and all 8 are scored with qr_penalties. The chosen
+    mask and the final matrix are identical to qrcode's own.
+    """
+
+    def map_data(self, data, mask_pattern):
+        # Modul yang masih kosong saat ini = modul data, satu-satunya yang kena mask
+        self._data_modules = np.array([[module is None for module in row] for row in self.modules])
+        super().map_data(data, mask_pattern)
+
+    def best_mask_pattern(self):
+        self.makeImpl(True, 0)
+        masks = qr_mask_grids(self.modules_count) & self._data_modules
+        unmasked = np.array(self.modules, dtype=bool) ^ masks[0]
+        # argmin: penalti sama -> mask terkecil, seperti qrcode
+        return int(np.argmin(qr_penalties(unmasked ^ masks)))
+
+
+@lru_cache(maxsize=16)
+def render_qr_image(qr_string: str, width: int, height: int) -> QImage:
+    """
+    QR code for qr_string as a width x height image, ready to display.
+
+    Every module is drawn as a whole number of pixels square (no scaling
+    or smoothing afterwards, so edges stay sharp for the scanner) and the
+    code is centered on white. Cached per payload and size; the returned
+    QImage must not be modified.
+    """
+    qr = FastMaskQRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        border=4,
+    )
+    qr.add_data(qr_string)
+    qr.make(fit=True)
+
+    modules = np.array(qr.get_matrix(), dtype=bool)  # termasuk quiet zone
+    scale = max(min(width, height) // len(modules), 1)
+    code = np.where(modules, 0, 255).astype(np.uint8)
+    code = code.repeat(scale, axis=0).repeat(scale, axis=1)
+
+    pixels = np.full((max(height, code.shape[0]), max(width, code.shape[1])), 255, dtype=np.uint8)
+    top = (pixels.shape[0] - code.shape[0]) // 2
+    left = (pixels.shape[1] - code.shape[1]) // 2
+    pixels[top:top + code.shape[0], left:left + code.shape[1]] = code
+    # copy(): QImage memegang datanya sendiri, tidak menunjuk array numpy
+    return QImage(pixels.data, pixels.shape[1], pixels.shape[0], pixels.shape[1],
+                  QImage.Format_Grayscale8).copy()
+
+
 class QRPaymentDialog(QDialog):
     """Dialog for displaying QRIS payment QR code and handling payment status"""
     
@@ -512,6 +1252,9 @@ class QRPaymentDialog(QDialog):
         self.amount = amount
         self.item_details = item_details
         self.transaction_data = None
+        self.io = IOExecutor.instance()
+        self._finished = False
+        self._status_pending = False
         
         # Setup timers
         self._setup_timers()
@@ -655,15 +1398,36 @@ class QRPaymentDialog(QDialog):
         return content
 
     def start_payment(self):
-        """Start the payment process"""
-        try:
-            self.transaction_data = self.payment_manager.payment_client.create_qris_transaction(
-                self.amount,
-                self.item_details
-            )
-            print(self.transaction_data["qr_string"])
+        """Start the payment process (Midtrans charge runs on the I/O executor)"""
+        self.qr_label.setText("Generating QR code...")
+        size = self.qr_label.contentsRect().size()
+        self.io.submit(
+            self._create_transaction,
+            size.width(),
+            size.height(),
+            on_done=self._on_transaction_created,
+            on_error=lambda e: self._on_transaction_created(None)
+        )
 
-            
+    def _create_transaction(self, width: int, height: int) -> Optional[Dict]:
+        """I/O thread: create the charge and pre-render its QR, so the GUI thread only shows it"""
+        transaction_data = self.payment_manager.payment_client.create_qris_transaction(
+            self.amount, self.item_details
+        )
+        if transaction_data and transaction_data.get("qr_string"):
+            try:
+                render_qr_image(transaction_data["qr_string"], width, height)
+            except Exception as e:
+                # Dicoba lagi (dan dilaporkan) oleh _generate_and_display_qr di GUI thread
+                logger.warning(f"QR pre-render failed: {e}")
+        return transaction_data
+
+    def _on_transaction_created(self, transaction_data: Optional[Dict]):
+        """Runs on the GUI thread once Midtrans has answered"""
+        if self._finished:
+            return
+        try:
+            self.transaction_data = transaction_data
             if self.transaction_data and self.transaction_data.get("qr_string"):
                 self._generate_and_display_qr(self.transaction_data["qr_string"])
                 self.status_check_timer.start()
@@ -676,49 +1440,37 @@ class QRPaymentDialog(QDialog):
             self.handle_payment_failed(str(e))
 
     def _generate_and_display_qr(self, qr_string: str):
-        """Generate and display QR code"""
+        """Render the QR code at the label's exact content size and display it"""
         try:
-            # Generate QR code
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(qr_string)
-            qr.make(fit=True)
-
-            # Create QR image
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Convert to QPixmap
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            qimage = QImage.fromData(buffer.getvalue())
-            pixmap = QPixmap.fromImage(qimage)
-            
-            # Display QR code
-            scaled_pixmap = pixmap.scaled(
-                self.qr_label.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            self.qr_label.setPixmap(scaled_pixmap)
+            size = self.qr_label.contentsRect().size()
+            image = render_qr_image(qr_string, size.width(), size.height())
+            self.qr_label.setPixmap(QPixmap.fromImage(image))
             
         except Exception as e:
             logger.error(f"Error generating QR code: {e}")
             self.handle_payment_failed("Failed to generate QR code")
 
     def check_payment_status(self):
-        """Check payment status periodically"""
-        if not self.transaction_data:
+        """Check payment status periodically (without blocking the GUI thread)"""
+        # Satu request status sekaligus; tick berikutnya dilewati kalau masih jalan
+        if not self.transaction_data or self._status_pending:
+            return
+
+        self._status_pending = True
+        self.io.submit(
+            self.payment_manager.payment_client.get_transaction_status,
+            self.transaction_data["order_id"],
+            on_done=self._on_payment_status,
+            on_error=lambda e: self._on_payment_status(None)
+        )
+
+    def _on_payment_status(self, status_data: Optional[Dict]):
+        """Runs on the GUI thread with the Midtrans status result"""
+        self._status_pending = False
+        if self._finished:
             return
             
         try:
-            status_data = self.payment_manager.payment_client.get_transaction_status(
-                self.transaction_data["order_id"]
-            )
-            
             if status_data:
                 status = status_data["status"]
                 logger.info(f"Payment status: {status}")
@@ -779,6 +1531,8 @@ class QRPaymentDialog(QDialog):
 
     def cleanup_timers(self):
         """Clean up timer resources"""
+        # Hasil Midtrans yang datang sesudah dialog selesai diabaikan
+        self._finished = True
         self.status_check_timer.stop()
         self.countdown_timer.stop()
 
@@ -855,16 +1609,42 @@ class WaterController(QObject):
     filling_complete = pyqtSignal()
     error_occurred = pyqtSignal(str)
 
+    PROGRESS_INTERVAL_MS = 50  # progress ke UI paling banyak 20x per detik
+    PERIOD_ALPHA = 0.1         # EWMA periode antar pulsa
+    LATENCY_ALPHA = 0.5        # EWMA latency stop antar fill
+    MIN_RATE_PULSES = 5        # pulsa minimum sebelum laju dipakai untuk prediksi
+    MAX_STOP_LATENCY = 2.0
+    SETTLE_TIME = 0.3          # aliran dianggap berhenti setelah sekian detik tanpa pulsa
+    MAX_SETTLE_TIME = 3.0
+    FILL_STATS_SIZE = 100
+    STOP_RETRY_WINDOW = 5.0    # detik mencoba mematikan relay sebelum dianggap gagal
+    STOP_RETRY_DELAY = 0.5
+    SHUTDOWN_STOP_WINDOW = 3.0
+    FAULT_RETRY_MS = 10000     # pompa gagal mati: terus dicoba di belakang
+
     def __init__(self):
         super().__init__()
         self.config = ConfigManager()
         self.hardware = HardwareController()
         self.api_client = APIClient()
+        self.esp32 = ESP32Client()
+        self.io = IOExecutor.instance()
         self.pulse_count = 0
         self.is_running = False
         self.target_pulses = 0
         self._lock = threading.Lock()
-
+        self._fill_started = None
+        self._pump_on = False
+        self.pump_fault = False
+        self._reset_flow_tracking()
+        self.stop_latency = self.config.hardware_config.stop_latency
+        self.fill_stats = deque(maxlen=self.FILL_STATS_SIZE)
+
+        # Ticker di GUI thread; pulse_callback sendiri tidak pernah emit signal
+        self._progress_timer = QTimer(self)
+        self._progress_timer.setInterval(self.PROGRESS_INTERVAL_MS)
+        self._progress_timer.timeout.connect(self._emit_progress)
+        self._last_progress = -1
 
         # Initialize GPIO for flow sensor
         if HARDWARE_AVAILABLE:
@@ -881,7 +1661,14 @@ class WaterController(QObject):
         try:
             # Force stop the motor immediately
             self.is_running = False
-            self._control_esp32_relay(False)
+            try:
+                # Lewat executor kontrol supaya tidak balapan dengan relay-off yang sedang berjalan
+                stopped = self.io.submit(self._stop_pump, self.SHUTDOWN_STOP_WINDOW, control=True).result()
+            except RuntimeError:
+                # Executor sudah ditutup (force_cleanup)
+                stopped = self._stop_pump(self.SHUTDOWN_STOP_WINDOW)
+            if not stopped:
+                logger.critical("Pump relay did not switch off during shutdown")
             
             # Clean up GPIO
             if HARDWARE_AVAILABLE:
@@ -906,25 +1693,122 @@ class WaterController(QObject):
         self.force_shutdown()
         logger.info("WaterController cleanup completed")
 
+    def _reset_flow_tracking(self):
+        self._last_pulse = None
+        self._pulse_period = None
+        self._cutoff_at = None
+        self._cutoff_pulses = None
+        self._cutoff_period = None
+        self._cutoff_forced = False
+        self._stopped_at = None
+
     def pulse_callback(self, channel):
-        """Handle flow sensor pulse with thread safety."""
+        """
+        Handle one flow sensor pulse.
+
+        Runs once per pulse on the GPIO callback thread (the only writer of
+        pulse_count), so it only counts and tracks the pulse period; no
+        lock, logging or Qt signals. Progress is published by _emit_progress.
+        Pulses after the cutoff are still counted: that is the overshoot.
+        """
         if not self.is_running:
             return
-            
+        now = time.monotonic()
+        count = self.pulse_count + 1
+        self.pulse_count = count
+        if self._last_pulse is not None:
+            interval = now - self._last_pulse
+            period = self._pulse_period
+            self._pulse_period = interval if period is None else period + self.PERIOD_ALPHA * (interval - period)
+        self._last_pulse = now
+
+        if self._cutoff_at is None:
+            # Pulsa yang masih akan lewat selama relay dimatikan
+            period = self._pulse_period
+            lead = self.stop_latency / period if count >= self.MIN_RATE_PULSES and period else 0.0
+            if count + lead >= self.target_pulses:
+                self._cut_off()
+
+    def _cut_off(self, forced: bool = False) -> bool:
+        """Send the relay-off command, once per fill"""
         with self._lock:
-            self.pulse_count += 1
-            progress = min(100, int((self.pulse_count / self.target_pulses) * 100))
-            
-            logger.info(f"Water Flow - Pulses: {self.pulse_count}/{self.target_pulses} | Progress: {progress}%")
-            # Calculate current volume in ml
-            current_volume_ml = (self.pulse_count / self.config.hardware_config.pulse_per_liter) * 1000
-            logger.info(f"Current Volume Dispensed: {current_volume_ml:.2f} ml")
-            
+            if not self.is_running or self._cutoff_at is not None:
+                return False
+            self._cutoff_at = time.monotonic()
+            self._cutoff_pulses = self.pulse_count
+            self._cutoff_period = self._pulse_period
+            self._cutoff_forced = forced
+        # Deactivate ESP32 relay without blocking the GPIO callback thread
+        self._submit_stop()
+        return True
+
+    def _submit_stop(self):
+        self.io.submit(self._stop_pump, control=True, on_done=self._on_pump_stopped,
+                       on_error=lambda e: self._on_pump_stopped(False))
+
+    def _stop_pump(self, window: Optional[float] = None) -> bool:
+        """Relay off, retried until the ESP32 reports it OFF or the window runs out (control executor)"""
+        deadline = time.monotonic() + (window if window is not None else self.STOP_RETRY_WINDOW)
+        while True:
+            if self._control_esp32_relay(False):
+                return True
+            if time.monotonic() + self.STOP_RETRY_DELAY >= deadline:
+                return False
+            time.sleep(self.STOP_RETRY_DELAY)
+
+    def _on_pump_stopped(self, deactivated: bool):
+        """Runs on the GUI thread once the relay-off command (with retries) is done"""
+        if deactivated:
+            self._pump_on = False
+            self._stopped_at = time.monotonic()
+            if self.pump_fault:
+                self.pump_fault = False
+                logger.warning("Pump relay confirmed OFF, pump fault cleared")
+            return
+
+        # Pompa mungkin masih menyala: fill tidak dilaporkan selesai dan fill baru diblokir
+        if not self.pump_fault:
+            self.pump_fault = True
+            logger.critical("Pump relay did not switch off, filling disabled until it does")
+            if self.is_running:
+                self._cutoff_forced = True
+                self._finish_fill(completed=False)
+            self.error_occurred.emit("Pump did not stop")
+        QTimer.singleShot(self.FAULT_RETRY_MS, self._retry_stop)
+
+    def _retry_stop(self):
+        if not self.pump_fault:
+            return
+        try:
+            self._submit_stop()
+        except RuntimeError:
+            pass  # aplikasi sedang ditutup; force_shutdown yang mencoba terakhir
+
+    def _progress(self) -> int:
+        if not self.target_pulses:
+            return 0
+        return min(100, self.pulse_count * 100 // self.target_pulses)
+
+    def _emit_progress(self):
+        """
+        Ticker on the GUI thread: publish progress when it changed, and
+        finish the fill once the flow has stopped after the cutoff.
+        """
+        if not self.is_running:
+            self._progress_timer.stop()
+            return
+        progress = self._progress()
+        if progress != self._last_progress:
+            self._last_progress = progress
             self.update_progress.emit(progress)
-            
-            if self.pulse_count >= self.target_pulses:
-                self.stop_filling()
 
+        # Selesai hanya setelah relay terkonfirmasi OFF dan aliran berhenti
+        cutoff_at, stopped_at = self._cutoff_at, self._stopped_at
+        if cutoff_at is not None and stopped_at is not None:
+            now = time.monotonic()
+            quiet = now - max(self._last_pulse or cutoff_at, cutoff_at)
+            if quiet >= self.SETTLE_TIME or now - stopped_at >= self.MAX_SETTLE_TIME:
+                self._finish_fill()
 
     def calculate_target_pulses(self, volume_ml: float) -> int:
         """Calculate target pulses based on volume and calibration factor."""
@@ -933,6 +1817,9 @@ class WaterController(QObject):
 
     def start_filling(self, size: str) -> bool:
         """Start the water filling process for given size."""
+        if self.pump_fault:
+            self.error_occurred.emit("Pump fault: relay did not switch off")
+            return False
         if size not in WATER_VOLUMES:
             self.error_occurred.emit("Invalid size selected")
             return False
@@ -941,19 +1828,32 @@ class WaterController(QObject):
         # Calculate target pulses based on selected volume
         # self.target_pulses = self.calculate_target_pulses(float(volume.name.split()[0]))
         self.target_pulses = volume.pulses
+        self.current_volume = volume
+        self.current_price = int(volume.price.replace("Rp. ", "").replace(".", ""))
         self.pulse_count = 0
+        self._reset_flow_tracking()
         self.is_running = True
         
         logger.info(f"Starting filling process for {size} with target {self.target_pulses} pulses")
         
-        # Activate ESP32 relay
-        if not self._control_esp32_relay(True):
+        # Activate ESP32 relay in the background; filling starts once it answers
+        self.io.submit(self._control_esp32_relay, True, control=True, on_done=self._on_pump_started)
+        return True
+
+    def _on_pump_started(self, activated: bool):
+        """Runs on the GUI thread after the relay-on command"""
+        if not activated:
+            self.is_running = False
             self.error_occurred.emit("Failed to activate pump")
-            return False
+            return
+        
+        self._pump_on = True
+        self._fill_started = time.monotonic()
+        self._last_progress = -1
+        self._progress_timer.start()
         
         # Start filling process in separate thread
         threading.Thread(target=self._filling_process, daemon=True).start()
-        return True
 
 
     def _filling_process(self):
@@ -977,17 +1877,26 @@ class WaterController(QObject):
     
     def _simulate_flow(self):
         """Simulate flow sensor pulses when hardware is not available."""
-        while self.is_running and self.pulse_count < self.target_pulses:
-            time.sleep(0.01)  # Simulate 10 pulses per second
+        # Air tetap mengalir sampai relay benar-benar mati, seperti di mesin asli
+        while self.is_running and self._pump_on:
+            time.sleep(0.01)  # Simulate 100 pulses per second
             self.pulse_callback(None)
 
 
     def stop_filling(self):
-        """Stop the filling process safely and record sale."""
-        self.is_running = False
-        
-        # Deactivate ESP32 relay
-        self._control_esp32_relay(False)
+        """Stop the pump now and finish the fill without waiting for the flow to settle."""
+        self._cut_off(forced=True)
+        self._finish_fill()
+
+    def _finish_fill(self, completed: bool = True):
+        """
+        Record the sale and fill statistics; runs once per fill.
+        filling_complete is only emitted when the pump is known to be off.
+        """
+        with self._lock:
+            if not self.is_running:
+                return
+            self.is_running = False
         
         if HARDWARE_AVAILABLE:
             try:
@@ -996,75 +1905,299 @@ class WaterController(QObject):
                 logger.warning(f"Failed to remove event detection: {e}")
         
         # Calculate actual volume dispensed
-        actual_volume = (self.pulse_count / self.config.hardware_config.pulse_per_liter) * 1000
+        pulses = self.pulse_count
+        actual_volume = (pulses / self.config.hardware_config.pulse_per_liter) * 1000
         
         # Record sale
         try:
             if hasattr(self, 'current_volume'):
                 sale_data = {
-                    'volume': actual_volume,
+                    'volume': int(round(actual_volume)),
                     'price': self.current_price,
-                    'pulse_count': self.pulse_count
+                    'pulse_count': pulses
                 }
                 self.api_client.record_sale(sale_data)
         except Exception as e:
             logger.error(f"Failed to record sale: {e}")
         
-        self.filling_complete.emit()
-        logger.info(f"Filling completed. Pulses: {self.pulse_count}/{self.target_pulses}")
+        self.update_progress.emit(self._progress())
+        if completed:
+            self.filling_complete.emit()
+        self._log_fill_summary(pulses, actual_volume)
+
+    def _record_fill_stats(self, pulses: int) -> Dict[str, Any]:
+        """Overshoot of this fill; also updates the learned stop latency"""
+        after_cutoff = pulses - self._cutoff_pulses if self._cutoff_pulses is not None else 0
+        measured_latency = None
+        settled = self._last_pulse is not None and self._cutoff_at is not None and (
+            time.monotonic() - max(self._last_pulse, self._cutoff_at) >= self.SETTLE_TIME)
+        if not self._cutoff_forced and settled and self._cutoff_period:
+            # Pulsa sesudah perintah stop x periode saat stop ~= waktu sampai aliran berhenti
+            measured_latency = min(after_cutoff * self._cutoff_period, self.MAX_STOP_LATENCY)
+            self.stop_latency += self.LATENCY_ALPHA * (measured_latency - self.stop_latency)
+        stats = {
+            'target': self.target_pulses,
+            'pulses': pulses,
+            'overshoot': pulses - self.target_pulses,
+            'cutoff_pulses': self._cutoff_pulses,
+            'after_cutoff': after_cutoff,
+            'flow_rate': 1 / self._cutoff_period if self._cutoff_period else None,
+            'measured_latency': measured_latency,
+            'forced': self._cutoff_forced,
+        }
+        self.fill_stats.append(stats)
+        return stats
+
+    def overshoot_summary(self) -> Dict[str, float]:
+        """Overshoot (pulses) over the recent predictive fills"""
+        overshoots = [stats['overshoot'] for stats in self.fill_stats if not stats['forced']]
+        if not overshoots:
+            return {'fills': 0}
+        return {
+            'fills': len(overshoots),
+            'mean': sum(overshoots) / len(overshoots),
+            'mean_abs': sum(abs(value) for value in overshoots) / len(overshoots),
+            'max_abs': max(abs(value) for value in overshoots),
+        }
+
+    def _log_fill_summary(self, pulses: int, volume_ml: float):
+        """One log line per fill instead of one per pulse"""
+        duration = time.monotonic() - self._fill_started if self._fill_started else 0.0
+        flow = volume_ml / duration if duration > 0 else 0.0
+        stats = self._record_fill_stats(pulses)
+        summary = self.overshoot_summary()
+        ml_per_pulse = 1000 / self.config.hardware_config.pulse_per_liter
+        latency = (f"{stats['measured_latency']:.3f}s" if stats['measured_latency'] is not None
+                   else "n/a")
+        logger.info(
+            f"Filling completed. Pulses: {pulses}/{self.target_pulses} | "
+            f"Volume: {volume_ml:.1f} ml | Duration: {duration:.2f}s | Avg flow: {flow:.1f} ml/s | "
+            f"Overshoot: {stats['overshoot']:+d} pulses ({stats['overshoot'] * ml_per_pulse:+.1f} ml), "
+            f"cutoff at {stats['cutoff_pulses']}, stop latency {latency} (next {self.stop_latency:.3f}s)"
+            + (f" | Last {summary['fills']} fills: mean {summary['mean']:+.1f}, "
+               f"mean |err| {summary['mean_abs']:.1f}, max |err| {summary['max_abs']} pulses"
+               if summary['fills'] else "")
+        )
 
     
     def _control_esp32_relay(self, state: bool) -> bool:
-        """Control ESP32 relay via HTTP request."""
-        try:
-            url = f"http://{self.config.hardware_config.esp32_ip}:{self.config.hardware_config.esp32_port}/toggleRelay"
-            response = requests.get(url, timeout=5)
-            
-            if response.status_code == 200:
-                logger.info(f"Relay {'activated' if state else 'deactivated'} successfully")
-                return True
-            else:
-                logger.error(f"Failed to control relay: HTTP {response.status_code}")
-                return False
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error controlling ESP32 relay: {e}")
+        """Set ESP32 relay on/off (no-op if it is already in that state)."""
+        if self.esp32.set_relay(state):
+            logger.info(f"Relay {'activated' if state else 'deactivated'} successfully")
+            return True
+        logger.error(f"Failed to {'activate' if state else 'deactivate'} relay")
+        return False
+
+def fit_size(frame_width: int, frame_height: int, target_width: int, target_height: int) -> Optional[Tuple[int, int]]:
+    """Largest (width, height) with the frame's aspect ratio that fits the target"""
+    if target_width <= 0 or target_height <= 0:
+        return None
+    scale = min(target_width / frame_width, target_height / frame_height)
+    return max(int(frame_width * scale), 1), max(int(frame_height * scale), 1)
+
+
+class RawVideoReader:
+    """cv2.VideoCapture-like reader over a memory-mapped BGRA frame file from VideoCache"""
+
+    def __init__(self, path: str, meta: Dict[str, Any]):
+        self.fps = meta['fps']
+        self.frames = np.memmap(path, dtype=np.uint8, mode='r',
+                                shape=(meta['frames'], meta['height'], meta['width'], 4))
+        self.position = 0
+
+    def isOpened(self) -> bool:
+        return self.frames is not None and len(self.frames) > 0
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.frames)
+        return 0
+
+    def set(self, prop, value) -> bool:
+        if prop != cv2.CAP_PROP_POS_FRAMES:
             return False
+        self.position = int(value)
+        return True
+
+    def read(self):
+        if self.position >= len(self.frames):
+            return False, None
+        frame = self.frames[self.position]
+        self.position += 1
+        return True, frame
+
+    def release(self):
+        self.frames = None
+
+
+def open_video(path: str):
+    """Open a source video or a VideoCache entry"""
+    if path.endswith(VideoCache.RAW_SUFFIX):
+        with open(path[:-len(VideoCache.RAW_SUFFIX)] + '.json') as f:
+            return RawVideoReader(path, json.load(f))
+    return cv2.VideoCapture(path)
+
 
 class VideoThread(QThread):
+    """
+    Decode the ad video and deliver frames that are ready to blit.
+
+    Each frame is resized to the label size (keeping aspect ratio) and
+    converted to Qt's native RGB32 layout here in the worker, into a small
+    ring of reusable buffers that the emitted QImage wraps without copying.
+    Frames from a VideoCache raw file already have that size and layout and
+    are handed over straight from the memory map. A new frame is only
+    emitted after the GUI has shown the previous one, so a busy GUI thread
+    drops frames instead of queueing them. Frames are paced from the
+    container FPS against an absolute clock. While the machine is idle
+    playback drops to idle_video_fps, or stops when that is 0.
+    """
     frame_ready = pyqtSignal(QImage)
+
+    DEFAULT_FPS = 30.0
+    BUFFER_COUNT = 2
+    MAX_LAG = 0.5  # detik; lebih telat dari ini jadwal frame di-reset
     
-    def __init__(self, video_path):
+    def __init__(self, video_path, target_size: Optional[QSize] = None):
         super().__init__()
         self.video_path = video_path
         self.running = True
         self.mutex = QMutex()
+        self.idle_fps = ConfigManager().app_config.idle_video_fps
+        self._idle = False
+        # Membangunkan thread dari jeda antar frame (stop atau perubahan mode idle)
+        self._wake = threading.Event()
+        self._frame_shown = threading.Event()
+        self._frame_shown.set()
+        self._target_size = (target_size.width(), target_size.height()) if target_size else None
+        self._next_source = None
+
+    def set_target_size(self, size: QSize):
+        """Called from the GUI thread when the video label is resized"""
+        with QMutexLocker(self.mutex):
+            self._target_size = (size.width(), size.height())
+
+    def set_source(self, path: str):
+        """Switch to another file (e.g. a VideoCache entry) at the next frame"""
+        with QMutexLocker(self.mutex):
+            if path != self.video_path:
+                self._next_source = path
+
+    def frame_shown(self):
+        """Called from the GUI thread once the last frame is on screen"""
+        self._frame_shown.set()
+
+    def set_idle(self, idle: bool):
+        """Slow down or pause playback while idle; resuming shows the next frame at once"""
+        self._idle = idle
+        self._wake.set()
+
+    def _fit(self, frame_width: int, frame_height: int) -> Optional[Tuple[int, int]]:
+        with QMutexLocker(self.mutex):
+            target = self._target_size
+        if not target:
+            return None
+        return fit_size(frame_width, frame_height, *target)
+
+    def _open(self, path: str):
+        cap = open_video(path)
+        if not cap.isOpened():
+            logger.error(f"Failed to open video file {path}")
+            return None, None
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not fps or fps != fps or fps > 120:
+            fps = self.DEFAULT_FPS
+        return cap, 1.0 / fps
+
+    def _take_next_source(self) -> Optional[str]:
+        with QMutexLocker(self.mutex):
+            path, self._next_source = self._next_source, None
+        return path
         
     def run(self):
         try:
-            cap = cv2.VideoCapture(self.video_path)
-            if not cap.isOpened():
-                logger.error("Failed to open video file")
+            cap, interval = self._open(self.video_path)
+            if cap is None:
                 return
+            buffers, buffer_index, size = [], 0, None
+            clock_start, frame_number = time.monotonic(), 0
                 
             while self.running:
+                idle = self._idle
+                if idle and self.idle_fps <= 0:
+                    # Decoding berhenti total sampai ada pelanggan; frame terakhir tetap tampil
+                    self._wake.wait()
+                    self._wake.clear()
+                    # -1: frame pertama setelah bangun langsung tampil tanpa menunggu interval
+                    clock_start, frame_number = time.monotonic(), -1
+                    continue
+
+                # Ganti sumber hanya saat GUI tidak sedang memakai frame dari sumber lama
+                if self._next_source is not None and self._frame_shown.is_set():
+                    path = self._take_next_source()
+                    next_cap, next_interval = self._open(path)
+                    if next_cap is not None:
+                        cap.release()
+                        cap, interval = next_cap, next_interval
+                        self.video_path = path
+                        clock_start, frame_number = time.monotonic(), 0
+                        logger.info(f"Playing video from {path}")
+
                 ret, frame = cap.read()
                 if not ret:
                     cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Reset video
                     continue
+
+                # Pacing terhadap jam absolut supaya error sleep tidak menumpuk
+                frame_number += 1
+                frame_interval = max(interval, 1.0 / self.idle_fps) if idle else interval
+                delay = clock_start + frame_number * frame_interval - time.monotonic()
+                if delay > 0:
+                    if self._wake.wait(delay):
+                        # Mode berubah: frame ini langsung ditampilkan, jadwal mulai dari sekarang
+                        self._wake.clear()
+                        if not self.running:
+                            break
+                        clock_start, frame_number = time.monotonic(), 0
+                elif -delay > self.MAX_LAG:
+                    clock_start, frame_number = time.monotonic(), 0
+
+                if not self._frame_shown.is_set():
+                    continue  # GUI masih sibuk; frame ini dilewati
+
+                frame_size = (frame.shape[1], frame.shape[0])
+                fitted = self._fit(*frame_size)
+                if fitted is None:
+                    continue
+                if fitted != size:
+                    # Dialokasikan ulang hanya saat ukuran label berubah, dan hanya
+                    # setelah GUI selesai memakai frame yang menunjuk buffer lama
+                    size = fitted
+                    buffers = [np.empty((size[1], size[0], 4), dtype=np.uint8) for _ in range(self.BUFFER_COUNT)]
+                    resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+
+                if frame.shape[2] == 4 and frame_size == size:
+                    pixels = frame  # frame cache, sudah siap tampil
+                else:
+                    pixels = buffers[buffer_index]
+                    buffer_index = (buffer_index + 1) % self.BUFFER_COUNT
+                    if frame.shape[2] == 4:
+                        cv2.resize(frame, size, dst=pixels, interpolation=cv2.INTER_LINEAR)
+                    else:
+                        if frame_size != size:
+                            cv2.resize(frame, size, dst=resized, interpolation=cv2.INTER_LINEAR)
+                            frame = resized
+                        cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=pixels)
+
+                # BGRA di memori = QImage.Format_RGB32 (little-endian), tanpa konversi lagi di GUI
+                image = QImage(pixels.data, size[0], size[1], size[0] * 4, QImage.Format_RGB32)
+                self._frame_shown.clear()
+                self.frame_ready.emit(image)
                 
-                with QMutexLocker(self.mutex):
-                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    h, w, ch = rgb_frame.shape
-                    bytes_per_line = ch * w
-                    
-                    image = QImage(rgb_frame.data.tobytes(), w, h, bytes_per_line, QImage.Format_RGB888)
-                    image = image.copy()
-                    
-                    self.frame_ready.emit(image)
-                    
-                time.sleep(0.033)  # ~30 FPS
-                
+            # Frame terakhir mungkin masih menunjuk memory map
+            self._frame_shown.wait(0.5)
             cap.release()
             
         except Exception as e:
@@ -1082,69 +2215,325 @@ class VideoThread(QThread):
         """Stop the thread safely"""
         with QMutexLocker(self.mutex):
             self.running = False
+        self._wake.set()
+
+class VideoCache(QObject):
+    """
+    Display-sized copy of the ad video, built once per (source hash, frame size).
+
+    Videos that fit in video_cache_max_mb are stored as raw BGRA frames which
+    VideoThread memory-maps and hands to Qt without any decoding; longer
+    ones are re-encoded as MJPEG at display size, which is cheap to decode
+    on the Pi. Entries are looked up / built in a background thread and
+    cache_ready is emitted with the file to play. A changed source file gets
+    a new hash, so it is rebuilt once; an unchanged one is never re-hashed
+    (the hash is remembered per path, size and mtime).
+    """
+    cache_ready = pyqtSignal(str)
+
+    FORMAT_VERSION = 1
+    RAW_SUFFIX = '.bgra'
+    MJPEG_SUFFIX = '.avi'
+    MJPEG_QUALITY = 90
+    HASH_CHUNK = 1 << 20
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.config = ConfigManager()
+        self._worker = None
+        self._cancel = threading.Event()
+
+    @property
+    def cache_dir(self) -> str:
+        return self.config.app_config.video_cache_dir
+
+    def request(self, source: str, target_size: QSize):
+        """Look up or build the entry for source at target_size; cancels an unfinished request"""
+        # Worker lama berhenti sendiri di frame berikutnya; GUI tidak menunggu
+        self._cancel.set()
+        self._cancel = threading.Event()
+        self._worker = threading.Thread(
+            target=self._prepare,
+            args=(source, (target_size.width(), target_size.height()), self._cancel),
+            name='video-cache',
+            daemon=True
+        )
+        self._worker.start()
+
+    def _prepare(self, source: str, target: Tuple[int, int], cancel: threading.Event):
+        try:
+            path = self.lookup(source, target) or self.build(source, target, cancel)
+            if path and not cancel.is_set():
+                self.cache_ready.emit(path)
+        except Exception as e:
+            logger.error(f"Error preparing video cache: {e}")
+
+    def _source_hash(self, source: str) -> str:
+        """sha1 of the source file, memoized in index.json by path, size and mtime"""
+        index_path = os.path.join(self.cache_dir, 'index.json')
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        stat = os.stat(source)
+        key = os.path.abspath(source)
+        entry = index.get(key)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha1']
+
+        digest = hashlib.sha1()
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK), b''):
+                digest.update(chunk)
+        index[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': digest.hexdigest()}
+        tmp_path = f"{index_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+        return index[key]['sha1']
+
+    def _entry_base(self, source: str, target: Tuple[int, int]) -> Tuple[str, str, Tuple[int, int]]:
+        """(path without suffix, source hash, frame size) for source shown at target"""
+        cap = cv2.VideoCapture(source)
+        try:
+            frame_size = fit_size(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                  int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), *target)
+        finally:
+            cap.release()
+        if frame_size is None:
+            raise ValueError(f"Cannot read video size of {source}")
+        source_hash = self._source_hash(source)
+        name = f"{source_hash[:16]}_{frame_size[0]}x{frame_size[1]}_v{self.FORMAT_VERSION}"
+        return os.path.join(self.cache_dir, name), source_hash, frame_size
+
+    def lookup(self, source: str, target: Tuple[int, int]) -> Optional[str]:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        base, _, _ = self._entry_base(source, target)
+        for suffix in (self.RAW_SUFFIX, self.MJPEG_SUFFIX):
+            if os.path.exists(base + suffix):
+                return base + suffix
+        return None
+
+    def build(self, source: str, target: Tuple[int, int], cancel: threading.Event) -> Optional[str]:
+        base, source_hash, (width, height) = self._entry_base(source, target)
+        cap = cv2.VideoCapture(source)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not fps or fps != fps or fps > 120:
+            fps = VideoThread.DEFAULT_FPS
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        raw = 0 < frame_count * width * height * 4 <= self.config.app_config.video_cache_max_mb * 1024 * 1024
+        path = base + (self.RAW_SUFFIX if raw else self.MJPEG_SUFFIX)
+        tmp_path = base + '.tmp' + (self.RAW_SUFFIX if raw else self.MJPEG_SUFFIX)
+        started = time.monotonic()
+        logger.info(f"Building {'raw' if raw else 'MJPEG'} video cache {path} from {source}")
+
+        resized = np.empty((height, width, 3), dtype=np.uint8)
+        bgra = np.empty((height, width, 4), dtype=np.uint8)
+        written = 0
+        try:
+            if raw:
+                output = open(tmp_path, 'wb')
+            else:
+                output = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+                output.set(cv2.VIDEOWRITER_PROP_QUALITY, self.MJPEG_QUALITY)
+            try:
+                while not cancel.is_set():
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    cv2.resize(frame, (width, height), dst=resized, interpolation=cv2.INTER_AREA)
+                    if raw:
+                        cv2.cvtColor(resized, cv2.COLOR_BGR2BGRA, dst=bgra)
+                        output.write(bgra.data)
+                    else:
+                        output.write(resized)
+                    written += 1
+            finally:
+                if raw:
+                    output.close()
+                else:
+                    output.release()
+                cap.release()
+
+            if cancel.is_set() or not written:
+                os.remove(tmp_path)
+                return None
+            if raw:
+                # Metadata dulu; file .bgra baru terlihat oleh lookup setelah lengkap
+                with open(base + '.json', 'w') as f:
+                    json.dump({'width': width, 'height': height, 'frames': written, 'fps': fps,
+                               'source': os.path.abspath(source)}, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._prune(source_hash, keep=base)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        logger.info(f"Video cache ready: {written} frames, {size_mb:.1f} MB in {time.monotonic() - started:.1f}s")
+        return path
+
+    def _prune(self, source_hash: str, keep: str):
+        """Drop entries of the same source built for another size or format version"""
+        prefix = source_hash[:16] + '_'
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(prefix) and not path.startswith(keep + '.'):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove old video cache {path}: {e}")
+
+    def cancel(self):
+        self._cancel.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+            self._worker = None
+
+    def cleanup(self):
+        """Stop an unfinished build; partial files are removed"""
+        self.cancel()
+
 
 class SensorThread(QThread):
+    """
+    Receive sensor readings pushed by the ESP32 over WebSocket.
+
+    Each reading is emitted on sensor_updated as soon as it arrives and kept
+    in a latest-value cache (see latest()). Lost connections are retried
+    with backoff; meanwhile /data is polled over HTTP so the display keeps
+    working with firmware that has no WebSocket server. While the machine is
+    idle, readings reach the display (and polls happen) only every
+    idle_sensor_interval seconds.
+    """
     sensor_updated = pyqtSignal(dict)
+
+    HEARTBEAT_TIMEOUT = 15  # firmware mengirim heartbeat tiap 10 detik
+    OPEN_TIMEOUT = 2
+    RECONNECT_MAX_DELAY = 30
     
     def __init__(self, esp32_ip):
         super().__init__()
         self.config = ConfigManager()
         self.api_client = APIClient()
+        self.esp32 = ESP32Client()
         self.esp32_ip = esp32_ip
         self.running = True
+        self._websocket = None
+        self._reconnect_failures = 0
+        self._idle = False
+        self._last_emit = 0.0
+        self._cache_lock = threading.Lock()
         self._last_successful_data = None
-        
+        self._last_update = None
+
+    def set_idle(self, idle: bool):
+        self._idle = idle
+        if not idle:
+            # Tampilan langsung menyusul pembacaan yang ditahan selama idle
+            data = self.latest()
+            if data is not None:
+                self.sensor_updated.emit(data)
+
+    def _interval(self) -> float:
+        app = self.config.app_config
+        return max(app.update_interval, app.idle_sensor_interval) if self._idle else app.update_interval
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[dict]:
+        """Most recent reading, or None if there is none younger than max_age seconds"""
+        with self._cache_lock:
+            data, updated = self._last_successful_data, self._last_update
+        if data is None or (max_age is not None and time.monotonic() - updated > max_age):
+            return None
+        return data
+
+    def _publish(self, data: dict):
+        now = time.monotonic()
+        with self._cache_lock:
+            self._last_successful_data = data
+            self._last_update = now
+        # Saat idle cache tetap terbaru, tapi tampilan cukup diperbarui sesekali
+        if self._idle and now - self._last_emit < self._interval():
+            return
+        self._last_emit = now
+        self.sensor_updated.emit(data)
 
     def run(self):
         """Main thread loop with proper error handling"""
         while self.running:
-            try:
-                # Get sensor data from ESP32
-                data = self._get_sensor_data()
-                
-                if data:
-                    # Update last successful data
-                    self._last_successful_data = data
-                    
-                    # Send to backend
-                    # self._send_to_backend(data)
-                    
-                    # Emit signal with new data
-                    self.sensor_updated.emit(data)
-                else:
-                    # If failed to get new data, use last known good data
-                    if self._last_successful_data:
-                        self.sensor_updated.emit({
-                            **self._last_successful_data,
-                            'stale': True  # Indicate data is not fresh
-                        })
-                    else:
-                        self.sensor_updated.emit({'error': True})
-                        
-            except Exception as e:
-                logger.error(f"Error in sensor thread: {e}")
+            if WEBSOCKET_AVAILABLE:
+                try:
+                    self._stream()
+                except (OSError, TimeoutError, WebSocketException) as e:
+                    if self.running and self._reconnect_failures == 0:
+                        logger.warning(f"ESP32 sensor stream lost: {e}")
+                except Exception as e:
+                    logger.error(f"Error in sensor thread: {e}")
+                finally:
+                    self._websocket = None
+            if self.running:
+                self._poll_until_reconnect()
+
+    def _stream(self):
+        """Read pushed readings until the connection drops or the thread stops"""
+        hardware = self.config.hardware_config
+        url = f"ws://{hardware.esp32_ip}:{hardware.esp32_ws_port}"
+        with websocket_connect(url, open_timeout=self.OPEN_TIMEOUT, compression=None) as websocket:
+            self._websocket = websocket
+            if not self.running:
+                return
+            logger.info(f"Connected to ESP32 sensor stream at {url}")
+            self._reconnect_failures = 0
+            while self.running:
+                # Tidak ada pesan (termasuk heartbeat) terlalu lama -> koneksi dianggap mati
+                message = websocket.recv(timeout=self.HEARTBEAT_TIMEOUT)
+                try:
+                    data = json.loads(message)
+                except ValueError:
+                    logger.warning(f"Invalid sensor message from ESP32: {message[:100]!r}")
+                    continue
+                if not isinstance(data, dict) or data.get('type') == 'heartbeat':
+                    continue
+                self._publish(data)
+
+    def _poll_until_reconnect(self):
+        """Poll /data every update_interval (longer while idle) until the next WebSocket attempt is due"""
+        deadline = float('inf')
+        if WEBSOCKET_AVAILABLE:
+            self._reconnect_failures += 1
+            delay = min(2 ** (self._reconnect_failures - 1), self.RECONNECT_MAX_DELAY)
+            deadline = time.monotonic() + delay * random.uniform(0.5, 1.0)
+        last_poll = None
+        # Tidur dalam potongan kecil supaya stop() dan akhir mode idle tidak menunggu satu interval penuh
+        while self.running and time.monotonic() < deadline:
+            if last_poll is None or time.monotonic() - last_poll >= self._interval():
+                self._poll_once()
+                last_poll = time.monotonic()
+            time.sleep(0.1)
+
+    def _poll_once(self):
+        try:
+            data = self._get_sensor_data()
+            if data:
+                self._publish(data)
+            elif self._last_successful_data:
+                # If failed to get new data, use last known good data
+                self.sensor_updated.emit({
+                    **self._last_successful_data,
+                    'stale': True  # Indicate data is not fresh
+                })
+            else:
                 self.sensor_updated.emit({'error': True})
-            
-            # Wait before next update
-            time.sleep(self.config.app_config.update_interval)
+        except Exception as e:
+            logger.error(f"Error in sensor thread: {e}")
+            self.sensor_updated.emit({'error': True})
     
     def _get_sensor_data(self) -> dict:
         """Get sensor data from ESP32 with proper error handling"""
         try:
-            response = requests.get(
-                f"http://{self.config.hardware_config.esp32_ip}:{self.config.hardware_config.esp32_port}/data",
-                timeout=self.config.api_config.timeout
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            
-            logger.warning(f"Failed to get sensor data: HTTP {response.status_code}")
-            return None
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"ESP32 connection error: {e}")
-            return None
+            return self.esp32.get_data()
         except Exception as e:
             logger.error(f"Unexpected error getting sensor data: {e}")
             return None
@@ -1176,6 +2565,10 @@ class SensorThread(QThread):
     def stop(self):
         """Stop the thread safely"""
         self.running = False
+        websocket = self._websocket
+        if websocket is not None:
+            # Membangunkan recv() yang sedang menunggu
+            websocket.close()
 
 class WaterButton(QPushButton):
     def __init__(self, size_text, price_text, image_path, parent=None):
@@ -1287,6 +2680,8 @@ class MonitoringWidget(QWidget):
         try:
             self.sensor_thread = SensorThread(self.config.hardware_config.esp32_ip)
             self.sensor_thread.sensor_updated.connect(self.update_sensor_display)
+            if hasattr(self.parent(), 'activity'):
+                self.parent().activity.idle_changed.connect(self.sensor_thread.set_idle)
             self.sensor_thread.start()
         except Exception as e:
             logger.error(f"Failed to setup sensor thread: {e}")
@@ -1353,9 +2748,13 @@ border: 1px solid #E9ECEF;
 class MachineWidget(QWidget):
     filling_completed = pyqtSignal()
 
+    IR_POLL_MS = 100
+    IR_IDLE_POLL_MS = 500  # kedatangan tetap terdeteksi seketika lewat interrupt GPIO
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.main_window = parent
+        self.activity = getattr(parent, 'activity', None)
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         self.setMinimumHeight(120)
         self.config = ConfigManager()
@@ -1371,7 +2770,9 @@ class MachineWidget(QWidget):
         # Start IR detection timer
         self.ir_timer = QTimer()
         self.ir_timer.timeout.connect(self.check_ir_sensor)
-        self.ir_timer.start(100)  # Check every 100ms
+        self.ir_timer.start(self.IR_POLL_MS)
+        if self.activity is not None:
+            self.activity.idle_changed.connect(self.set_idle)
         
         # Initialize UI state
         self.progress = 0
@@ -1386,6 +2787,11 @@ class MachineWidget(QWidget):
 
     def handle_start_button_click(self):
         """Handle start button click"""
+        if self.water_controller.pump_fault:
+            # Jangan terima pembayaran selama pompa tidak bisa dimatikan
+            logger.error("Start refused: pump fault")
+            self.start_button.setEnabled(False)
+            return
         if not self.is_filling:
             # Disable button during payment process
             self.start_button.setEnabled(False)
@@ -1486,6 +2892,8 @@ class MachineWidget(QWidget):
             success = self.water_controller.start_filling(self.selected_size)
             if success:
                 self.is_filling = True
+                if self.activity is not None:
+                    self.activity.hold('filling')
                 self.progress = 0
                 self.start_button.setEnabled(False)
                 self.start_button.setText("Filling...")
@@ -1505,6 +2913,8 @@ class MachineWidget(QWidget):
         """Handle completion of filling process"""
         try:
             self.is_filling = False
+            if self.activity is not None:
+                self.activity.release('filling')
             self.start_button.setEnabled(True)
             self.start_button.setText("Start Filling")
             self.progress_indicator.setStyleSheet("color: #2ECC71; font-size: 24px;")
@@ -1531,21 +2941,38 @@ class MachineWidget(QWidget):
                 logger.info("IR sensor initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize IR sensor: {e}")
+                return
+            if self.activity is not None:
+                try:
+                    # Sensor aktif-low: falling edge = pelanggan datang, tanpa menunggu polling berikutnya
+                    GPIO.add_event_detect(self.config.hardware_config.ir_sensor_pin, GPIO.FALLING,
+                                          callback=lambda channel: self.activity.notify_presence(),
+                                          bouncetime=50)
+                except Exception as e:
+                    logger.warning(f"IR edge detection unavailable, relying on polling: {e}")
+
+    def set_idle(self, idle: bool):
+        """Poll the IR sensor less often while nobody is at the machine"""
+        self.ir_timer.setInterval(self.IR_IDLE_POLL_MS if idle else self.IR_POLL_MS)
 
     def check_ir_sensor(self):
         """Check IR sensor status and update button state"""
         if HARDWARE_AVAILABLE:
             try:
                 is_detected = not GPIO.input(self.config.hardware_config.ir_sensor_pin)
+                if self.activity is not None:
+                    self.activity.set_presence(is_detected)
                 if hasattr(self, 'selected_size'):
-                    self.start_button.setEnabled(is_detected and self.selected_size is not None)
+                    self.start_button.setEnabled(is_detected and self.selected_size is not None
+                                                 and not self.water_controller.pump_fault)
                 else:
                     self.start_button.setEnabled(False)
             except Exception as e:
                 logger.error(f"Error reading IR sensor: {e}")
         else:
             if hasattr(self, 'selected_size'):
-                self.start_button.setEnabled(self.selected_size is not None)
+                self.start_button.setEnabled(self.selected_size is not None
+                                             and not self.water_controller.pump_fault)
 
     def cleanup(self):
         """Clean up widget resources"""
@@ -1554,6 +2981,11 @@ class MachineWidget(QWidget):
             self.water_controller.cleanup()
         if hasattr(self, 'ir_timer'):
             self.ir_timer.stop()
+        if HARDWARE_AVAILABLE and self.activity is not None:
+            try:
+                GPIO.remove_event_detect(self.config.hardware_config.ir_sensor_pin)
+            except Exception:
+                pass
 
 class WaterSustainabilityApp(QMainWindow):
     def __init__(self):
@@ -1561,7 +2993,19 @@ class WaterSustainabilityApp(QMainWindow):
         self._cleanup_handlers = []
         self.config = ConfigManager()
         self.payment_manager = PaymentManager()
+        # Outbox tetap tersimpan di disk; worker hanya perlu dihentikan rapi
+        sync_worker = APIClient.start_sync_worker()
+        self.register_cleanup(sync_worker)
+        self.io = IOExecutor.instance()
+        self.stall_monitor = UIStallMonitor(parent=self)
+        # Dibuat sebelum widget supaya video, sensor dan IR bisa ikut mode idle
+        self.activity = ActivityGovernor(self.config.app_config.idle_timeout, parent=self)
+        self.activity.idle_changed.connect(sync_worker.set_idle)
+        self.register_cleanup(self.activity)
         self.initUI()
+        # Didaftarkan terakhir supaya relay-off dari cleanup widget masih sempat terkirim
+        self.register_cleanup(self.stall_monitor)
+        self.register_cleanup(self.io)
 
     def register_cleanup(self, handler):
         """Register objects that need cleanup"""
@@ -1649,8 +3093,12 @@ class WaterSustainabilityApp(QMainWindow):
             # Connect payment completion signal
             payment_dialog.payment_completed.connect(self.handle_payment_result)
             
-            # Show dialog and wait for result
-            payment_dialog.exec_()
+            # Show dialog and wait for result; customer may stand still while paying
+            self.activity.hold('payment')
+            try:
+                payment_dialog.exec_()
+            finally:
+                self.activity.release('payment')
             
         except Exception as e:
             logger.error(f"Error starting payment process: {e}")
@@ -1793,36 +3241,52 @@ class WaterSustainabilityApp(QMainWindow):
                 self.video_label.setText("Video not found")
                 return
                 
-            self.video_thread = VideoThread(video_path)
+            self.video_thread = VideoThread(video_path, self.video_label.contentsRect().size())
             self.video_thread.frame_ready.connect(self.update_video_frame, Qt.QueuedConnection)
+            self.activity.idle_changed.connect(self.video_thread.set_idle)
+            # Ukuran frame mengikuti label; resize dilakukan di thread video
+            self.video_label.installEventFilter(self)
             self.register_cleanup(self.video_thread)
             self.video_thread.start()
+
+            # Cache ukuran layar dibuat setelah ukuran label stabil
+            self.video_cache = VideoCache(self)
+            self.video_cache.cache_ready.connect(self.video_thread.set_source)
+            self.register_cleanup(self.video_cache)
+            self._video_cache_timer = QTimer(self)
+            self._video_cache_timer.setSingleShot(True)
+            self._video_cache_timer.setInterval(1000)
+            self._video_cache_timer.timeout.connect(self.prepare_video_cache)
             
         except Exception as e:
             logger.error(f"Error setting up video: {e}")
             self.video_label.setText(f"Error: {str(e)}")
 
     def update_video_frame(self, image):
-        """Update video frame with proper error handling"""
+        """Show a frame that VideoThread already scaled to the label size"""
         try:
             if not self.video_label or image.isNull():
                 return
-                
-            label_size = self.video_label.size()
-            if not label_size.isValid():
-                return
-                
-            scaled_pixmap = QPixmap.fromImage(image).scaled(
-                label_size,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            
-            if not scaled_pixmap.isNull():
-                self.video_label.setPixmap(scaled_pixmap)
-                
+            self.video_label.setPixmap(QPixmap.fromImage(image))
         except Exception as e:
             logger.error(f"Error updating video frame: {e}")
+        finally:
+            if hasattr(self, 'video_thread'):
+                self.video_thread.frame_shown()
+
+    def prepare_video_cache(self):
+        """Switch playback to a display-sized cache of the video (built once if missing)"""
+        size = self.video_label.contentsRect().size()
+        if hasattr(self, 'video_cache') and size.isValid():
+            self.video_cache.request(self.config.app_config.video_path, size)
+
+    def eventFilter(self, obj, event):
+        if obj is getattr(self, 'video_label', None) and event.type() == QEvent.Resize:
+            if hasattr(self, 'video_thread'):
+                self.video_thread.set_target_size(self.video_label.contentsRect().size())
+            if hasattr(self, '_video_cache_timer'):
+                self._video_cache_timer.start()
+        return super().eventFilter(obj, event)
 
     def on_size_selected(self, size):
         """Handle water size selection"""
@@ -0,0 +1,192 @@
+"""
+Pulse-storm benchmark for WaterController.pulse_callback.
+
+Drives a real WaterController (relay stubbed out, no GPIO needed) with
+simulated flow-sensor edges at a multiple of the sensor's maximum rate
+while the Qt event loop runs the progress ticker, and reports whether any
+pulse was missed. Edges keep coming until the (simulated) relay-off
+command completes, so the predictive cutoff and its overshoot are
+exercised as well.
+
+The edge source models the RPi.GPIO callback thread: edges that arrive
+while a callback is still running collapse into a single event, like the
+sysfs edge interrupt does. Those collapsed edges are the missed pulses.
+Edges lost because the thread itself woke up late are reported
+separately ("late wakeups"): they depend on the host scheduler, not on
+the callback.
+
+Usage (from the Raspi directory):
+    python pulse_storm_bench.py                 # 2x max rate, 5 fills
+    python pulse_storm_bench.py --legacy        # old per-pulse log/emit callback, for comparison
+    python pulse_storm_bench.py --multiplier 4 --fills 10 --stop-latency 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+# YF-S201: 30 L/min maksimum; kalibrasi pulsa per liter diambil dari WATER_VOLUMES
+SENSOR_MAX_LITRES_PER_MINUTE = 30
+FILL_SIZE = '1 Liter'
+
+BENCH_CONFIG = {
+    'api': {
+        'base_url': 'http://127.0.0.1:9',
+        'machine_id': 'BENCH',
+        'timeout': 1,
+        'retry_attempts': 1,
+        'retry_delay': 60,
+        'sync_max_backoff': 600
+    },
+    'hardware': {
+        'flow_sensor_pin': 26,
+        'motor_pin': 21,
+        'ir_sensor_pin': 23,
+        'esp32_ip': '127.0.0.1',
+        'esp32_port': 9,
+        'pulse_per_liter': 450
+    },
+    'app': {
+        'video_path': '',
+        'log_file': 'vending_machine.log',
+        'log_level': 'INFO',
+        'update_interval': 2
+    }
+}
+
+
+def load_kiosk():
+    """Import OFV2 inside a scratch directory so config/outbox/log files stay out of the tree"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp(prefix='pulse-storm-'))
+    with open('config.json', 'w') as f:
+        json.dump(BENCH_CONFIG, f)
+    import OFV2
+    OFV2.HARDWARE_AVAILABLE = False
+    return OFV2
+
+
+def legacy_pulse_callback(controller):
+    """Per-pulse lock + two log lines + signal, as pulse_callback used to do"""
+    def callback(channel):
+        if not controller.is_running:
+            return
+        with controller._lock:
+            controller.pulse_count += 1
+            progress = min(100, int((controller.pulse_count / controller.target_pulses) * 100))
+            logging.getLogger('OFV2').info(
+                f"Water Flow - Pulses: {controller.pulse_count}/{controller.target_pulses} | Progress: {progress}%")
+            current_volume_ml = (controller.pulse_count / controller.config.hardware_config.pulse_per_liter) * 1000
+            logging.getLogger('OFV2').info(f"Current Volume Dispensed: {current_volume_ml:.2f} ml")
+            controller.update_progress.emit(progress)
+        if controller.pulse_count >= controller.target_pulses:
+            controller.stop_filling()
+    return callback
+
+
+def pulse_storm(controller, rate, stats):
+    """Simulated GPIO edge thread; runs until the controller stops the fill"""
+    start = time.perf_counter()
+    handled = 0
+    while controller.is_running and controller._pump_on:
+        due = int((time.perf_counter() - start) * rate)
+        if due <= handled:
+            # Menunggu edge berikutnya tanpa memegang GIL, seperti epoll di RPi.GPIO
+            time.sleep(max((handled + 1) / rate - (time.perf_counter() - start), 0))
+            continue
+        # Thread bangun terlambat (scheduler host), bukan karena callback
+        stats['late'] += due - handled - 1
+        begin = time.perf_counter()
+        controller.pulse_callback(None)
+        end = time.perf_counter()
+        stats['callbacks'].append(end - begin)
+        handled = due
+        if controller.is_running and controller._pump_on:
+            # Edge yang jatuh selama callback berjalan menyatu jadi satu event
+            during = int((end - start) * rate) - due
+            if during > 1:
+                stats['missed'] += during - 1
+                handled += during - 1
+    stats['duration'] = time.perf_counter() - start
+
+
+def stub_relay(stop_latency):
+    def control(state):
+        if not state:
+            time.sleep(stop_latency)
+        return True
+    return control
+
+
+def run(multiplier, fills, legacy, stop_latency):
+    OFV2 = load_kiosk()
+    from PyQt5.QtCore import QEventLoop, QTimer
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    pulses_per_litre = OFV2.WATER_VOLUMES['1 Liter'].pulses
+    max_rate = pulses_per_litre * SENSOR_MAX_LITRES_PER_MINUTE / 60
+    rate = max_rate * multiplier
+
+    controller = OFV2.WaterController()
+    controller._control_esp32_relay = stub_relay(stop_latency)
+    if legacy:
+        controller.pulse_callback = legacy_pulse_callback(controller)
+
+    progress_updates = []
+    controller.update_progress.connect(progress_updates.append)
+
+    print(f"Sensor max {max_rate:.0f} pulses/s, storm at {rate:.0f} pulses/s "
+          f"({multiplier}x), {fills} x {FILL_SIZE}, relay-off latency {stop_latency * 1000:.0f} ms, "
+          f"{'legacy' if legacy else 'current'} callback")
+
+    failed = False
+    for fill in range(fills):
+        stats = {'late': 0, 'missed': 0, 'callbacks': []}
+        progress_updates.clear()
+        controller._simulate_flow = lambda: pulse_storm(controller, rate, stats)
+
+        done = QEventLoop()
+        controller.filling_complete.connect(done.quit)
+        QTimer.singleShot(30000, done.quit)
+        controller.start_filling(FILL_SIZE)
+        done.exec_()
+        controller.filling_complete.disconnect(done.quit)
+        while 'duration' not in stats:
+            app.processEvents()
+            time.sleep(0.001)
+
+        callbacks = sorted(stats['callbacks'])
+        p99 = callbacks[int(len(callbacks) * 0.99)] if callbacks else 0.0
+        ok = stats['missed'] == 0 and controller.pulse_count == len(callbacks)
+        failed |= not ok
+        overshoot = controller.fill_stats[-1]['overshoot'] if controller.fill_stats else 0
+        print(f"fill {fill + 1}: counted {controller.pulse_count}/{len(callbacks)} edges "
+              f"(target {controller.target_pulses}, overshoot {overshoot:+d}), "
+              f"missed {stats['missed']} (late wakeups {stats['late']}), "
+              f"callback p99 {p99 * 1e6:.0f} us / max {callbacks[-1] * 1e6 if callbacks else 0:.0f} us "
+              f"(edge period {1e6 / rate:.0f} us), "
+              f"{len(progress_updates)} progress signals in {stats['duration']:.2f}s "
+              f"-> {'OK' if ok else 'MISSED PULSES'}")
+
+    OFV2.IOExecutor.instance().cleanup()
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--multiplier', type=float, default=2.0, help='storm rate as a multiple of the sensor maximum')
+    parser.add_argument('--fills', type=int, default=5)
+    parser.add_argument('--legacy', action='store_true', help='benchmark the old per-pulse logging callback')
+    parser.add_argument('--stop-latency', type=float, default=0.1, help='simulated relay-off latency in seconds')
+    args = parser.parse_args()
+    sys.exit(run(args.multiplier, args.fills, args.legacy, args.stop_latency))
+
+
+if __name__ == '__main__':
+    main()